@@ -2,15 +2,51 @@ from flask import Flask, jsonify, send_file
 from flask_cors import CORS
 from routes.trips import trips_bp
 from routes.statistics import stats_bp
+from routes.flows import flows_bp
+from routes.ingest import ingest_bp
+from utils.snapshot import get_snapshot
+from utils.od_matrix import get_od_matrix
+from utils.bitmap_index import get_bitmap_index
+from utils.quantile_sketch import get_sketches
+from utils.ingest import get_trip_writer
+from utils.compression import init_compression
+from utils.static_assets import init_frontend
+from utils.singleflight import coalescing_stats
+from werkzeug.serving import WSGIRequestHandler
+import atexit
 import os
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
+init_compression(app)
 
 app.register_blueprint(trips_bp)
 app.register_blueprint(stats_bp)
+app.register_blueprint(flows_bp)
+app.register_blueprint(ingest_bp)
+
+# Map the columnar snapshot once at startup; forked workers inherit the
+# mapping and share its pages.
+snapshot = get_snapshot()
+od_matrix = get_od_matrix()
+bitmaps = get_bitmap_index()
+
+# Ingested trips are written behind by one thread; precomputed aggregates
+# that can absorb them are updated after each commit. (The bitmap indexes
+# count rows past their last indexed id with SQL instead.)
+trip_writer = get_trip_writer()
+for aggregate in (od_matrix, get_sketches()):
+    if aggregate is not None:
+        trip_writer.add_listener(aggregate.add_trips)
+atexit.register(trip_writer.close)
 
 GEOJSON_PATH = os.path.join(os.path.dirname(__file__), 'data', 'taxi_zones.geojson')
+FRONTEND_DIR = os.path.join(os.path.dirname(__file__), '..', 'frontend')
+
+# Single-port mode: SERVE_FRONTEND=1 serves the dashboard from this process
+# (precompressed, with ETag/Cache-Control), so the browser talks to one
+# origin over one keep-alive connection and needs no CORS preflight.
+frontend = init_frontend(app, FRONTEND_DIR) if os.environ.get('SERVE_FRONTEND') == '1' else None
 
 @app.route('/api/zones/geojson')
 def zones_geojson():
@@ -18,13 +54,30 @@ def zones_geojson():
 
 @app.route('/')
 def home():
+    if frontend is not None:
+        return frontend()
     return jsonify({"message": "Urban Mobility API", "status": "running"})
 
 @app.route('/api/health')
 def health():
     return jsonify({"status": "healthy"})
 
+@app.route('/api/health/coalescing')
+def coalescing():
+    """Per-endpoint requests, executions and requests that shared another's in-flight result."""
+    return jsonify(coalescing_stats())
+
 if __name__ == '__main__':
     print("\nStarting Urban Mobility API...")
     print(" Server: http://localhost:5002")
+    if frontend is not None:
+        print(" Dashboard: http://localhost:5002/ (SERVE_FRONTEND=1)")
+        # keep-alive needs HTTP/1.1; the dev server defaults to 1.0 and closes every connection
+        WSGIRequestHandler.protocol_version = "HTTP/1.1"
+    if snapshot is not None:
+        print(f" Snapshot: {snapshot.rows:,} trips mapped from data/snapshot")
+    if od_matrix is not None:
+        print(f" OD matrix: {od_matrix.hours:,} hours x {od_matrix.zones} x {od_matrix.zones} zones from data/od")
+    if bitmaps is not None:
+        print(f" Bitmap indexes: {bitmaps.rows:,} trips over {', '.join(bitmaps.dims)} from data/bitmaps")
     app.run(debug=True, use_reloader=False, host="0.0.0.0", port=5002)
@@ -0,0 +1,269 @@
+"""
+check_query_plans.py — Guard the SQL access paths of every API endpoint
+Run from: api/
+    python3 check_query_plans.py            # compare against query_plans.json
+    python3 check_query_plans.py --update   # record a new baseline
+
+Calls every GET route of the statistics, trips and flows blueprints with a
+set of representative filter combinations, captures each SQL statement the
+route runs, and records its EXPLAIN QUERY PLAN. Each statement's access path
+(SEARCH via an index, SCAN of an index, full table SCAN) is compared with the
+recorded baseline. A statement that now scans where it used to seek, or a
+route that does not answer 200, is a regression and makes the script exit
+with status 1; --update refuses to record a baseline with failing routes.
+
+The precomputed artifacts (snapshot, sketches, OD matrix, bitmaps) are
+switched off, so the SQL paths that shards and fresh databases rely on are
+the ones checked. The script also reports indexes no captured plan uses,
+and redundant indexes (a prefix of another index on the same table) in the
+live database, build_db.py's plain and compact schemas and the
+database/schema*.sql files.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from urllib.parse import urlencode
+
+os.environ.pop("TAXI_STORAGE", None)   # plans are checked on the single-file DB
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, "data"))
+
+from utils import db_connect, snapshot, quantile_sketch, od_matrix, bitmap_index
+
+BASELINE_PATH = os.path.join(HERE, "query_plans.json")
+MOBILITY_SCHEMAS = [os.path.join(HERE, "..", "database", name) for name in ("schema.sql", "schema_compact.sql")]
+BLUEPRINTS = ("statistics", "trips", "flows")
+ROUTE_ARGS = {"location_id": 161}
+
+# name -> query parameters, covering each _build_where filter alone and combined
+FILTERS = {
+    "none":      {},
+    "date":      {"date": "2019-01-15"},
+    "hour":      {"hour": "8"},
+    "date+hour": {"date": "2019-01-15", "hour": "8"},
+    "borough":   {"borough": "Manhattan"},
+    "fare":      {"min_fare": "10", "max_fare": "40"},
+    "distance":  {"min_distance": "1", "max_distance": "5"},
+    "all":       {"date": "2019-01-15", "hour": "8", "borough": "Manhattan",
+                  "min_fare": "10", "max_fare": "40", "min_distance": "1", "max_distance": "5"},
+}
+
+# access path ranks: higher is worse
+ACCESS_RANK = {"search": 0, "index-scan": 1, "scan": 2}
+
+
+def access_paths(plan):
+    """[(kind, detail)] for each table/index access in an EXPLAIN QUERY PLAN."""
+    out = []
+    for detail in plan:
+        if detail.startswith("SEARCH "):
+            out.append(("search", detail))
+        elif detail.startswith("SCAN "):
+            out.append(("index-scan" if " USING " in detail else "scan", detail))
+    return out
+
+
+def explain(conn, sql):
+    try:
+        return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+    except sqlite3.Error as e:
+        return [f"ERROR: {e}"]
+
+
+def capture(db_path):
+    """{"<route> [filters]": {"status", "statements": [{"sql", "plan"}]}} for every route/filter pair."""
+    for module, state in ((snapshot, "_snapshot"), (quantile_sketch, "_sketches"),
+                          (od_matrix, "_od"), (bitmap_index, "_bitmaps")):
+        getattr(module, state).update(loaded=True, value=None)
+    db_connect.DB_PATH = db_path
+    from app import app
+    app.logger.disabled = True   # routes that fail are recorded by status code instead
+
+    statements = []
+    db_connect.set_statement_trace(statements.append)
+    client = app.test_client()
+    plan_conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    results = {}
+    try:
+        for rule in sorted(app.url_map.iter_rules(), key=lambda r: r.rule):
+            if rule.endpoint.split(".")[0] not in BLUEPRINTS or "GET" not in rule.methods:
+                continue
+            path = rule.build({a: ROUTE_ARGS[a] for a in rule.arguments}, append_unknown=False)[1]
+            for name, params in FILTERS.items():
+                statements.clear()
+                status = client.get(f"{path}?{urlencode(params)}" if params else path).status_code
+                seen, captured = set(), []
+                for sql in statements:
+                    sql = " ".join(sql.split())
+                    if sql in seen or not sql.upper().startswith(("SELECT", "WITH")):
+                        continue
+                    seen.add(sql)
+                    captured.append({"sql": sql, "plan": explain(plan_conn, sql)})
+                results[f"{rule.rule} [{name}]"] = {"status": status, "statements": captured}
+    finally:
+        db_connect.set_statement_trace(None)
+        plan_conn.close()
+    return results
+
+
+def compare(baseline, current):
+    """(regressions, changes) between two capture() results."""
+    regressions, changes = [], []
+    for key, cur in current.items():
+        base = baseline.get(key)
+        if cur["status"] != 200:   # a failing route has no plan worth comparing
+            regressions.append(f"{key}: status {cur['status']}")
+        if base is None:
+            changes.append(f"{key}: new, not in baseline")
+            continue
+        if cur["status"] != base["status"] and cur["status"] == 200:
+            changes.append(f"{key}: status {base['status']} -> {cur['status']}")
+        if len(cur["statements"]) != len(base["statements"]):
+            changes.append(f"{key}: {len(base['statements'])} -> {len(cur['statements'])} statements")
+        for i, (b, c) in enumerate(zip(base["statements"], cur["statements"])):
+            b_paths, c_paths = access_paths(b["plan"]), access_paths(c["plan"])
+            b_worst = max((ACCESS_RANK[k] for k, _ in b_paths), default=0)
+            c_worst = max((ACCESS_RANK[k] for k, _ in c_paths), default=0)
+            b_scans = sum(k == "scan" for k, _ in b_paths)
+            c_scans = sum(k == "scan" for k, _ in c_paths)
+            if c_worst > b_worst or c_scans > b_scans:
+                regressions.append(f"{key} #{i + 1}:\n      was: {'; '.join(d for _, d in b_paths)}\n"
+                                   f"      now: {'; '.join(d for _, d in c_paths)}")
+            elif b["plan"] != c["plan"]:
+                changes.append(f"{key} #{i + 1}: plan changed: {'; '.join(c['plan'])}")
+    for key in baseline.keys() - current.keys():
+        changes.append(f"{key}: in baseline but no longer served")
+    return regressions, changes
+
+
+def index_columns(conn):
+    """{index name: (table, [columns], unique)} for every explicit index."""
+    out = {}
+    for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type='table'"):
+        for _, name, unique, origin, _ in conn.execute(f"PRAGMA index_list('{table}')"):
+            # expression columns have no name; keep them distinct so they never look redundant
+            cols = [r[2] or f"<expr {name}.{r[0]}>" for r in conn.execute(f"PRAGMA index_info('{name}')")]
+            out[name] = (table, cols, bool(unique), origin)
+    return out
+
+
+def redundant_indexes(conn):
+    """[(index, reason)] for indexes fully covered by another index on the same table."""
+    indexes = index_columns(conn)
+    found = []
+    names = list(indexes)
+    for i, name in enumerate(names):
+        table, cols, unique, origin = indexes[name]
+        if unique or origin != "c":
+            continue
+        for other in names:
+            o_table, o_cols, _, _ = indexes[other]
+            if other == name or o_table != table or o_cols[:len(cols)] != cols:
+                continue
+            if o_cols == cols and names.index(other) > i:
+                continue   # report only the later of two identical indexes
+            kind = "duplicates" if o_cols == cols else "is a prefix of"
+            found.append((name, f"{kind} {other} ({', '.join(o_cols)}) on {table}"))
+            break
+    return found
+
+
+def schema_connection(sql):
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(sql)
+    return conn
+
+
+def index_report(db_path, results):
+    used = set()
+    for entry in results.values():
+        for st in entry["statements"]:
+            for _, detail in access_paths(st["plan"]):
+                if " INDEX " in detail:
+                    used.add(detail.split(" INDEX ", 1)[1].split()[0])
+    lines = []
+    with sqlite3.connect(f"file:{db_path}?mode=ro", uri=True) as conn:
+        live = {n: v for n, v in index_columns(conn).items() if v[3] == "c"}
+        unused = sorted(set(live) - used)
+        lines.append(f"Indexes in {os.path.basename(db_path)}: {len(live)}, used by a captured plan: "
+                     f"{len(set(live) & used)}")
+        for name in unused:
+            lines.append(f"  unused:    {name} ON {live[name][0]}({', '.join(live[name][1])})")
+        for name, reason in redundant_indexes(conn):
+            lines.append(f"  redundant: {name} {reason}")
+
+    import build_db
+    sources = [("build_db.py SCHEMA_SQL", build_db.SCHEMA_SQL),
+               ("build_db.py COMPACT_SCHEMA_SQL", build_db.COMPACT_SCHEMA_SQL)]
+    for path in MOBILITY_SCHEMAS:
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                sources.append((f"database/{os.path.basename(path)}", f.read()))
+    for label, sql in sources:
+        conn = schema_connection(sql)
+        found = redundant_indexes(conn)
+        conn.close()
+        lines.append(f"{label}: " + ("no redundant indexes" if not found else
+                                      "; ".join(f"{n} {r}" for n, r in found)))
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check endpoint query plans against a recorded baseline.")
+    parser.add_argument("--db", default=db_connect.DB_PATH, help="database to plan against (default: %(default)s)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON (default: %(default)s)")
+    parser.add_argument("--update", action="store_true", help="record the current plans as the new baseline")
+    parser.add_argument("--verbose", action="store_true", help="print every statement and its plan")
+    args = parser.parse_args()
+
+    db_path = os.path.abspath(args.db)
+    results = capture(db_path)
+    n_statements = sum(len(r["statements"]) for r in results.values())
+    print(f"Captured {n_statements} statements from {len(results)} route/filter combinations")
+    if args.verbose:
+        for key, entry in results.items():
+            print(f"\n{key} -> {entry['status']}")
+            for st in entry["statements"]:
+                print(f"  {st['sql'][:160]}")
+                for detail in st["plan"]:
+                    print(f"    {detail}")
+
+    print()
+    for line in index_report(db_path, results):
+        print(line)
+    print()
+
+    failing = sorted(key for key, entry in results.items() if entry["status"] != 200)
+    if args.update:
+        if failing:
+            print("Not recording a baseline with failing routes:\n  " + "\n  ".join(failing))
+            return 1
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"sqlite_version": sqlite3.sqlite_version, "routes": results}, f, indent=1, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update to record one.")
+        return 1
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("sqlite_version") != sqlite3.sqlite_version:
+        print(f"Note: baseline recorded with SQLite {baseline.get('sqlite_version')}, "
+              f"running {sqlite3.sqlite_version}; planner choices may differ.")
+    regressions, changes = compare(baseline["routes"], results)
+    for line in changes:
+        print(f"  changed: {line}")
+    for line in regressions:
+        print(f"  REGRESSION: {line}")
+    print(f"\n{len(regressions)} regressions, {len(changes)} other plan changes")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,64 +2,80 @@
 build_db.py — Build taxi_mock.db from yellow_tripdata_2019-01.csv
 Run from: api/data/
     python3 build_db.py
+    python3 build_db.py --partition day     # one shard DB per pickup day
+    python3 build_db.py --partition week    # one shard DB per ISO week
+    python3 build_db.py --cluster           # store trips in pickup hour/zone order
+    python3 build_db.py --compact           # integer-encoded trips behind a view
 
 Loads all clean rows from the full Jan 2019 TLC dataset (~7.6 M rows).
-Writes to: api/data/taxi_mock.db
+Writes to: api/data/taxi_mock.db (or api/data/shards/ when partitioned)
 Also loads taxi_zone_lookup.csv into the zones table.
+
+Partitioned builds write one self-contained SQLite file per time bucket
+(same trips/zones schema as taxi_mock.db) plus shards/manifest.json, which
+the API's shard router uses to prune shards by the `date` filter.
+
+--cluster rewrites the loaded trips table (single file or every shard) in
+(pickup date, hour, PULocationID) order, so the rows of one day, hour or
+zone-hour sit on adjacent pages and date-range queries read them
+sequentially instead of seeking all over the file.
+
+--compact stores trips in trips_compact with integer encodings (epoch
+seconds, cents, hundredths, 0/1 flags) and exposes them through a `trips`
+view with the original column names and values, so the API, the artifact
+writers and INSERT_SQL (via an INSTEAD OF trigger) work unchanged. The view
+also exposes pickup_ts/dropoff_ts, which the API's time expressions use on
+compact builds instead of re-parsing the decoded timestamps.
+
+Single-file builds also write derived artifacts next to the DB (see
+--artifacts): the memory-mapped columnar snapshot in api/data/snapshot/ and
+the per-hour/zone quantile sketches in api/data/sketches/ and the
+hour x pickup zone x dropoff zone OD matrix in api/data/od/ and the
+date/hour/zone/fare/distance bitmap indexes in api/data/bitmaps/. Each
+manifest records the row count, last id and mtime of the DB it was built
+from, and the API ignores artifacts that don't match taxi_mock.db; a build
+deletes the artifact directories it doesn't rewrite.
 """
 
+import argparse
 import csv
+import json
 import sqlite3
 import os
+import shutil
+import sys
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 
 HERE      = os.path.dirname(os.path.abspath(__file__))
 TRIPS_CSV = os.path.join(HERE, "yellow_tripdata_2019-01.csv")
 ZONES_CSV = os.path.join(HERE, "taxi_zone_lookup.csv")
 DB_PATH   = os.path.join(HERE, "taxi_mock.db")
+SHARD_DIR = os.path.join(HERE, "shards")
 
 BATCH = 50_000   # rows per INSERT batch
 
-# ── helpers ──────────────────────────────────────────────────────────────
-def duration_minutes(pickup, dropoff):
-    try:
-        fmt = "%Y-%m-%d %H:%M:%S"
-        diff = datetime.strptime(dropoff, fmt) - datetime.strptime(pickup, fmt)
-        return diff.total_seconds() / 60.0
-    except Exception:
-        return None
-
-def speed_mph(dist, pickup, dropoff):
-    dur = duration_minutes(pickup, dropoff)
-    if dur and dur > 0 and float(dist) > 0:
-        return float(dist) / (dur / 60.0)
-    return None
-
-def safe_float(v):
-    try:
-        f = float(v)
-        return f if f == f else None   # NaN check
-    except (ValueError, TypeError):
-        return None
-
-def safe_int(v):
-    try:
-        return int(float(v))
-    except (ValueError, TypeError):
-        return None
+# artifact writers live next to their readers in api/utils
+sys.path.insert(0, os.path.dirname(HERE))
+from utils.trip_rules import INSERT_SQL, clean_trip, safe_int
+from utils.snapshot import SNAPSHOT_DIR, write_snapshot
+from utils.quantile_sketch import SKETCH_DIR, write_sketches
+from utils.od_matrix import OD_DIR, write_od_matrix
+from utils.bitmap_index import BITMAP_DIR, write_bitmap_index
 
-# ── connect & create schema ───────────────────────────────────────────────
-print(f"Building DB at: {DB_PATH}")
-if os.path.exists(DB_PATH):
-    os.remove(DB_PATH)
-    print("Removed old taxi_mock.db")
+ARTIFACT_DIRS = {"snapshot": SNAPSHOT_DIR, "sketches": SKETCH_DIR, "od": OD_DIR, "bitmaps": BITMAP_DIR}
+ARTIFACTS = tuple(ARTIFACT_DIRS)
 
-conn = sqlite3.connect(DB_PATH)
-conn.execute("PRAGMA journal_mode = WAL")
-conn.execute("PRAGMA synchronous  = NORMAL")
+ZONES_SQL = """
+    CREATE TABLE zones (
+        LocationID   INTEGER PRIMARY KEY,
+        Borough      TEXT,
+        Zone         TEXT,
+        service_zone TEXT
+    );
+"""
 
-conn.executescript("""
+SCHEMA_SQL = """
     CREATE TABLE trips (
         id                    INTEGER PRIMARY KEY AUTOINCREMENT,
         VendorID              INTEGER,
@@ -84,108 +100,298 @@ conn.executescript("""
         speed_mph             REAL
     );
 
-    CREATE TABLE zones (
-        LocationID   INTEGER PRIMARY KEY,
-        Borough      TEXT,
-        Zone         TEXT,
-        service_zone TEXT
-    );
-
     CREATE INDEX idx_trips_pickup  ON trips(tpep_pickup_datetime);
     CREATE INDEX idx_trips_puzone  ON trips(PULocationID);
-    CREATE INDEX idx_trips_borough ON trips(PULocationID);
-""")
-
-# ── load zones ────────────────────────────────────────────────────────────
-print("Loading zones…", end=" ", flush=True)
-with open(ZONES_CSV, newline="", encoding="utf-8") as f:
-    reader = csv.DictReader(f)
-    zones = [(safe_int(r["LocationID"]), r["Borough"], r["Zone"], r.get("service_zone",""))
-             for r in reader]
-conn.executemany("INSERT OR IGNORE INTO zones VALUES (?,?,?,?)", zones)
-conn.commit()
-print(f"{len(zones)} zones loaded")
-
-# ── load trips ────────────────────────────────────────────────────────────
-print("Loading trips (this may take ~30–60 seconds)…")
-t0       = time.time()
-total    = 0
-skipped  = 0
-batch    = []
-
-INSERT_SQL = """
-    INSERT INTO trips (
-        VendorID, tpep_pickup_datetime, tpep_dropoff_datetime, passenger_count,
-        trip_distance, RatecodeID, store_and_fwd_flag, PULocationID, DOLocationID,
-        payment_type, fare_amount, extra, mta_tax, tip_amount, tolls_amount,
-        improvement_surcharge, total_amount, congestion_surcharge,
-        trip_duration_minutes, speed_mph
-    ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-"""
+""" + ZONES_SQL
+
+# --compact: trips column -> (trips_compact column, encoding). Encodings:
+#   "ts"    epoch seconds (4 bytes instead of 19 bytes of text)
+#   "centi" integer hundredths: cents for money, 1/100 mile/minute/mph
+#   "flag"  store_and_fwd_flag 'Y'/'N' as 1/0
+#   None    stored as is (ids and small codes are already 1-2 byte integers)
+COMPACT_COLUMNS = {
+    "VendorID":              ("VendorID", None),
+    "tpep_pickup_datetime":  ("pickup_ts", "ts"),
+    "tpep_dropoff_datetime": ("dropoff_ts", "ts"),
+    "passenger_count":       ("passenger_count", None),
+    "trip_distance":         ("distance_centi", "centi"),
+    "RatecodeID":            ("RatecodeID", None),
+    "store_and_fwd_flag":    ("store_and_fwd", "flag"),
+    "PULocationID":          ("PULocationID", None),
+    "DOLocationID":          ("DOLocationID", None),
+    "payment_type":          ("payment_type", None),
+    "fare_amount":           ("fare_cents", "centi"),
+    "extra":                 ("extra_cents", "centi"),
+    "mta_tax":               ("mta_tax_cents", "centi"),
+    "tip_amount":            ("tip_cents", "centi"),
+    "tolls_amount":          ("tolls_cents", "centi"),
+    "improvement_surcharge": ("improvement_cents", "centi"),
+    "total_amount":          ("total_cents", "centi"),
+    "congestion_surcharge":  ("congestion_cents", "centi"),
+    "trip_duration_minutes": ("duration_centi", "centi"),
+    "speed_mph":             ("speed_centi", "centi"),
+}
+DECODE = {"ts": "datetime({}, 'unixepoch')", "centi": "{} / 100.0",
+          "flag": "CASE {} WHEN 1 THEN 'Y' WHEN 0 THEN 'N' END", None: "{}"}
+ENCODE = {"ts": "CAST(strftime('%s', {}) AS INTEGER)", "centi": "CAST(round({} * 100) AS INTEGER)",
+          "flag": "CASE {} WHEN 'Y' THEN 1 WHEN 'N' THEN 0 END", None: "{}"}
 
-with open(TRIPS_CSV, newline="", encoding="utf-8") as f:
-    reader = csv.DictReader(f)
-    for row in reader:
-        pu   = row.get("tpep_pickup_datetime", "")
-        do   = row.get("tpep_dropoff_datetime", "")
-        dist = safe_float(row.get("trip_distance", 0))
-        fare = safe_float(row.get("fare_amount", 0))
-        tot  = safe_float(row.get("total_amount", 0))
-        pu_loc = safe_int(row.get("PULocationID"))
-        do_loc = safe_int(row.get("DOLocationID"))
-
-        # Quality filter: valid location, distance, fare, realistic duration
-        if not pu or not do or not dist or dist <= 0 or dist > 200:
-            skipped += 1; continue
-        if fare is None or fare <= 0 or tot is None or tot <= 0:
-            skipped += 1; continue
-        if not pu_loc or not do_loc:
-            skipped += 1; continue
-
-        dur = duration_minutes(pu, do)
-        if dur is None or dur <= 0 or dur > 300:
-            skipped += 1; continue
-
-        spd = speed_mph(dist, pu, do)
-        if spd is not None and spd > 150:   # physically impossible
-            skipped += 1; continue
-
-        batch.append((
-            safe_int(row.get("VendorID")),
-            pu, do,
-            safe_int(row.get("passenger_count")),
-            dist,
-            safe_int(row.get("RatecodeID")),
-            row.get("store_and_fwd_flag"),
-            pu_loc, do_loc,
-            safe_int(row.get("payment_type")),
-            fare,
-            safe_float(row.get("extra")),
-            safe_float(row.get("mta_tax")),
-            safe_float(row.get("tip_amount")),
-            safe_float(row.get("tolls_amount")),
-            safe_float(row.get("improvement_surcharge")),
-            tot,
-            safe_float(row.get("congestion_surcharge")),
-            round(dur, 2),
-            round(spd, 2) if spd is not None else None,
-        ))
+COMPACT_SCHEMA_SQL = f"""
+    CREATE TABLE trips_compact (
+        id                INTEGER PRIMARY KEY AUTOINCREMENT,
+        VendorID          INTEGER,
+        pickup_ts         INTEGER NOT NULL,
+        dropoff_ts        INTEGER NOT NULL,
+        passenger_count   INTEGER,
+        distance_centi    INTEGER NOT NULL,
+        RatecodeID        INTEGER,
+        store_and_fwd     INTEGER,
+        PULocationID      INTEGER NOT NULL,
+        DOLocationID      INTEGER NOT NULL,
+        payment_type      INTEGER,
+        fare_cents        INTEGER NOT NULL,
+        extra_cents       INTEGER,
+        mta_tax_cents     INTEGER,
+        tip_cents         INTEGER,
+        tolls_cents       INTEGER,
+        improvement_cents INTEGER,
+        total_cents       INTEGER NOT NULL,
+        congestion_cents  INTEGER,
+        duration_centi    INTEGER,
+        speed_centi       INTEGER
+    );
 
+    CREATE VIEW trips AS SELECT id, {", ".join(f"{DECODE[enc].format(col)} AS {name}" if (col, enc) != (name, None) else name
+                                               for name, (col, enc) in COMPACT_COLUMNS.items())},
+           pickup_ts, dropoff_ts
+    FROM trips_compact;
+
+    CREATE TRIGGER trips_insert INSTEAD OF INSERT ON trips BEGIN
+        INSERT INTO trips_compact ({", ".join(col for col, _ in COMPACT_COLUMNS.values())})
+        VALUES ({", ".join(ENCODE[enc].format(f"NEW.{name}") for name, (_, enc) in COMPACT_COLUMNS.items())});
+    END;
+
+    -- the API filters compact builds on the view's raw pickup_ts, so date ranges search this
+    CREATE INDEX idx_trips_pickup  ON trips_compact(pickup_ts);
+    CREATE INDEX idx_trips_puzone  ON trips_compact(PULocationID);
+""" + ZONES_SQL
+
+# ── helpers ──────────────────────────────────────────────────────────────
+def shard_bounds(pickup, granularity):
+    """Return (name, first_day, last_day) of the shard a pickup timestamp belongs to."""
+    day = datetime.strptime(pickup[:10], "%Y-%m-%d")
+    if granularity == "day":
+        d = day.strftime("%Y-%m-%d")
+        return d, d, d
+    year, week, weekday = day.isocalendar()
+    monday = day - timedelta(days=weekday - 1)
+    return (f"{year}-W{week:02d}", monday.strftime("%Y-%m-%d"),
+            (monday + timedelta(days=6)).strftime("%Y-%m-%d"))
+
+# ── connect & create schema ───────────────────────────────────────────────
+def create_db(path, zones, compact=False):
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous  = NORMAL")
+    conn.executescript(COMPACT_SCHEMA_SQL if compact else SCHEMA_SQL)
+    conn.executemany("INSERT OR IGNORE INTO zones VALUES (?,?,?,?)", zones)
+    conn.commit()
+    return conn
+
+def read_zones():
+    with open(ZONES_CSV, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        return [(safe_int(r["LocationID"]), r["Borough"], r["Zone"], r.get("service_zone",""))
+                for r in reader]
+
+def cluster_trips(conn):
+    """Rewrite trips in (pickup date, hour, PULocationID) order through a staging table.
+
+    Ids are reassigned 1..n in the new order; indexes are rebuilt after the
+    copy, then ANALYZE refreshes planner statistics and VACUUM compacts the
+    file so the table's pages are laid out in key order. Works on either
+    storage: the plain trips table or trips_compact behind the trips view.
+    """
+    compact = conn.execute("SELECT type FROM sqlite_master WHERE name='trips'").fetchone()[0] == "view"
+    table = "trips_compact" if compact else "trips"
+    key = ("pickup_ts / 3600, PULocationID, pickup_ts" if compact else
+           "substr(tpep_pickup_datetime, 1, 13), PULocationID, tpep_pickup_datetime")
+    cols = ", ".join(r[1] for r in conn.execute(f"PRAGMA table_info({table})") if r[1] != "id")
+    indexes = conn.execute("SELECT name, sql FROM sqlite_master WHERE type='index' "
+                           "AND tbl_name=? AND sql IS NOT NULL", (table,)).fetchall()
+    with conn:
+        for name, _ in indexes:
+            conn.execute(f"DROP INDEX {name}")
+        conn.execute(f"CREATE TABLE trips_staging AS SELECT * FROM {table}")
+        conn.execute(f"DELETE FROM {table}")
+        conn.execute("DELETE FROM sqlite_sequence WHERE name=?", (table,))
+        conn.execute(f"INSERT INTO {table} ({cols}) SELECT {cols} FROM trips_staging ORDER BY {key}, id")
+        conn.execute("DROP TABLE trips_staging")
+        for _, sql in indexes:
+            conn.execute(sql)
+    conn.execute("ANALYZE")
+    conn.execute("VACUUM")
+
+# ── parse & filter trips ──────────────────────────────────────────────────
+def iter_clean_trips(path, counts):
+    """Yield INSERT_SQL tuples for every row passing the quality filter; counts['skipped'] is updated."""
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            trip, _ = clean_trip(row)
+            if trip is None:
+                counts["skipped"] += 1; continue
+            yield trip
+
+# ── builds ────────────────────────────────────────────────────────────────
+def build_single(csv_path, zones, counts, t0, cluster=False, compact=False):
+    print(f"Building {'compact ' if compact else ''}DB at: {DB_PATH}")
+    conn = create_db(DB_PATH, zones, compact)
+    batch = []
+    for trip in iter_clean_trips(csv_path, counts):
+        batch.append(trip)
         if len(batch) >= BATCH:
             conn.executemany(INSERT_SQL, batch)
             conn.commit()
-            total += len(batch)
+            counts["total"] += len(batch)
             batch = []
-            elapsed = time.time() - t0
-            print(f"  {total:,} rows inserted ({elapsed:.0f}s)…", flush=True)
+            print(f"  {counts['total']:,} rows inserted ({time.time() - t0:.0f}s)…", flush=True)
 
-# flush remainder
-if batch:
-    conn.executemany(INSERT_SQL, batch)
-    conn.commit()
-    total += len(batch)
+    # flush remainder
+    if batch:
+        conn.executemany(INSERT_SQL, batch)
+        conn.commit()
+        counts["total"] += len(batch)
+    if cluster:
+        print(f"Clustering trips by pickup date, hour and zone ({time.time() - t0:.0f}s)…", flush=True)
+        cluster_trips(conn)
+    conn.close()
+    print(f"DB size: {os.path.getsize(DB_PATH) / 1e6:.1f} MB")
+
+def build_partitioned(csv_path, zones, counts, t0, granularity, cluster=False, compact=False):
+    print(f"Building {granularity} shards in: {SHARD_DIR}")
+    if os.path.isdir(SHARD_DIR):
+        shutil.rmtree(SHARD_DIR)
+    os.makedirs(SHARD_DIR)
+
+    shards = {}   # name -> {"conn", "batch", "start", "end", "rows"}
+    def flush(shard):
+        shard["conn"].executemany(INSERT_SQL, shard["batch"])
+        shard["conn"].commit()
+        shard["rows"] += len(shard["batch"])
+        counts["total"] += len(shard["batch"])
+        shard["batch"] = []
+
+    for trip in iter_clean_trips(csv_path, counts):
+        name, start, end = shard_bounds(trip[1], granularity)
+        shard = shards.get(name)
+        if shard is None:
+            conn = create_db(os.path.join(SHARD_DIR, f"trips_{name}.db"), zones, compact)
+            shard = shards[name] = {"conn": conn, "batch": [], "start": start, "end": end, "rows": 0}
+        shard["batch"].append(trip)
+        if len(shard["batch"]) >= BATCH:
+            flush(shard)
+            print(f"  {counts['total']:,} rows inserted into {len(shards)} shards "
+                  f"({time.time() - t0:.0f}s)…", flush=True)
+
+    manifest = {"granularity": granularity, "shards": []}
+    for name in sorted(shards):
+        shard = shards[name]
+        if shard["batch"]:
+            flush(shard)
+        if cluster:
+            cluster_trips(shard["conn"])
+        shard["conn"].close()
+        manifest["shards"].append({"file": f"trips_{name}.db", "start": shard["start"],
+                                   "end": shard["end"], "rows": shard["rows"]})
+    with open(os.path.join(SHARD_DIR, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    size = sum(os.path.getsize(os.path.join(SHARD_DIR, s["file"])) for s in manifest["shards"])
+    print(f"{len(shards)} shards, total size: {size / 1e6:.1f} MB")
+
+def remove_artifacts(names):
+    """Delete artifacts a new build won't rewrite, so nothing is left built from the old data."""
+    for name in names:
+        if os.path.isdir(ARTIFACT_DIRS[name]):
+            shutil.rmtree(ARTIFACT_DIRS[name])
+            print(f"Removed stale {name} artifact: {ARTIFACT_DIRS[name]}")
+
+def build_artifacts(names):
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        if "snapshot" in names:
+            t0 = time.time()
+            manifest = write_snapshot(conn, SNAPSHOT_DIR)
+            print(f"Wrote columnar snapshot ({manifest['rows']:,} rows, "
+                  f"{len(manifest['columns'])} columns) to {SNAPSHOT_DIR} in {time.time() - t0:.1f}s")
+        if "sketches" in names:
+            t0 = time.time()
+            manifest = write_sketches(conn, SKETCH_DIR)
+            print(f"Wrote quantile sketches ({manifest['cells']:,} hour/zone cells, "
+                  f"{len(manifest['metrics'])} metrics) to {SKETCH_DIR} in {time.time() - t0:.1f}s")
+        if "od" in names:
+            t0 = time.time()
+            manifest = write_od_matrix(conn, OD_DIR)
+            print(f"Wrote OD matrix ({manifest['hours']:,} hours x {manifest['zones']} x {manifest['zones']} zones, "
+                  f"{manifest['entries']:,} non-empty cells) to {OD_DIR} in {time.time() - t0:.1f}s")
+        if "bitmaps" in names:
+            t0 = time.time()
+            manifest = write_bitmap_index(conn, BITMAP_DIR)
+            dims = manifest["dimensions"]
+            print(f"Wrote bitmap indexes ({sum(d['bitmaps'] for d in dims.values()):,} bitmaps over "
+                  f"{', '.join(dims)}) to {BITMAP_DIR} in {time.time() - t0:.1f}s")
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the trips database used by the API.")
+    parser.add_argument("--csv", default=TRIPS_CSV, help="raw TLC trips CSV (default: %(default)s)")
+    parser.add_argument("--partition", choices=("day", "week"),
+                        help="write per-day or per-week shard databases instead of taxi_mock.db")
+    parser.add_argument("--cluster", action="store_true",
+                        help="store trips sorted by pickup date, hour and PULocationID, then ANALYZE and VACUUM")
+    parser.add_argument("--compact", action="store_true",
+                        help="store trips integer-encoded (epoch seconds, cents) behind a `trips` view")
+    parser.add_argument("--artifacts", default=",".join(ARTIFACTS),
+                        help="comma-separated derived artifacts to write after a single-file build "
+                             "(default: %(default)s; pass '' to skip)")
+    parser.add_argument("--artifacts-only", action="store_true",
+                        help="rebuild the derived artifacts from the existing taxi_mock.db and exit")
+    args = parser.parse_args()
+    artifacts = [a for a in args.artifacts.split(",") if a]
+    unknown = set(artifacts) - set(ARTIFACTS)
+    if unknown:
+        parser.error(f"unknown artifacts: {', '.join(sorted(unknown))}")
+    if args.artifacts_only:
+        build_artifacts(artifacts)
+        return
+
+    print("Loading zones…", end=" ", flush=True)
+    zones = read_zones()
+    print(f"{len(zones)} zones loaded")
+
+    print("Loading trips (this may take ~30–60 seconds)…")
+    t0 = time.time()
+    counts = {"total": 0, "skipped": 0}
+    if args.partition:
+        build_partitioned(args.csv, zones, counts, t0, args.partition, args.cluster, args.compact)
+    else:
+        build_single(args.csv, zones, counts, t0, args.cluster, args.compact)
+
+    elapsed = time.time() - t0
+    print(f"\nDone! {counts['total']:,} trips loaded, {counts['skipped']:,} skipped in {elapsed:.1f}s")
+
+    if args.partition:
+        if artifacts:
+            print("Skipping derived artifacts: they are built from a single-file taxi_mock.db.")
+        remove_artifacts(ARTIFACTS)
+    else:
+        remove_artifacts([a for a in ARTIFACTS if a not in artifacts])
+        if artifacts:
+            build_artifacts(artifacts)
 
-conn.close()
-elapsed = time.time() - t0
-print(f"\nDone! {total:,} trips loaded, {skipped:,} skipped in {elapsed:.1f}s")
-print(f"DB size: {os.path.getsize(DB_PATH) / 1e6:.1f} MB")
+if __name__ == "__main__":
+    main()
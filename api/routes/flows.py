@@ -0,0 +1,105 @@
+from flask import Blueprint, jsonify, request
+import numpy as np
+from utils.shards import query_partials
+from utils.od_matrix import MEASURES, get_od_matrix
+from utils.singleflight import coalesce
+from routes.statistics import _build_where, _has_value_filters, _r, _time_filter
+
+flows_bp = Blueprint('flows', __name__)
+
+NO_BOROUGH = (None, '', 'Unknown', 'N/A')
+
+def zone_lookup():
+    """{LocationID: (borough, zone name)} from the zones table."""
+    rows = query_partials("SELECT LocationID AS location_id, Borough AS borough, Zone AS zone FROM zones",
+                          keys=('location_id', 'borough', 'zone'))
+    return {r['location_id']: (r['borough'], r['zone']) for r in rows}
+
+def od_totals():
+    """Dense PU x DO sums of count/fare/distance/duration for the request's filters.
+
+    date, hour, borough (pickup) and dropoff_borough are answered from the
+    precomputed OD tensor; fare/distance filters, or a missing tensor, fall
+    back to one GROUP BY PULocationID, DOLocationID query.
+    """
+    zones = zone_lookup()
+    boroughs = request.args.getlist('borough')
+    do_boroughs = request.args.getlist('dropoff_borough')
+    pick = lambda names: {z for z, (b, _) in zones.items() if b in names} if names else None
+    od = get_od_matrix()
+    if od is not None and not _has_value_filters():
+        try:
+            day, hour = _time_filter()
+        except ValueError:   # matches nothing, as in SQL
+            totals = {m: np.zeros((od.zones, od.zones)) for m in MEASURES}
+        else:
+            totals = od.totals(np.datetime64(day, 'D') if day else None, hour, pick(boroughs), pick(do_boroughs))
+        return totals, zones
+
+    where, params = _build_where("trip_distance>=0")
+    if do_boroughs:
+        where += f" AND DOLocationID IN (SELECT LocationID FROM zones WHERE Borough IN ({','.join('?' * len(do_boroughs))}))"
+        params.extend(do_boroughs)
+    rows = query_partials(f"""
+        SELECT PULocationID AS pu_id, DOLocationID AS do_id,
+               {', '.join(f'SUM({expr}) AS {name}' for name, expr in MEASURES.items())}
+        FROM trips WHERE {where} GROUP BY pu_id, do_id
+    """, params, keys=('pu_id', 'do_id'), date=request.args.get('date'))
+    n = max([*zones, *(r['pu_id'] for r in rows), *(r['do_id'] for r in rows)], default=0) + 1
+    totals = {m: np.zeros((n, n)) for m in MEASURES}
+    for r in rows:
+        for m in MEASURES:
+            totals[m][r['pu_id'], r['do_id']] = r[m] or 0
+    return totals, zones
+
+def _avgs(totals, idx):
+    n = totals['count'][idx]
+    return {f"avg_{m}": _r(totals[m][idx] / n) if n else None for m in ('distance', 'fare', 'duration')}
+
+@flows_bp.route('/api/flows/boroughs')
+@coalesce
+def get_borough_flows():
+    totals, zones = od_totals()
+    names = sorted({b for b, _ in zones.values() if b not in NO_BOROUGH})
+    onehot = np.zeros((len(totals['count']), len(names)))
+    for z, (b, _) in zones.items():
+        if b in names: onehot[z, names.index(b)] = 1
+    flows = {m: onehot.T @ totals[m] @ onehot for m in MEASURES}
+    result = [{"pickup_borough": names[i], "dropoff_borough": names[j],
+               "trip_count": int(flows['count'][i, j]), **_avgs(flows, (i, j))}
+              for i in range(len(names)) for j in range(len(names)) if flows['count'][i, j]]
+    result.sort(key=lambda r: r['trip_count'], reverse=True)
+    return jsonify(result)
+
+@flows_bp.route('/api/flows/zones')
+@coalesce
+def get_zone_flows():
+    totals, zones = od_totals()
+    count = totals['count']
+    out, inn, intra = count.sum(axis=1), count.sum(axis=0), np.diagonal(count)
+    return jsonify([{"location_id": z, "borough": zones[z][0], "zone": zones[z][1],
+                     "outbound": int(out[z]), "inbound": int(inn[z]), "intra_zone": int(intra[z]),
+                     "net_inbound": int(inn[z] - out[z])}
+                    for z in sorted(zones) if z < len(count) and (out[z] or inn[z])])
+
+@flows_bp.route('/api/flows/zones/<int:location_id>')
+@coalesce
+def get_zone_flow_detail(location_id):
+    limit = request.args.get('limit', 10, type=int)
+    totals, zones = od_totals()
+    if location_id not in zones or location_id >= len(totals['count']):
+        return jsonify({"error": f"unknown zone {location_id}"}), 404
+    count = totals['count']
+
+    def top(axis_counts, key):
+        order = np.argsort(-axis_counts, kind='stable')[:limit]
+        return [{"location_id": int(z), "borough": zones.get(int(z), (None, None))[0],
+                 "zone": zones.get(int(z), (None, None))[1], "trip_count": int(axis_counts[z]),
+                 **_avgs(totals, key(z))}
+                for z in order if axis_counts[z]]
+
+    borough, zone = zones[location_id]
+    return jsonify({"location_id": location_id, "borough": borough, "zone": zone,
+                    "outbound": int(count[location_id].sum()), "inbound": int(count[:, location_id].sum()),
+                    "top_destinations": top(count[location_id], lambda z: (location_id, z)),
+                    "top_origins": top(count[:, location_id], lambda z: (z, location_id))})
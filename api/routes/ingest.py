@@ -0,0 +1,41 @@
+from flask import Blueprint, jsonify, request
+from utils.ingest import get_trip_writer
+from utils.shards import query_partials, sharding_enabled
+from utils.trip_rules import clean_trip
+
+ingest_bp = Blueprint('ingest', __name__)
+
+MAX_BATCH = 10_000   # trips per request
+
+@ingest_bp.route('/api/ingest/trips', methods=['POST'])
+def ingest_trips():
+    """Validate a batch of raw TLC trips with the build_db.py rules and queue the valid ones."""
+    if sharding_enabled():
+        return jsonify({"error": "ingest writes to taxi_mock.db; unset TAXI_STORAGE=sharded"}), 409
+    payload = request.get_json(silent=True)
+    trips = payload.get('trips') if isinstance(payload, dict) else payload
+    if not isinstance(trips, list):
+        return jsonify({"error": "expected a JSON list of trips or {\"trips\": [...]}"}), 400
+    if len(trips) > MAX_BATCH:
+        return jsonify({"error": f"at most {MAX_BATCH:,} trips per request"}), 413
+
+    zone_ids = {r['location_id'] for r in query_partials("SELECT LocationID AS location_id FROM zones",
+                                                          keys=('location_id',))}
+    accepted, rejected = [], []
+    for i, row in enumerate(trips):
+        trip, reason = clean_trip(row, zone_ids) if isinstance(row, dict) else (None, "not an object")
+        if trip is None:
+            rejected.append({"index": i, "reason": reason})
+        else:
+            accepted.append(trip)
+
+    writer = get_trip_writer()
+    if accepted and not writer.submit(accepted):
+        return jsonify({"error": "ingest queue is full, retry later"}), 503, {"Retry-After": "1"}
+    return jsonify({"accepted": len(accepted), "rejected": rejected, "queued": writer.pending}), 202
+
+@ingest_bp.route('/api/ingest/status')
+def ingest_status():
+    writer = get_trip_writer()
+    return jsonify({**writer.stats, "queued": writer.pending,
+                    "max_pending": writer.max_pending, "flush_interval": writer.interval})
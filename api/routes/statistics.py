@@ -1,38 +1,111 @@
 from flask import Blueprint, jsonify, request
-from utils.db_connect import get_db_connection, dict_from_row
+from utils.shards import compact_storage, query_partials, sharding_enabled
+from utils.encoding import tabular_response
+from utils.quantile_sketch import METRICS, N_BUCKETS, ZONE_SLOTS, bucket_index, get_sketches, quantiles
+from utils.bitmap_index import DIMENSIONS, get_bitmap_index
+from utils.snapshot import get_snapshot
+from utils.singleflight import coalesce
+from utils.trip_rules import TIMESTAMP_FORMAT
+from datetime import datetime, timedelta
+import calendar
+import numpy as np
 
 stats_bp = Blueprint('statistics', __name__)
 
 def _r(v, n=2):
     return round(v, n) if isinstance(v, float) else v
 
+# Every query below selects mergeable partials (COUNT/SUM) so the same SQL
+# runs against taxi_mock.db or fans out across time-partitioned shards.
+def _parts(expr, name):
+    return f"SUM({expr}) AS {name}_sum, COUNT({expr}) AS {name}_n"
+
+def _avg(row, name):
+    n = row.get(f"{name}_n")
+    return row[f"{name}_sum"] / n if n else None
+
 DUR = "(julianday(tpep_dropoff_datetime)-julianday(tpep_pickup_datetime))*1440"
 SPD = ("CASE WHEN (julianday(tpep_dropoff_datetime)-julianday(tpep_pickup_datetime))*24>0 "
        "THEN trip_distance/((julianday(tpep_dropoff_datetime)-julianday(tpep_pickup_datetime))*24) "
        "ELSE 0 END")
-PEAK = ("CASE WHEN CAST(strftime('%H',tpep_pickup_datetime) AS INTEGER) BETWEEN 7 AND 9 "
-        "  OR CAST(strftime('%H',tpep_pickup_datetime) AS INTEGER) BETWEEN 16 AND 18 "
-        "THEN 1 ELSE 0 END")
+
+def _peak(hour):
+    return f"CASE WHEN {hour} BETWEEN 7 AND 9 OR {hour} BETWEEN 16 AND 18 THEN 1 ELSE 0 END"
+
+PEAK = _peak("CAST(strftime('%H',tpep_pickup_datetime) AS INTEGER)")
+
+# Time expressions per storage layout. A --compact build's trips view also
+# exposes the stored epoch seconds, so these do integer arithmetic on
+# pickup_ts/dropoff_ts instead of decoding them to text and parsing it back,
+# and date ranges search the index on trips_compact(pickup_ts). `*_group`
+# is what to GROUP BY, so the label is formatted once per group; `t_peak`
+# is `peak` for queries that alias trips as t.
+_HOUR_TS = "(pickup_ts/3600%24)"
+TIME_SQL = {
+    False: {"dur": DUR, "spd": SPD, "peak": PEAK,
+            "t_peak": _peak("CAST(strftime('%H',t.tpep_pickup_datetime) AS INTEGER)"),
+            "pickup": "tpep_pickup_datetime", "param": lambda t: t.strftime(TIMESTAMP_FORMAT),
+            "hour": "CAST(strftime('%H',tpep_pickup_datetime) AS INTEGER)",
+            "hour_label": "strftime('%H',tpep_pickup_datetime)", "hour_group": "hour",
+            "day_label": "strftime('%Y-%m-%d',tpep_pickup_datetime)", "day_group": "date",
+            "january": "tpep_pickup_datetime LIKE '2019-01%'"},
+    True: {"dur": "(dropoff_ts-pickup_ts)/60.0",
+           "spd": "CASE WHEN dropoff_ts>pickup_ts THEN trip_distance/((dropoff_ts-pickup_ts)/3600.0) ELSE 0 END",
+           "peak": _peak(_HOUR_TS), "t_peak": _peak("(t.pickup_ts/3600%24)"),
+           "pickup": "pickup_ts", "param": lambda t: calendar.timegm(t.timetuple()),
+           "hour": _HOUR_TS,
+           "hour_label": f"printf('%02d',{_HOUR_TS})", "hour_group": _HOUR_TS,
+           "day_label": "date(pickup_ts/86400*86400,'unixepoch')", "day_group": "pickup_ts/86400",
+           "january": "pickup_ts >= 1546300800 AND pickup_ts < 1548979200"},
+}
+
+def time_sql():
+    return TIME_SQL[compact_storage()]
+
+def _time_filter():
+    """(day, hour) request filters: a datetime and an int in range(24), each None when not given.
+
+    Raises ValueError when they can match no trip -- a date that isn't exactly
+    YYYY-MM-DD, or an hour outside 0-23 -- so the SQL and precomputed paths
+    agree on every input.
+    """
+    date, hour = request.args.get('date'), request.args.get('hour')
+    day = None
+    if date:
+        if len(date) != 10: raise ValueError(date)
+        day = datetime.strptime(date, "%Y-%m-%d")
+    if hour is not None:
+        hour = int(hour)
+        if not 0 <= hour < 24: raise ValueError(hour)
+    return day, hour
 
 def _build_where(base="trip_distance>0"):
     """Build WHERE clause from common query params: date, hour, min_fare, max_fare, min_distance, max_distance, borough."""
     clauses = [base]
     params = []
+    ts = time_sql()
 
-    date = request.args.get('date')          # e.g. "2019-01-15"
-    hour = request.args.get('hour')          # e.g. "18"
     min_fare = request.args.get('min_fare')
     max_fare = request.args.get('max_fare')
     min_dist = request.args.get('min_distance')
     max_dist = request.args.get('max_distance')
     boroughs = request.args.getlist('borough')
 
-    if date:
-        clauses.append("strftime('%Y-%m-%d', tpep_pickup_datetime) = ?")
-        params.append(date)
-    if hour is not None:
-        clauses.append("CAST(strftime('%H', tpep_pickup_datetime) AS INTEGER) = ?")
-        params.append(int(hour))
+    try:
+        day, hour = _time_filter()   # e.g. date=2019-01-15, hour=18
+    except ValueError:   # unparseable date or hour matches nothing
+        clauses.append("0")
+    else:
+        if day is not None:
+            # a range on the raw column, so idx_trips_pickup (and a --cluster build) reads only that day
+            start, span = day, timedelta(days=1)
+            if hour is not None:   # narrow to the hour instead
+                start, span, hour = start + timedelta(hours=hour), timedelta(hours=1), None
+            clauses.append(f"{ts['pickup']} >= ? AND {ts['pickup']} < ?")
+            params += [ts['param'](start), ts['param'](start + span)]
+        if hour is not None:
+            clauses.append(f"{ts['hour']} = ?")
+            params.append(hour)
     if min_fare:
         clauses.append("total_amount >= ?"); params.append(float(min_fare))
     if max_fare and float(max_fare) < 250:
@@ -48,137 +121,297 @@ def _build_where(base="trip_distance>0"):
 
     return " AND ".join(clauses), params
 
+# Count-only endpoints intersect the bitmap indexes built by build_db.py
+# instead of scanning: one bitset per filter, ANDed, then counted per group.
+# Trips added after the index was built (id > max_id) are counted with SQL.
+BITMAP_RANGES = {"fare": ("total_amount", "min_fare", "max_fare", 250),
+                 "distance": ("trip_distance", "min_distance", "max_distance", 50)}
+
+def _bitmap_filter(index):
+    """Bitset of indexed rows matching the _build_where filters, or None if the index can't answer them."""
+    a = request.args
+    bits = index.full()
+    try:
+        day, hour = _time_filter()
+    except ValueError:   # matches nothing, as in SQL
+        return index.empty()
+    if day is not None:
+        bits &= index.select('date', [int(np.datetime64(day, 'D').astype(np.int64))])
+    if hour is not None:
+        bits &= index.select('hour', [hour])
+    for dim, (col, lo_arg, hi_arg, cap) in BITMAP_RANGES.items():
+        lo = float(a[lo_arg]) if a.get(lo_arg) else None
+        hi = float(a[hi_arg]) if a.get(hi_arg) and float(a[hi_arg]) < cap else None
+        if lo is None and hi is None: continue
+        snapshot = get_snapshot()   # exact values for the boundary buckets
+        if snapshot is None or snapshot.rows != index.rows or snapshot.row_base != index.row_base:
+            return None
+        bits &= index.select_range(dim, lo, hi, snapshot[col])
+    boroughs = a.getlist('borough')
+    if boroughs:
+        zones = query_partials(f"SELECT LocationID AS location_id FROM zones WHERE Borough IN ({','.join('?' * len(boroughs))})",
+                               boroughs, keys=('location_id',))
+        bits &= index.select('zone', [z['location_id'] for z in zones])
+    return bits
+
+def _bitmap_counts(dim, base):
+    """{dim value: trip count} under the request filters, or None to fall back to SQL."""
+    index = get_bitmap_index()
+    if index is None or sharding_enabled(): return None
+    bits = _bitmap_filter(index)
+    if bits is None: return None
+    counts = {v: n for v, n in index.count_by(dim, bits).items() if n}
+    where, params = _build_where(base)
+    for r in query_partials(f"SELECT {DIMENSIONS[dim][0]} AS v, COUNT(*) AS n FROM trips "
+                            f"WHERE {where} AND id > ? GROUP BY v", params + [index.max_id], keys=('v',)):
+        counts[r['v']] = counts.get(r['v'], 0) + r['n']
+    return counts
+
+def _hour_counts(where, params):
+    counts = _bitmap_counts('hour', "trip_distance>=0")
+    if counts is not None:
+        return [{"hour": f"{h:02d}", "trip_count": n} for h, n in sorted(counts.items())]
+    ts = time_sql()
+    return query_partials(f"SELECT {ts['hour_label']} AS hour, COUNT(*) AS trip_count "
+                          f"FROM trips WHERE {where} GROUP BY {ts['hour_group']}", params,
+                          keys=('hour',), date=request.args.get('date'))
+
 @stats_bp.route('/api/statistics')
+@coalesce
 def get_statistics():
-    where, params = _build_where(f"trip_distance>0 AND ({DUR}) BETWEEN 1 AND 180")
-    conn = get_db_connection(); c = conn.cursor()
-    c.execute(f"""
-        SELECT COUNT(*) AS total_trips, AVG(trip_distance) AS avg_distance,
-               AVG(total_amount) AS avg_fare, AVG(tip_amount) AS avg_tip,
-               AVG(passenger_count) AS avg_passengers,
-               AVG({DUR}) AS avg_duration_minutes,
-               AVG({SPD}) AS avg_speed_mph,
-               AVG(CASE WHEN trip_distance>0 THEN fare_amount/trip_distance ELSE NULL END) AS avg_fare_per_mile,
+    ts = time_sql()
+    where, params = _build_where(f"trip_distance>0 AND ({ts['dur']}) BETWEEN 1 AND 180")
+    rows = query_partials(f"""
+        SELECT COUNT(*) AS total_trips, {_parts('trip_distance', 'distance')},
+               {_parts('total_amount', 'fare')}, {_parts('tip_amount', 'tip')},
+               {_parts('passenger_count', 'passengers')},
+               {_parts(ts['dur'], 'duration')}, {_parts(ts['spd'], 'speed')},
+               {_parts('CASE WHEN trip_distance>0 THEN fare_amount/trip_distance ELSE NULL END', 'fpm')},
                SUM(total_amount) AS total_revenue
         FROM trips WHERE {where}
-    """, params)
-    row = dict_from_row(c.fetchone()); conn.close()
-    return jsonify({k: _r(v) for k,v in row.items()})
+    """, params, date=request.args.get('date'))
+    row = rows[0] if rows else {"total_trips": 0, "total_revenue": None}
+    stats = {"total_trips": row['total_trips'], "avg_distance": _avg(row, 'distance'),
+             "avg_fare": _avg(row, 'fare'), "avg_tip": _avg(row, 'tip'),
+             "avg_passengers": _avg(row, 'passengers'),
+             "avg_duration_minutes": _avg(row, 'duration'), "avg_speed_mph": _avg(row, 'speed'),
+             "avg_fare_per_mile": _avg(row, 'fpm'), "total_revenue": row['total_revenue']}
+    return jsonify({k: _r(v) for k,v in stats.items()})
 
 @stats_bp.route('/api/statistics/by-borough')
+@coalesce
 def get_stats_by_borough():
+    ts = time_sql()
     where, params = _build_where("t.trip_distance>=0")
-    conn = get_db_connection(); c = conn.cursor()
-    c.execute(f"""
+    rows = query_partials(f"""
         SELECT z.Borough AS borough, COUNT(*) AS trip_count,
-               AVG(t.trip_distance) AS avg_distance, AVG(t.total_amount) AS avg_fare,
-               AVG({DUR}) AS avg_duration, AVG({SPD}) AS avg_speed,
+               {_parts('t.trip_distance', 'distance')}, {_parts('t.total_amount', 'fare')},
+               {_parts(ts['dur'], 'duration')}, {_parts(ts['spd'], 'speed')},
                SUM(t.total_amount) AS total_revenue
         FROM trips t JOIN zones z ON t.PULocationID=z.LocationID
-        WHERE {where} GROUP BY z.Borough ORDER BY trip_count DESC
-    """, params)
-    rows = c.fetchall(); conn.close()
+        WHERE {where} GROUP BY z.Borough
+    """, params, keys=('borough',), date=request.args.get('date'))
+    rows.sort(key=lambda r: r['trip_count'], reverse=True)
     return jsonify([{"borough":r['borough'],"trip_count":r['trip_count'],
-                     "avg_distance":_r(r['avg_distance']),"avg_fare":_r(r['avg_fare']),
-                     "avg_duration":_r(r['avg_duration']),"avg_speed":_r(r['avg_speed']),
+                     "avg_distance":_r(_avg(r,'distance')),"avg_fare":_r(_avg(r,'fare')),
+                     "avg_duration":_r(_avg(r,'duration')),"avg_speed":_r(_avg(r,'speed')),
                      "total_revenue":_r(r['total_revenue'])}
                     for r in rows if r['borough'] and r['borough'] not in ('','Unknown','N/A')])
 
 @stats_bp.route('/api/statistics/peak-hours')
+@coalesce
 def get_peak_hours():
     where, params = _build_where("trip_distance>=0")
-    conn = get_db_connection(); c = conn.cursor()
-    c.execute(f"SELECT strftime('%H',tpep_pickup_datetime) AS hour, COUNT(*) AS trip_count "
-              f"FROM trips WHERE {where} GROUP BY hour ORDER BY trip_count DESC LIMIT 10", params)
-    rows = c.fetchall(); conn.close()
+    rows = _hour_counts(where, params)
+    rows.sort(key=lambda r: r['trip_count'], reverse=True)
     result = []
-    for r in rows:
+    for r in rows[:10]:
         h = int(r['hour'])
         label = "12:00 AM" if h==0 else (f"{h}:00 AM" if h<12 else ("12:00 PM" if h==12 else f"{h-12}:00 PM"))
         result.append({"hour":h,"label":label,"trip_count":r['trip_count']})
     return jsonify(result)
 
 @stats_bp.route('/api/statistics/by-zone')
+@coalesce
 def get_stats_by_zone():
     where, params = _build_where("trip_distance>=0")
-    conn = get_db_connection(); c = conn.cursor()
-    c.execute(f"SELECT PULocationID AS location_id, COUNT(*) AS trip_count "
-              f"FROM trips WHERE {where} GROUP BY PULocationID", params)
-    stats = {str(r['location_id']): r['trip_count'] for r in c.fetchall()}
-    conn.close(); return jsonify(stats)
+    counts = _bitmap_counts('zone', "trip_distance>=0")
+    if counts is not None:
+        rows = [{"location_id": z, "trip_count": n} for z, n in sorted(counts.items())]
+    else:
+        rows = query_partials(f"SELECT PULocationID AS location_id, COUNT(*) AS trip_count "
+                              f"FROM trips WHERE {where} GROUP BY PULocationID", params,
+                              keys=('location_id',), date=request.args.get('date'))
+    return tabular_response(["location_id", "trip_count"],
+                            [[r['location_id'], r['trip_count']] for r in rows],
+                            lambda: jsonify({str(r['location_id']): r['trip_count'] for r in rows}))
 
 @stats_bp.route('/api/statistics/trends')
+@coalesce
 def get_trip_trends():
     # Trends always show full Jan 2019 daily view; date filter scopes to borough if set
     boroughs = request.args.getlist('borough')
-    conn = get_db_connection(); c = conn.cursor()
+    ts = time_sql()
     if boroughs:
         placeholders = ','.join('?' * len(boroughs))
-        c.execute(f"SELECT strftime('%Y-%m-%d',tpep_pickup_datetime) AS date, COUNT(*) AS trips "
-                  f"FROM trips WHERE tpep_pickup_datetime LIKE '2019-01%' "
-                  f"AND PULocationID IN (SELECT LocationID FROM zones WHERE Borough IN ({placeholders})) "
-                  f"GROUP BY date ORDER BY date", boroughs)
+        trends = query_partials(f"SELECT {ts['day_label']} AS date, COUNT(*) AS trips "
+                                f"FROM trips WHERE {ts['january']} "
+                                f"AND PULocationID IN (SELECT LocationID FROM zones WHERE Borough IN ({placeholders})) "
+                                f"GROUP BY {ts['day_group']}", boroughs, keys=('date',))
     else:
-        c.execute("SELECT strftime('%Y-%m-%d',tpep_pickup_datetime) AS date, COUNT(*) AS trips "
-                  "FROM trips WHERE tpep_pickup_datetime LIKE '2019-01%' GROUP BY date ORDER BY date")
-    trends = [dict_from_row(r) for r in c.fetchall()]; conn.close()
+        trends = query_partials(f"SELECT {ts['day_label']} AS date, COUNT(*) AS trips "
+                                f"FROM trips WHERE {ts['january']} GROUP BY {ts['day_group']}",
+                                keys=('date',))
+    trends.sort(key=lambda r: r['date'])
     return jsonify(trends)
 
 @stats_bp.route('/api/statistics/fare-distribution')
+@coalesce
 def get_fare_distribution():
     where, params = _build_where("total_amount>0")
-    conn = get_db_connection(); c = conn.cursor()
-    c.execute(f"""
+    dist = query_partials(f"""
         SELECT CASE WHEN total_amount<10 THEN '$0-10' WHEN total_amount<20 THEN '$10-20'
                     WHEN total_amount<30 THEN '$20-30' WHEN total_amount<40 THEN '$30-40'
                     WHEN total_amount<50 THEN '$40-50' ELSE '$50+' END AS range,
                COUNT(*) AS count FROM trips WHERE {where} GROUP BY range
-    """, params)
-    dist = [dict_from_row(r) for r in c.fetchall()]; conn.close()
+    """, params, keys=('range',), date=request.args.get('date'))
     order = {'$0-10':1,'$10-20':2,'$20-30':3,'$30-40':4,'$40-50':5,'$50+':6}
     dist.sort(key=lambda x: order.get(x['range'],7))
     return jsonify(dist)
 
 @stats_bp.route('/api/statistics/peak-vs-offpeak')
+@coalesce
 def get_peak_vs_offpeak():
-    conn = get_db_connection(); c = conn.cursor()
-    c.execute(f"""
-        SELECT ({PEAK}) AS is_peak, COUNT(*) AS trip_count,
-               AVG(total_amount) AS avg_fare, AVG(trip_distance) AS avg_distance,
-               AVG({DUR}) AS avg_duration
+    ts = time_sql()
+    rows = query_partials(f"""
+        SELECT ({ts['peak']}) AS is_peak, COUNT(*) AS trip_count,
+               {_parts('total_amount', 'fare')}, {_parts('trip_distance', 'distance')},
+               {_parts(ts['dur'], 'duration')}
         FROM trips WHERE trip_distance>0 GROUP BY is_peak
-    """)
+    """, keys=('is_peak',))
     result = {}
-    for r in c.fetchall():
+    for r in rows:
         key = "peak_hour" if r['is_peak']==1 else "off_peak"
-        result[key] = {"trip_count":r['trip_count'],"avg_fare":_r(r['avg_fare']),
-                       "avg_distance":_r(r['avg_distance']),"avg_duration":_r(r['avg_duration'])}
-    conn.close(); return jsonify(result)
+        result[key] = {"trip_count":r['trip_count'],"avg_fare":_r(_avg(r,'fare')),
+                       "avg_distance":_r(_avg(r,'distance')),"avg_duration":_r(_avg(r,'duration'))}
+    return jsonify(result)
 
 @stats_bp.route('/api/insights')
+@coalesce
 def get_insights():
-    conn = get_db_connection(); c = conn.cursor()
     insights = []
-    c.execute("SELECT z.Borough AS borough, COUNT(*) AS trip_count FROM trips t "
-              "JOIN zones z ON t.PULocationID=z.LocationID GROUP BY z.Borough ORDER BY trip_count DESC LIMIT 1")
-    r = c.fetchone()
+    ts = time_sql()
+    rows = query_partials("SELECT z.Borough AS borough, COUNT(*) AS trip_count FROM trips t "
+                          "JOIN zones z ON t.PULocationID=z.LocationID GROUP BY z.Borough", keys=('borough',))
+    r = max(rows, key=lambda x: x['trip_count'], default=None)
     if r: insights.append({"title":"Busiest Pickup Borough","value":r['borough'],"metric":f"{r['trip_count']:,} trips"})
-    c.execute(f"SELECT AVG({SPD}) AS s FROM trips WHERE trip_distance>0")
-    s = c.fetchone()['s'] or 0
+    r = query_partials(f"SELECT {_parts(ts['spd'], 'speed')} FROM trips WHERE trip_distance>0")
+    s = (_avg(r[0], 'speed') if r else None) or 0
     insights.append({"title":"Average Trip Speed","value":f"{s:.1f} mph","metric":"across all trips"})
-    c.execute(f"SELECT SUM({PEAK}) AS p, COUNT(*) AS t FROM trips")
-    r = c.fetchone(); pct = (r['p']/r['t']*100) if r['t'] else 0
+    r = query_partials(f"SELECT SUM({ts['peak']}) AS p, COUNT(*) AS t FROM trips")
+    r = r[0] if r else {'p': 0, 't': 0}
+    pct = (r['p']/r['t']*100) if r['t'] else 0
     insights.append({"title":"Peak Hour Trips","value":f"{pct:.1f}%","metric":"of all trips during rush hour"})
-    c.execute("SELECT AVG(fare_amount/trip_distance) AS f FROM trips WHERE trip_distance>0")
-    f = c.fetchone()['f'] or 0
+    r = query_partials(f"SELECT {_parts('fare_amount/trip_distance', 'fpm')} FROM trips WHERE trip_distance>0")
+    f = (_avg(r[0], 'fpm') if r else None) or 0
     insights.append({"title":"Average Fare Per Mile","value":f"${f:.2f}","metric":"revenue per mile driven"})
-    conn.close(); return jsonify({"insights":insights})
+    return jsonify({"insights":insights})
 
 @stats_bp.route('/api/statistics/pickup-time-distribution')
+@coalesce
 def get_pickup_time_distribution():
     where, params = _build_where("trip_distance>=0")
-    conn = get_db_connection(); c = conn.cursor()
-    c.execute(f"SELECT strftime('%H',tpep_pickup_datetime) AS hour, COUNT(*) AS trip_count "
-              f"FROM trips WHERE {where} GROUP BY hour ORDER BY hour", params)
-    stats = [dict_from_row(r) for r in c.fetchall()]; conn.close()
+    stats = _hour_counts(where, params)
+    stats.sort(key=lambda r: r['hour'])
     return jsonify(stats)
+
+# Percentiles: merged from the per-(hour, zone) sketches built by build_db.py.
+# Fare/distance range filters cut across cells, so those requests (and
+# databases without sketches, and sharded storage) scan instead: SQL returns a
+# mergeable histogram of cent-rounded values that is folded into the same
+# sketch buckets.
+PCT_GROUPS = {"borough": "(SELECT Borough FROM zones WHERE LocationID=PULocationID)",
+              "zone": "PULocationID", "hour": "CAST(strftime('%H',tpep_pickup_datetime) AS INTEGER)"}
+PCT_DEFAULT_Q = (0.5, 0.9, 0.99)
+
+def _has_value_filters():
+    a = request.args
+    return bool(a.get('min_fare') or (a.get('max_fare') and float(a['max_fare']) < 250) or
+                a.get('min_distance') or (a.get('max_distance') and float(a['max_distance']) < 50))
+
+def _sketch_histograms(sketches, metrics, group_by, borough_of):
+    boroughs = request.args.getlist('borough')
+    zones = {z for z, b in borough_of.items() if b in boroughs} if boroughs else None
+    cell_hour, cell_zone = cells = sketches.cells()
+    try:
+        day, hour = _time_filter()
+    except ValueError:   # matches nothing, as in SQL
+        mask = np.zeros(len(cell_hour), dtype=bool)
+    else:
+        mask = sketches.cell_mask(cells, np.datetime64(day, 'D') if day else None, hour, zones)
+    if group_by == "zone":
+        key = cell_zone
+    elif group_by == "hour":
+        key = cell_hour % 24
+    elif group_by == "borough":
+        names = sorted({b for b in borough_of.values() if b is not None})
+        lookup = np.full(ZONE_SLOTS, -1)
+        for z, b in borough_of.items():
+            if b is not None and 0 <= z < ZONE_SLOTS: lookup[z] = names.index(b)
+        key = lookup[cell_zone]; mask &= key >= 0
+    else:
+        key = np.zeros(len(mask), dtype=np.int64)
+    labels, inverse = np.unique(key[mask], return_inverse=True)
+    cell_group = np.full(len(mask), -1, dtype=np.int64); cell_group[mask] = inverse
+    if group_by == "borough": labels = [names[i] for i in labels]
+    return list(labels), {m: sketches.merge(m, cell_group, len(labels)) for m in metrics}
+
+def _scan_histograms(metrics, group_by):
+    where, params = _build_where("trip_distance>=0")
+    grp = time_sql()['hour'] if group_by == "hour" else PCT_GROUPS.get(group_by, "0")
+    rows = {m: query_partials(f"SELECT {grp} AS grp, CAST(ROUND({col}*100) AS INTEGER) AS v, COUNT(*) AS n "
+                              f"FROM trips WHERE {where} AND {col} IS NOT NULL GROUP BY grp, v", params,
+                              keys=('grp', 'v'), date=request.args.get('date'))
+            for m, col in ((m, METRICS[m]) for m in metrics)}
+    labels = sorted({r['grp'] for rs in rows.values() for r in rs if r['grp'] is not None})
+    index = {g: i for i, g in enumerate(labels)}
+    hists = {}
+    for m, rs in rows.items():
+        rs = [r for r in rs if r['grp'] is not None]
+        h = np.zeros((len(labels), N_BUCKETS))
+        np.add.at(h, ([index[r['grp']] for r in rs], bucket_index([r['v'] / 100 for r in rs])),
+                  [r['n'] for r in rs])
+        hists[m] = h
+    return labels, hists
+
+@stats_bp.route('/api/statistics/percentiles')
+@coalesce
+def get_percentiles():
+    metrics = [m for m in request.args.getlist('metric') if m in METRICS] or list(METRICS)
+    try:
+        qs = [float(q) for q in request.args.getlist('q')] or list(PCT_DEFAULT_Q)
+    except ValueError:
+        qs = None
+    if qs is None or not all(0 <= q <= 1 for q in qs):   # NaN fails the range check too
+        return jsonify({"error": "q must be a number between 0 and 1"}), 400
+    group_by = request.args.get('group_by') if request.args.get('group_by') in PCT_GROUPS else None
+    sketches = get_sketches()
+    # the sketches cover taxi_mock.db, not the shards
+    if sketches is not None and not sharding_enabled() and not _has_value_filters():
+        zones = query_partials("SELECT LocationID AS location_id, Borough AS borough FROM zones",
+                               keys=('location_id', 'borough'))
+        labels, hists = _sketch_histograms(sketches, metrics, group_by, {z['location_id']: z['borough'] for z in zones})
+        source = "sketch"
+    else:
+        labels, hists = _scan_histograms(metrics, group_by)
+        source = "scan"
+    names = [f"p{q*100:g}" for q in qs]
+    per_metric = {m: (h.sum(axis=1), quantiles(h, qs)) for m, h in hists.items()}
+    groups = []
+    for i, label in enumerate(labels):
+        if group_by == "borough" and label in ('', 'Unknown', 'N/A'): continue
+        g = {group_by: label.item() if hasattr(label, 'item') else label} if group_by else {}
+        for m, (counts, qv) in per_metric.items():
+            g[m] = {"count": int(counts[i]), **{n: _r(v) for n, v in zip(names, qv[i])}}
+        groups.append(g)
+    return jsonify({"quantiles": qs, "group_by": group_by, "source": source, "groups": groups})
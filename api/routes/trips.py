@@ -1,6 +1,11 @@
 from flask import Blueprint, jsonify, request
 from utils.db_connect import get_db_connection, dict_from_row
 from utils.custom_sort import merge_sort
+from utils.encoding import tabular_response
+from utils.singleflight import coalesce
+from routes.flows import od_totals
+from routes.statistics import time_sql
+import numpy as np
 
 trips_bp = Blueprint('trips', __name__)
 
@@ -17,9 +22,10 @@ def get_trips():
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    query = """
+    # taxi_mock.db columns; the derived ones are computed like the pipeline's
+    query = f"""
         SELECT
-            t.trip_id,
+            t.id AS trip_id,
             t.tpep_pickup_datetime,
             t.tpep_dropoff_datetime,
             t.passenger_count,
@@ -29,22 +35,22 @@ def get_trips():
             t.total_amount,
             t.trip_duration_minutes,
             t.speed_mph,
-            t.fare_per_mile,
-            t.tip_percentage,
-            t.is_peak_hour,
-            z1.borough as pickup_borough,
-            z1.zone_name as pickup_zone,
-            z2.borough as dropoff_borough,
-            z2.zone_name as dropoff_zone
+            CASE WHEN t.trip_distance > 0 THEN ROUND(t.fare_amount / t.trip_distance, 2) END AS fare_per_mile,
+            CASE WHEN t.total_amount > 0 THEN ROUND(100.0 * t.tip_amount / t.total_amount, 2) END AS tip_percentage,
+            {time_sql()['t_peak']} AS is_peak_hour,
+            z1.Borough as pickup_borough,
+            z1.Zone as pickup_zone,
+            z2.Borough as dropoff_borough,
+            z2.Zone as dropoff_zone
         FROM trips t
-        LEFT JOIN taxi_zones z1 ON t.pu_location_id = z1.location_id
-        LEFT JOIN taxi_zones z2 ON t.do_location_id = z2.location_id
+        LEFT JOIN zones z1 ON t.PULocationID = z1.LocationID
+        LEFT JOIN zones z2 ON t.DOLocationID = z2.LocationID
         WHERE 1=1
     """
     params = []
 
     if borough:
-        query += " AND (z1.borough = ? OR z2.borough = ?)"
+        query += " AND (z1.Borough = ? OR z2.Borough = ?)"
         params.extend([borough, borough])
 
     if min_fare is not None:
@@ -64,7 +70,7 @@ def get_trips():
         params.append(max_distance)
 
     if is_peak is not None:
-        query += " AND t.is_peak_hour = ?"
+        query += " AND is_peak_hour = ?"
         params.append(is_peak)
 
     query += " LIMIT ?"
@@ -72,10 +78,11 @@ def get_trips():
 
     try:
         cursor.execute(query, params)
+        columns = [d[0] for d in cursor.description]
         rows = cursor.fetchall()
-        trips = [dict_from_row(row) for row in rows]
         conn.close()
-        return jsonify({"count": len(trips), "trips": trips})
+        return tabular_response(columns, [list(row) for row in rows],
+                                lambda: jsonify({"count": len(rows), "trips": [dict_from_row(row) for row in rows]}))
     except Exception as e:
         conn.close()
         return jsonify({"error": str(e)}), 500
@@ -86,65 +93,64 @@ def get_zones():
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    cursor.execute("SELECT DISTINCT borough FROM taxi_zones ORDER BY borough")
+    cursor.execute("SELECT DISTINCT Borough AS borough FROM zones ORDER BY borough")
     boroughs = [row['borough'] for row in cursor.fetchall()]
 
-    cursor.execute("SELECT location_id, borough, zone_name FROM taxi_zones ORDER BY borough, zone_name")
+    cursor.execute("SELECT LocationID AS location_id, Borough AS borough, Zone AS zone_name "
+                   "FROM zones ORDER BY borough, zone_name")
     zones = [dict_from_row(row) for row in cursor.fetchall()]
 
     conn.close()
     return jsonify({"boroughs": boroughs, "zones": zones})
 
 
+# Zones top-routes leaves out: no zones row or NULL borough (None), '' and
+# 'Unknown', as the original JOIN ... WHERE borough != 'Unknown' AND borough != ''
+# did. 'N/A' (265, Outside of NYC) is a real destination and stays.
+ROUTE_EXCLUDED_BOROUGHS = (None, '', 'Unknown')
+
 @trips_bp.route('/api/top-routes', methods=['GET'])
+@coalesce
 def get_top_routes():
     limit = request.args.get('limit', 10, type=int)
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    query = """
-        SELECT
-            z1.borough as pickup_borough,
-            z1.zone_name as pickup_zone,
-            z2.borough as dropoff_borough,
-            z2.zone_name as dropoff_zone,
-            COUNT(*) as trip_count,
-            AVG(t.trip_distance) as avg_distance,
-            AVG(t.total_amount) as avg_fare,
-            AVG(t.trip_duration_minutes) as avg_duration
-        FROM trips t
-        JOIN taxi_zones z1 ON t.pu_location_id = z1.location_id
-        JOIN taxi_zones z2 ON t.do_location_id = z2.location_id
-        WHERE z1.borough != 'Unknown' 
-        AND z2.borough != 'Unknown'
-        AND z1.borough != ''
-        AND z2.borough != ''
-        GROUP BY t.pu_location_id, t.do_location_id
-    """
-
-    cursor.execute(query)
-    rows = cursor.fetchall()
+    # PU x DO totals from the OD tensor (or one GROUP BY when it is missing)
+    totals, zones = od_totals()
+    count = totals['count'].copy()
+    valid = np.array([zones.get(z, (None,))[0] not in ROUTE_EXCLUDED_BOROUGHS for z in range(len(count))])
+    count[~valid, :] = 0
+    count[:, ~valid] = 0
+
+    # top `limit` pairs without sorting every zone pair: take everything above the
+    # k-th largest count, then fill with the lowest-numbered pairs tied with it
+    flat = count.ravel()
+    k = min(max(limit, 0), int(np.count_nonzero(flat)))
+    if k:
+        kth = np.partition(flat, flat.size - k)[flat.size - k]
+        above = np.flatnonzero(flat > kth)
+        pairs = np.concatenate([above, np.flatnonzero(flat == kth)[:k - len(above)]])
+    else:
+        pairs = np.empty(0, dtype=np.int64)
 
     routes = []
-    for row in rows:
+    for pu, do in zip(*np.unravel_index(np.sort(pairs), count.shape)):
+        idx = (int(pu), int(do))
         routes.append({
-            "pickup_borough": row['pickup_borough'],
-            "pickup_zone": row['pickup_zone'],
-            "dropoff_borough": row['dropoff_borough'],
-            "dropoff_zone": row['dropoff_zone'],
-            "trip_count": row['trip_count'],
-            "avg_distance": round(row['avg_distance'], 2),
-            "avg_fare": round(row['avg_fare'], 2),
-            "avg_duration": round(row['avg_duration'], 2)
+            "pickup_borough": zones[idx[0]][0],
+            "pickup_zone": zones[idx[0]][1],
+            "dropoff_borough": zones[idx[1]][0],
+            "dropoff_zone": zones[idx[1]][1],
+            "trip_count": int(count[idx]),
+            "avg_distance": round(totals['distance'][idx] / count[idx], 2),
+            "avg_fare": round(totals['fare'][idx] / count[idx], 2),
+            "avg_duration": round(totals['duration'][idx] / count[idx], 2)
         })
 
-    conn.close()
-
     # Use YOUR custom merge sort (no built-in sort!)
     sorted_routes = merge_sort(routes, key='trip_count', reverse=True)
 
-    return jsonify({
-        "count": min(limit, len(sorted_routes)),
-        "routes": sorted_routes[:limit]
-    })
\ No newline at end of file
+    top = sorted_routes[:limit]
+    columns = ["pickup_borough", "pickup_zone", "dropoff_borough", "dropoff_zone",
+               "trip_count", "avg_distance", "avg_fare", "avg_duration"]
+    return tabular_response(columns, [[r[c] for c in columns] for r in top],
+                            lambda: jsonify({"count": len(top), "routes": top}))
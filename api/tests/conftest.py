@@ -0,0 +1,159 @@
+import os
+import sqlite3
+import sys
+
+import numpy as np
+import pytest
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+sys.path.insert(0, os.path.join(API_DIR, "data"))
+os.environ.pop("TAXI_STORAGE", None)
+
+import build_db
+from utils import bitmap_index, db_connect, ingest, od_matrix, quantile_sketch, snapshot
+from utils.trip_rules import INSERT_SQL, clean_trip
+
+# Small synthetic Jan 2019 dataset: a few busy zones (264 has no borough) over three days.
+ZONE_IDS = (4, 13, 43, 48, 68, 79, 87, 132, 138, 161, 162, 230, 236, 237, 264)
+DAYS = ("2019-01-14", "2019-01-15", "2019-01-16")
+N_TRIPS = 3000
+
+# name -> (module, cache dict name, loader, writer) of every precomputed artifact the API maps
+ARTIFACTS = {"snapshot": (snapshot, "_snapshot", snapshot.Snapshot, snapshot.write_snapshot),
+             "sketches": (quantile_sketch, "_sketches", quantile_sketch.SketchIndex, quantile_sketch.write_sketches),
+             "od": (od_matrix, "_od", od_matrix.ODMatrix, od_matrix.write_od_matrix),
+             "bitmaps": (bitmap_index, "_bitmaps", bitmap_index.BitmapIndex, bitmap_index.write_bitmap_index)}
+
+# app.py maps the artifacts and starts the ingest writer on import: point both away from api/data
+for _module, _state, _, _ in ARTIFACTS.values():
+    getattr(_module, _state).update(loaded=True, value=None)
+ingest._writer["value"] = ingest.TripWriter(db_path=":memory:")
+
+
+def make_raw_trips(n=N_TRIPS, seed=0):
+    """n raw TLC records with string values, as csv.DictReader yields them from the TLC file."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for _ in range(n):
+        day = DAYS[rng.integers(len(DAYS))]
+        start = np.datetime64(f"{day}T00:00:00") + np.timedelta64(int(rng.integers(86400)), "s")
+        end = start + np.timedelta64(int(rng.integers(120, 3600)), "s")
+        dist = round(float(rng.lognormal(0.7, 0.6)), 2)
+        fare = round(2.5 + 2.5 * dist, 2)
+        tip = round(float(rng.choice([0.0, 0.15 * fare])), 2)
+        rows.append({
+            "VendorID": str(rng.integers(1, 3)),
+            "tpep_pickup_datetime": str(start).replace("T", " "),
+            "tpep_dropoff_datetime": str(end).replace("T", " "),
+            "passenger_count": str(rng.integers(1, 5)),
+            "trip_distance": f"{dist:.2f}",
+            "RatecodeID": "1",
+            "store_and_fwd_flag": "Y" if rng.random() < 0.05 else "N",
+            "PULocationID": str(rng.choice(ZONE_IDS)),
+            "DOLocationID": str(rng.choice(ZONE_IDS)),
+            "payment_type": str(rng.integers(1, 3)),
+            "fare_amount": f"{fare:.2f}",
+            "extra": "0.5",
+            "mta_tax": "0.5",
+            "tip_amount": f"{tip:.2f}",
+            "tolls_amount": "0",
+            "improvement_surcharge": "0.3",
+            "total_amount": f"{fare + 1.3 + tip:.2f}",
+            "congestion_surcharge": "",
+        })
+    return rows
+
+
+def clean_trips(rows):
+    return [t for t, _ in map(clean_trip, rows) if t is not None]
+
+
+def build_db_file(path, trips, compact=False, cluster=False):
+    """A trips database built the way build_db.py builds taxi_mock.db."""
+    conn = build_db.create_db(str(path), build_db.read_zones(), compact)
+    conn.executemany(INSERT_SQL, trips)
+    conn.commit()
+    if cluster:
+        build_db.cluster_trips(conn)
+    conn.close()
+    return str(path)
+
+
+def assert_same(a, b):
+    """Equal JSON, floats compared to their 2-decimal rounding."""
+    if isinstance(a, dict):
+        assert a.keys() == b.keys()
+        for k in a:
+            assert_same(a[k], b[k])
+    elif isinstance(a, list):
+        assert len(a) == len(b)
+        for x, y in zip(a, b):
+            assert_same(x, y)
+    elif isinstance(a, float):
+        assert a == pytest.approx(b, abs=0.011)
+    else:
+        assert a == b
+
+
+def write_artifacts(db_path, out_dir, names=tuple(ARTIFACTS)):
+    """{name: directory} of freshly written artifacts for db_path."""
+    conn = sqlite3.connect(db_path)
+    try:
+        dirs = {}
+        for name in names:
+            dirs[name] = os.path.join(out_dir, name)
+            ARTIFACTS[name][3](conn, dirs[name])
+        return dirs
+    finally:
+        conn.close()
+
+
+@pytest.fixture(scope="session")
+def raw_trips():
+    return make_raw_trips()
+
+
+@pytest.fixture(scope="session")
+def trips(raw_trips):
+    return clean_trips(raw_trips)
+
+
+@pytest.fixture(scope="session")
+def trips_db(trips, tmp_path_factory):
+    return build_db_file(tmp_path_factory.mktemp("db") / "taxi_mock.db", trips)
+
+
+@pytest.fixture(scope="session")
+def artifact_dirs(trips_db, tmp_path_factory):
+    return write_artifacts(trips_db, str(tmp_path_factory.mktemp("artifacts")))
+
+
+@pytest.fixture
+def make_db(tmp_path):
+    """build_db_file(name, trips, compact=False, cluster=False) under this test's tmp_path."""
+    return lambda name, trips, **kw: build_db_file(tmp_path / name, trips, **kw)
+
+
+@pytest.fixture
+def client(trips_db, monkeypatch):
+    """Flask test client on trips_db with every precomputed artifact switched off."""
+    monkeypatch.setattr(db_connect, "DB_PATH", trips_db)
+    for module, state, _, _ in ARTIFACTS.values():
+        monkeypatch.setitem(getattr(module, state), "loaded", True)
+        monkeypatch.setitem(getattr(module, state), "value", None)
+    from app import app
+    return app.test_client()
+
+
+@pytest.fixture
+def use_artifacts(monkeypatch, artifact_dirs):
+    """use_artifacts(*names, dirs=None): map the named artifacts for this test; returns them by name."""
+    def use(*names, dirs=None):
+        loaded = {}
+        for name in names:
+            module, state, cls, _ = ARTIFACTS[name]
+            loaded[name] = cls((dirs or artifact_dirs)[name])
+            monkeypatch.setitem(getattr(module, state), "value", loaded[name])
+        return loaded
+    return use
@@ -0,0 +1,62 @@
+import sqlite3
+
+import pytest
+
+from conftest import write_artifacts
+from utils import db_connect
+from utils.trip_rules import INSERT_SQL
+
+ROUTES = ["/api/statistics/pickup-time-distribution", "/api/statistics/peak-hours", "/api/statistics/by-zone"]
+FILTERS = ["", "date=2019-01-15", "hour=8", "date=2019-01-16&hour=18", "borough=Manhattan&borough=Queens",
+           "min_fare=10", "max_fare=12.5", "min_distance=1.2&max_distance=3", "min_fare=8&borough=Brooklyn&hour=12",
+           "hour=24", "date=2019-01-15T00"]
+
+
+@pytest.mark.parametrize("query", FILTERS)
+@pytest.mark.parametrize("route", ROUTES)
+def test_bitmap_counts_match_sql(client, use_artifacts, route, query):
+    scanned = client.get(f"{route}?{query}").get_json()
+    use_artifacts("bitmaps", "snapshot")
+    assert client.get(f"{route}?{query}").get_json() == scanned
+
+
+def test_range_filters_need_a_matching_snapshot(client, use_artifacts):
+    # without exact values for the boundary buckets the route falls back to SQL
+    scanned = client.get("/api/statistics/by-zone?min_fare=10").get_json()
+    use_artifacts("bitmaps")
+    assert client.get("/api/statistics/by-zone?min_fare=10").get_json() == scanned
+
+
+def test_trips_after_the_index_are_counted(client, use_artifacts, trips, make_db, tmp_path, monkeypatch):
+    path = make_db("growing.db", trips[:2000])
+    dirs = write_artifacts(path, str(tmp_path), ("bitmaps", "snapshot"))
+    conn = sqlite3.connect(path)
+    conn.executemany(INSERT_SQL, trips[2000:])
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(db_connect, "DB_PATH", path)
+    scanned = {r: client.get(f"{r}?date=2019-01-15").get_json() for r in ROUTES}
+    use_artifacts("bitmaps", "snapshot", dirs=dirs)
+    for route, body in scanned.items():
+        assert client.get(f"{route}?date=2019-01-15").get_json() == body
+
+
+def test_counts_come_from_the_index(client, use_artifacts):
+    from app import app
+    from routes import statistics
+    use_artifacts("bitmaps", "snapshot")
+    with app.test_request_context("/?min_fare=10&hour=8"):
+        assert statistics._bitmap_counts("zone", "trip_distance>=0") is not None
+
+
+def test_range_bounds_between_float32_neighbours_match_sql(client, use_artifacts, trips_db):
+    conn = sqlite3.connect(trips_db)
+    fare, distance = conn.execute("SELECT total_amount, trip_distance FROM trips WHERE total_amount < 250 "
+                                  "AND trip_distance < 50 LIMIT 1").fetchone()
+    conn.close()
+    # each bound rounds to the same float32 as the stored value but excludes it in SQL
+    queries = [f"min_fare={fare + 1e-7!r}", f"max_fare={fare - 1e-7!r}",
+               f"min_distance={distance + 1e-7!r}", f"max_distance={distance - 1e-7!r}"]
+    scanned = [client.get(f"/api/statistics/by-zone?{q}").get_json() for q in queries]
+    use_artifacts("bitmaps", "snapshot")
+    assert [client.get(f"/api/statistics/by-zone?{q}").get_json() for q in queries] == scanned
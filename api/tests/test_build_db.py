@@ -0,0 +1,144 @@
+import sqlite3
+
+import pytest
+
+import build_db
+from conftest import ARTIFACTS, assert_same, write_artifacts
+from utils import bitmap_index, db_connect, od_matrix, quantile_sketch, snapshot
+from utils.trip_rules import INSERT_SQL
+
+COLUMNS = "tpep_pickup_datetime, tpep_dropoff_datetime, PULocationID, DOLocationID, total_amount, trip_distance"
+
+
+def rows(path, sql):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def clustered(trips, make_db):
+    return make_db("clustered.db", trips, cluster=True)
+
+
+def test_cluster_keeps_rows_and_orders_them(trips_db, clustered):
+    assert sorted(rows(clustered, f"SELECT {COLUMNS} FROM trips")) == sorted(rows(trips_db, f"SELECT {COLUMNS} FROM trips"))
+    ordered = rows(clustered, "SELECT id, substr(tpep_pickup_datetime, 1, 13), PULocationID, tpep_pickup_datetime "
+                              "FROM trips ORDER BY id")
+    assert [r[0] for r in ordered] == list(range(1, len(ordered) + 1))
+    assert [r[1:] for r in ordered] == sorted(r[1:] for r in ordered)
+    indexes = "SELECT name FROM sqlite_master WHERE type='index' AND sql IS NOT NULL ORDER BY name"
+    assert rows(clustered, indexes) == rows(trips_db, indexes)
+    assert rows(clustered, "SELECT COUNT(*) FROM sqlite_stat1")[0][0] > 0
+
+
+def test_date_filter_searches_the_pickup_index(trips_db):
+    from app import app
+    from routes.statistics import _build_where
+    with app.test_request_context("/?date=2019-01-15&hour=8"):
+        where, params = _build_where()
+    conn = sqlite3.connect(trips_db)
+    plan = " ".join(r[3] for r in conn.execute(f"EXPLAIN QUERY PLAN SELECT COUNT(*) FROM trips WHERE {where}", params))
+    conn.close()
+    assert "SEARCH" in plan and "idx_trips_pickup" in plan
+
+
+@pytest.mark.parametrize("url", ["/api/statistics?date=2019-01-15", "/api/statistics/by-zone?date=2019-01-16&hour=7",
+                                 "/api/statistics/trends", "/api/insights"])
+def test_clustered_build_answers_the_same(client, clustered, monkeypatch, url):
+    plain = client.get(url).get_json()
+    monkeypatch.setattr(db_connect, "DB_PATH", clustered)
+    assert client.get(url).get_json() == plain
+
+
+@pytest.fixture
+def compact(trips, make_db):
+    return make_db("compact.db", trips, compact=True)
+
+
+def test_compact_view_decodes_the_plain_rows(trips_db, compact, monkeypatch):
+    assert rows(compact, f"SELECT {COLUMNS} FROM trips ORDER BY id") == rows(trips_db, f"SELECT {COLUMNS} FROM trips ORDER BY id")
+    assert rows(compact, "SELECT COUNT(*) FROM trips WHERE pickup_ts != CAST(strftime('%s', tpep_pickup_datetime) "
+                         "AS INTEGER) OR dropoff_ts != CAST(strftime('%s', tpep_dropoff_datetime) AS INTEGER)") == [(0,)]
+    from utils.shards import compact_storage
+    for path, expected in ((trips_db, False), (compact, True)):
+        monkeypatch.setattr(db_connect, "DB_PATH", path)
+        assert compact_storage() is expected
+
+
+def test_compact_date_filter_searches_the_epoch_index(compact, monkeypatch):
+    from app import app
+    from routes.statistics import _build_where
+    monkeypatch.setattr(db_connect, "DB_PATH", compact)
+    with app.test_request_context("/?date=2019-01-15&hour=8"):
+        where, params = _build_where()
+    assert "strftime" not in where and "julianday" not in where
+    conn = sqlite3.connect(compact)
+    plan = " ".join(r[3] for r in conn.execute(f"EXPLAIN QUERY PLAN SELECT COUNT(*) FROM trips WHERE {where}", params))
+    conn.close()
+    assert "SEARCH" in plan and "idx_trips_pickup" in plan
+
+
+def test_both_layouts_define_every_time_expression():
+    from routes.statistics import TIME_SQL
+    assert TIME_SQL[False].keys() == TIME_SQL[True].keys()
+    assert "tpep_pickup_datetime" not in str(TIME_SQL[True]) and "t.pickup_ts" in TIME_SQL[True]["t_peak"]
+
+
+@pytest.mark.parametrize("url", ["/api/statistics", "/api/statistics?date=2019-01-15", "/api/statistics?hour=8",
+                                 "/api/statistics?date=2019-01-16&hour=18&borough=Manhattan",
+                                 "/api/statistics/by-borough?hour=7", "/api/statistics/trends",
+                                 "/api/statistics/trends?borough=Queens", "/api/statistics/peak-vs-offpeak",
+                                 "/api/insights", "/api/statistics/pickup-time-distribution?date=2019-01-15",
+                                 "/api/statistics/peak-hours",
+                                 "/api/statistics/percentiles?group_by=hour&min_fare=5",
+                                 "/api/trips?is_peak_hour=1&limit=50", "/api/trips?is_peak_hour=0&limit=50"])
+def test_compact_build_answers_the_same(client, compact, monkeypatch, url):
+    plain = client.get(url).get_json()
+    monkeypatch.setattr(db_connect, "DB_PATH", compact)
+    assert_same(client.get(url).get_json(), plain)
+
+
+def test_clustered_compact_build_answers_the_same(client, trips, make_db, monkeypatch):
+    plain = [client.get(url).get_json() for url in ("/api/statistics?date=2019-01-15", "/api/statistics/trends")]
+    monkeypatch.setattr(db_connect, "DB_PATH", make_db("compact.db", trips, compact=True, cluster=True))
+    assert_same([client.get(url).get_json() for url in ("/api/statistics?date=2019-01-15", "/api/statistics/trends")],
+                plain)
+
+
+LOADERS = {"snapshot": (snapshot.get_snapshot, "SNAPSHOT_DIR"), "sketches": (quantile_sketch.get_sketches, "SKETCH_DIR"),
+           "od": (od_matrix.get_od_matrix, "OD_DIR"), "bitmaps": (bitmap_index.get_bitmap_index, "BITMAP_DIR")}
+
+
+@pytest.mark.parametrize("name", list(LOADERS))
+def test_artifacts_built_from_other_data_are_ignored(trips, make_db, monkeypatch, tmp_path, name):
+    module, state, _, _ = ARTIFACTS[name]
+    get, dir_attr = LOADERS[name]
+    db = make_db("source.db", trips)
+    monkeypatch.setattr(db_connect, "DB_PATH", db)
+    monkeypatch.setattr(module, dir_attr, write_artifacts(db, str(tmp_path), [name])[name])
+
+    def load():
+        monkeypatch.setitem(getattr(module, state), "loaded", False)
+        return get()
+
+    assert load() is not None
+    conn = sqlite3.connect(db)
+    conn.execute(INSERT_SQL, trips[0])   # the database changed since the build
+    conn.commit()
+    conn.close()
+    assert load() is None
+    monkeypatch.setattr(db_connect, "DB_PATH", make_db("rebuilt.db", trips))   # same rows, another build
+    assert load() is None
+
+
+def test_build_removes_artifacts_it_does_not_rewrite(monkeypatch, tmp_path):
+    dirs = {name: tmp_path / name for name in build_db.ARTIFACTS}
+    for d in dirs.values():
+        d.mkdir()
+        (d / "manifest.json").write_text("{}")
+    monkeypatch.setattr(build_db, "ARTIFACT_DIRS", {name: str(d) for name, d in dirs.items()})
+    build_db.remove_artifacts(["od", "bitmaps"])
+    assert sorted(name for name, d in dirs.items() if d.exists()) == ["sketches", "snapshot"]
@@ -0,0 +1,49 @@
+import gzip
+import io
+import json
+
+import pyarrow as pa
+import pytest
+
+from utils.encoding import ARROW_STREAM, COLUMNAR_JSON
+
+
+def as_rows(columns, data):
+    return [dict(zip(columns, row)) for row in data]
+
+
+def test_columnar_and_arrow_match_row_json(client):
+    rows = client.get("/api/top-routes?limit=20").get_json()["routes"]
+    assert len(rows) == 20
+
+    columnar = client.get("/api/top-routes?limit=20&format=columnar")
+    assert columnar.mimetype == COLUMNAR_JSON
+    body = columnar.get_json(force=True)
+    assert as_rows(body["columns"], body["data"]) == rows
+
+    arrow = client.get("/api/top-routes?limit=20", headers={"Accept": ARROW_STREAM})
+    assert arrow.mimetype == ARROW_STREAM
+    assert "Accept" in arrow.headers["Vary"]
+    table = pa.ipc.open_stream(io.BytesIO(arrow.data)).read_all()
+    assert table.to_pylist() == rows
+
+
+def test_by_zone_columnar(client):
+    legacy = client.get("/api/statistics/by-zone").get_json()
+    body = client.get("/api/statistics/by-zone?format=columnar").get_json(force=True)
+    assert {str(z): n for z, n in body["data"]} == legacy
+
+
+@pytest.mark.parametrize("accept, compressed", [("gzip, deflate", True), ("identity", False)])
+def test_gzip_only_when_accepted(client, accept, compressed):
+    plain = client.get("/api/top-routes?limit=50").data
+    resp = client.get("/api/top-routes?limit=50", headers={"Accept-Encoding": accept})
+    assert (resp.headers.get("Content-Encoding") == "gzip") == compressed
+    assert (gzip.decompress(resp.data) if compressed else resp.data) == plain
+
+
+def test_small_bodies_stay_uncompressed(client):
+    resp = client.get("/api/top-routes?limit=1", headers={"Accept-Encoding": "gzip"})
+    assert len(resp.data) < 1024
+    assert "Content-Encoding" not in resp.headers
+    assert json.loads(resp.data)["count"] == 1
@@ -0,0 +1,151 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from conftest import make_raw_trips, write_artifacts
+from utils import db_connect, ingest, quantile_sketch
+from utils.od_matrix import ODMatrix
+from utils.quantile_sketch import SketchIndex
+from utils.trip_rules import clean_trip
+
+ZONES = set(range(1, 266))
+
+
+def raw_trip(**changes):
+    return {**make_raw_trips(1, seed=3)[0], **changes}
+
+
+def count_trips(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM trips").fetchone()[0]
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("changes, reason", [
+    ({"tpep_pickup_datetime": ""}, "missing pickup/dropoff time"),
+    ({"trip_distance": "1e400"}, "distance out of range"),
+    ({"fare_amount": "abc"}, "fare out of range"),
+    ({"PULocationID": None}, "missing location"),
+    ({"PULocationID": "900"}, "unknown location"),
+    ({"DOLocationID": "-4"}, "unknown location"),
+    ({"PULocationID": "266"}, "unknown location"),   # not in the zones table
+    ({"store_and_fwd_flag": "X"}, "invalid store_and_fwd_flag"),
+    ({"store_and_fwd_flag": "NN"}, "invalid store_and_fwd_flag"),
+    ({"store_and_fwd_flag": 1}, "invalid store_and_fwd_flag"),
+    ({"tpep_dropoff_datetime": "2019-01-13 00:00:00"}, "duration out of range"),
+])
+def test_clean_trip_rejects_malformed_rows(changes, reason):
+    assert clean_trip(raw_trip(**changes), ZONES) == (None, reason)
+
+
+@pytest.mark.parametrize("flag", ["Y", "N", "", None])
+def test_clean_trip_accepts_flags(flag):
+    trip, reason = clean_trip(raw_trip(store_and_fwd_flag=flag), ZONES)
+    assert reason is None and trip[6] == flag
+
+
+def test_ids_outside_the_sketch_slots_are_rejected_without_a_zone_list():
+    assert clean_trip(raw_trip(PULocationID="300"))[1] is None    # build_db keeps trips outside the lookup
+    assert clean_trip(raw_trip(PULocationID="512"))[1] == "unknown location"
+
+
+@pytest.fixture
+def writer(trips, make_db, monkeypatch):
+    """A TripWriter (not started) on a copy of the test database, used by the ingest route."""
+    path = make_db("ingest.db", trips[:500])
+    monkeypatch.setattr(db_connect, "DB_PATH", path)
+    w = ingest.TripWriter(db_path=path)
+    monkeypatch.setitem(ingest._writer, "value", w)
+    return w
+
+
+def test_batch_with_a_bad_row_keeps_the_good_rows(writer, trips):
+    seen = []
+    writer.add_listener(seen.extend)
+    bad = (10 ** 30,) + trips[600][1:]           # integer too large for SQLite
+    batch = [trips[500], bad, trips[501], trips[502][:-1]]   # and one tuple short of a column
+    conn = sqlite3.connect(writer.db_path)
+    writer._write(conn, batch)
+    conn.close()
+    assert count_trips(writer.db_path) == 502
+    assert seen == [trips[500], trips[501]]
+    assert (writer.stats["written"], writer.stats["failed"], writer.stats["batches"]) == (2, 2, 1)
+
+
+def test_database_errors_fail_the_whole_batch(writer, trips):
+    seen = []
+    writer.add_listener(seen.extend)
+    conn = sqlite3.connect(writer.db_path)
+    conn.execute("ALTER TABLE trips RENAME TO trips_old")
+    writer._write(conn, trips[500:510])
+    conn.close()
+    assert seen == [] and writer.stats["failed"] == 10 and writer.stats["written"] == 0
+
+
+def test_ingest_route_rejects_unknown_zones(client, writer):
+    body = [raw_trip(), raw_trip(PULocationID="900"), raw_trip(DOLocationID="-1"), raw_trip(store_and_fwd_flag="maybe")]
+    resp = client.post("/api/ingest/trips", json=body)
+    assert resp.status_code == 202
+    assert resp.get_json()["accepted"] == 1
+    assert [r["index"] for r in resp.get_json()["rejected"]] == [1, 2, 3]
+    writer.start().close()
+    assert count_trips(writer.db_path) == 501
+
+
+@pytest.fixture
+def live_aggregates(trips, make_db, tmp_path):
+    """(OD matrix, sketches) built from the first 2000 trips, and the same built from all of them."""
+    built = write_artifacts(make_db("first.db", trips[:2000]), str(tmp_path / "first"), ("od", "sketches"))
+    full = write_artifacts(make_db("all.db", trips), str(tmp_path / "all"), ("od", "sketches"))
+    return ((ODMatrix(built["od"]), SketchIndex(built["sketches"])),
+            (ODMatrix(full["od"]), SketchIndex(full["sketches"])))
+
+
+def test_ingested_trips_match_a_rebuild(trips, live_aggregates):
+    (od, sketches), (od_full, sketches_full) = live_aggregates
+    for i in range(2000, len(trips), 250):
+        od.add_trips(trips[i:i + 250])
+        sketches.add_trips(trips[i:i + 250])
+    for kw in ({}, {"date": "2019-01-15", "hour": 9}):
+        live, rebuilt = od.totals(**kw), od_full.totals(**kw)
+        for name in live:
+            assert np.allclose(live[name], rebuilt[name])
+    def by_day_at_six_pm(s):
+        cell_hour, _ = cells = s.cells()
+        return np.where(s.cell_mask(cells, hour=18), cell_hour // 24 - cell_hour.min() // 24, -1)
+
+    for metric in sketches.metrics:
+        assert np.array_equal(sketches.merge(metric, by_day_at_six_pm(sketches), 3),
+                              sketches_full.merge(metric, by_day_at_six_pm(sketches_full), 3))
+
+
+def test_delta_grows_per_cell_not_per_trip(trips, live_aggregates):
+    (od, sketches), _ = live_aggregates
+    batch = trips[2000:2100]
+    od.add_trips(batch)
+    sketches.add_trips(batch)
+    sizes = len(od._delta), len(sketches._delta_cells), len(sketches._delta["fare"])
+    for _ in range(20):
+        od.add_trips(batch)
+        sketches.add_trips(batch)
+    assert (len(od._delta), len(sketches._delta_cells), len(sketches._delta["fare"])) == sizes
+    assert sizes[0] <= len(batch)
+    assert od.totals()["count"].sum() == 2000 + 21 * len(batch)
+
+
+def test_ingested_trips_reach_the_percentiles(client, writer, use_artifacts, monkeypatch, tmp_path):
+    live = use_artifacts("sketches", dirs=write_artifacts(writer.db_path, str(tmp_path), ("sketches",)))["sketches"]
+    writer.add_listener(live.add_trips)
+    resp = client.post("/api/ingest/trips", json=[raw_trip(PULocationID="43"), raw_trip(PULocationID="900")])
+    assert resp.get_json()["accepted"] == 1
+    writer.start().close()
+    url = "/api/statistics/percentiles?group_by=borough"
+    sketched = client.get(url).get_json()
+    monkeypatch.setitem(quantile_sketch._sketches, "value", None)
+    scanned = client.get(url).get_json()
+    counts = lambda body: {g["borough"]: g["fare"]["count"] for g in body["groups"]}
+    assert counts(sketched) == counts(scanned)
+    assert len(live._delta_cells) == 1
@@ -0,0 +1,68 @@
+import pytest
+
+from conftest import assert_same, clean_trips, make_raw_trips, write_artifacts
+from utils import db_connect
+
+ROUTES = ["/api/top-routes?limit=25", "/api/flows/boroughs", "/api/flows/zones",
+          "/api/flows/zones/43?limit=5"]
+FILTERS = ["", "date=2019-01-15", "hour=8", "date=2019-01-15&hour=18", "borough=Manhattan",
+           "borough=Manhattan&dropoff_borough=Queens&date=2019-01-16",
+           # matches nothing on both paths
+           "hour=25", "hour=-1", "date=2019-01-15&hour=24", "date=2019-01-15T00", "date=2019-1-15", "date=2019-02-30"]
+
+
+@pytest.mark.parametrize("query", FILTERS)
+@pytest.mark.parametrize("route", ROUTES)
+def test_od_matches_sql(client, use_artifacts, route, query):
+    url = f"{route}{'&' if '?' in route else '?'}{query}"
+    scanned = client.get(url)
+    use_artifacts("od")
+    precomputed = client.get(url)
+    assert scanned.status_code == precomputed.status_code == 200
+    assert_same(precomputed.get_json(), scanned.get_json())
+
+
+@pytest.mark.parametrize("query", ["hour=25", "hour=-1", "date=2019-01-15T00"])
+def test_out_of_range_filters_match_nothing(client, use_artifacts, query):
+    use_artifacts("od")
+    assert client.get(f"/api/top-routes?{query}").get_json()["count"] == 0
+    assert client.get(f"/api/flows/boroughs?{query}").get_json() == []
+
+
+def test_valid_hour_is_not_wrapped(client, use_artifacts):
+    use_artifacts("od")
+    at_one = client.get("/api/flows/zones?hour=1").get_json()
+    assert at_one and at_one != client.get("/api/flows/zones?hour=25").get_json()
+
+
+def test_off_table_zone_ids_count_like_sql(client, make_db, use_artifacts, monkeypatch, tmp_path):
+    raw = make_raw_trips(200, seed=3)
+    for row in raw[:20]:   # 300 is a valid id with no zones row
+        row["PULocationID"], row["DOLocationID"] = "300", "43"
+    db = make_db("off_table.db", clean_trips(raw))
+    monkeypatch.setattr(db_connect, "DB_PATH", db)
+    urls = ["/api/flows/zones", "/api/flows/zones/43", "/api/top-routes?limit=25"]
+    scanned = [client.get(url).get_json() for url in urls]
+    od = use_artifacts("od", dirs=write_artifacts(db, str(tmp_path), ["od"]))["od"]
+    assert_same([client.get(url).get_json() for url in urls], scanned)
+
+    late = clean_trips(make_raw_trips(5, seed=4))
+    late = [t[:7] + (300, 43) + t[9:] for t in late]   # ingested after the build
+    before = od.totals()["count"][300, 43]
+    od.add_trips(late)
+    assert od.totals()["count"][300, 43] == before + len(late)
+
+
+def test_top_routes_keep_outside_nyc_and_drop_unknown(client, make_db, use_artifacts, monkeypatch, tmp_path):
+    raw = make_raw_trips(300, seed=5)
+    for row in raw[:40]:
+        row["PULocationID"], row["DOLocationID"] = "265", "265"   # borough 'N/A', Outside of NYC
+    for row in raw[40:80]:
+        row["PULocationID"], row["DOLocationID"] = "264", "264"   # borough 'Unknown'
+    db = make_db("outside.db", clean_trips(raw))
+    monkeypatch.setattr(db_connect, "DB_PATH", db)
+    scanned = client.get("/api/top-routes?limit=5").get_json()
+    use_artifacts("od", dirs=write_artifacts(db, str(tmp_path), ["od"]))
+    assert_same(client.get("/api/top-routes?limit=5").get_json(), scanned)
+    boroughs = {(r["pickup_borough"], r["dropoff_borough"]) for r in scanned["routes"]}
+    assert ("N/A", "N/A") in boroughs and ("Unknown", "Unknown") not in boroughs
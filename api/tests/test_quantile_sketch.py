@@ -0,0 +1,76 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from utils import quantile_sketch as qs
+from utils.quantile_sketch import METRICS, RELATIVE_ERROR
+
+QS = (0.1, 0.5, 0.9, 0.99)
+
+
+def column_values(db_path, sql):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def assert_close(estimates, values, rounding=0.0):
+    # quantiles() reads the element at rank floor(q * (n - 1)), i.e. numpy's "lower" method
+    exact = np.quantile(np.asarray(values, dtype=float), QS, method="lower")
+    for est, ref in zip(estimates, exact):
+        assert abs(est - ref) <= ref * RELATIVE_ERROR + rounding
+
+
+def test_quantiles_within_relative_error():
+    values = np.random.default_rng(1).lognormal(1.5, 1.0, 20_000)
+    counts = np.bincount(qs.bucket_index(values), minlength=qs.N_BUCKETS)
+    assert_close(qs.quantiles(counts, QS)[0], values)
+
+
+def test_chunked_build_merges_to_the_same_sketches(trips_db, artifact_dirs, tmp_path):
+    conn = sqlite3.connect(trips_db)
+    try:
+        qs.write_sketches(conn, str(tmp_path), chunk=97)
+    finally:
+        conn.close()
+    whole, chunked = qs.SketchIndex(artifact_dirs["sketches"]), qs.SketchIndex(str(tmp_path))
+    assert np.array_equal(whole.cell_hour, chunked.cell_hour)
+    for m in METRICS:
+        for a, b in zip(whole.entries[m], chunked.entries[m]):
+            assert np.array_equal(a, b)
+
+
+@pytest.mark.parametrize("group_by", [None, "zone"])
+def test_endpoint_quantiles_match_exact(client, use_artifacts, trips_db, group_by):
+    use_artifacts("sketches")
+    q = "&".join(f"q={x}" for x in QS)
+    body = client.get(f"/api/statistics/percentiles?{q}" + (f"&group_by={group_by}" if group_by else "")).get_json()
+    assert body["source"] == "sketch"
+    rows = column_values(trips_db, f"SELECT PULocationID, {', '.join(METRICS.values())} FROM trips")
+    for group in body["groups"]:
+        zone = group.get("zone")
+        for i, metric in enumerate(METRICS, start=1):
+            values = [r[i] for r in rows if r[i] is not None and (zone is None or r[0] == zone)]
+            assert group[metric]["count"] == len(values)
+            # the endpoint rounds to 2 decimals
+            assert_close([group[metric][f"p{x * 100:g}"] for x in QS], values, rounding=0.005)
+
+
+@pytest.mark.parametrize("query", ["date=2019-01-15&hour=7", "hour=23", "hour=24", "hour=-1", "date=2019-01-15T00"])
+def test_time_filters_count_the_same_trips_as_sql(client, use_artifacts, query):
+    counts = lambda body: [(g.get("hour"), g["fare"]["count"]) for g in body["groups"]]
+    scanned = client.get(f"/api/statistics/percentiles?group_by=hour&{query}").get_json()
+    use_artifacts("sketches")
+    sketched = client.get(f"/api/statistics/percentiles?group_by=hour&{query}").get_json()
+    assert (scanned["source"], sketched["source"]) == ("scan", "sketch")
+    assert counts(sketched) == counts(scanned)
+
+
+@pytest.mark.parametrize("q", ["abc", "-0.1", "1.5", "nan", "inf"])
+def test_bad_quantiles_are_rejected(client, use_artifacts, q):
+    use_artifacts("sketches")
+    resp = client.get(f"/api/statistics/percentiles?q=0.5&q={q}")
+    assert resp.status_code == 400 and "error" in resp.get_json()
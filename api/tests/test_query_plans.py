@@ -0,0 +1,43 @@
+import json
+import os
+
+import pytest
+
+import check_query_plans as guard
+from conftest import ARTIFACTS
+from utils import db_connect
+
+LIVE_DB = os.path.join(guard.HERE, "data", "taxi_mock.db")
+
+
+@pytest.fixture
+def capture(monkeypatch):
+    """guard.capture, with the DB path and artifact caches it overwrites restored afterwards."""
+    monkeypatch.setattr(db_connect, "DB_PATH", db_connect.DB_PATH)
+    for module, state, _, _ in ARTIFACTS.values():
+        for key in ("loaded", "value"):
+            monkeypatch.setitem(getattr(module, state), key, getattr(module, state)[key])
+    return guard.capture
+
+
+def failing(results):
+    return sorted(key for key, entry in results.items() if entry["status"] != 200)
+
+
+def test_baseline_has_no_failing_routes():
+    with open(guard.BASELINE_PATH, encoding="utf-8") as f:
+        assert failing(json.load(f)["routes"]) == []
+
+
+def test_every_route_answers_on_a_fresh_build(capture, trips_db):
+    results = capture(trips_db)
+    assert failing(results) == []
+    assert all(entry["statements"] for key, entry in results.items())
+
+
+@pytest.mark.skipif(not os.path.exists(LIVE_DB), reason="needs api/data/taxi_mock.db (python3 build_db.py)")
+def test_plans_match_the_baseline(capture):
+    with open(guard.BASELINE_PATH, encoding="utf-8") as f:
+        baseline = json.load(f)["routes"]
+    regressions, _ = guard.compare(baseline, capture(LIVE_DB))
+    assert regressions == []
@@ -0,0 +1,71 @@
+import json
+import sqlite3
+
+import pytest
+
+from utils import shards
+
+GROUPED = ("SELECT PULocationID AS zone, COUNT(*) AS n, SUM(total_amount) AS fare, "
+           "SUM(tip_amount) AS tip FROM trips GROUP BY zone")
+
+
+def query(path, sql, params=()):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        return [dict(r) for r in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def sharded(trips, make_db, tmp_path, monkeypatch):
+    """One shard per pickup day plus its manifest, with TAXI_STORAGE=sharded."""
+    days = sorted({t[1][:10] for t in trips})
+    manifest = {"granularity": "day", "shards": []}
+    for day in days:
+        make_db(f"trips_{day}.db", [t for t in trips if t[1].startswith(day)])
+        manifest["shards"].append({"file": f"trips_{day}.db", "start": day, "end": day})
+    (tmp_path / "manifest.json").write_text(json.dumps(manifest))
+    monkeypatch.setattr(shards, "SHARD_DIR", str(tmp_path))
+    monkeypatch.setattr(shards, "MANIFEST_PATH", str(tmp_path / "manifest.json"))
+    monkeypatch.setitem(shards._manifest, "mtime", None)
+    monkeypatch.setenv("TAXI_STORAGE", "sharded")
+    return days
+
+
+def test_merge_partials_matches_single_db(trips_db, sharded):
+    partials = [query(p, GROUPED) for p in shards.shard_paths()]
+    assert len(partials) == len(sharded)
+    merged = {r["zone"]: r for r in shards.merge_partials(partials, keys=("zone",))}
+    single = {r["zone"]: r for r in query(trips_db, GROUPED)}
+    assert merged.keys() == single.keys()
+    for zone, row in single.items():
+        assert merged[zone]["n"] == row["n"]
+        assert merged[zone]["fare"] == pytest.approx(row["fare"])
+        assert merged[zone]["tip"] == pytest.approx(row["tip"])
+
+
+def test_merge_partials_skips_nulls():
+    merged = shards.merge_partials([[{"k": 1, "s": None}], [{"k": 1, "s": 2.5}], [{"k": 2, "s": 1.0}]],
+                                   keys=("k",))
+    assert sorted((r["k"], r["s"]) for r in merged) == [(1, 2.5), (2, 1.0)]
+
+
+def test_date_prunes_to_one_shard(sharded):
+    assert [p.rsplit("_", 1)[1] for p in shards.shard_paths("2019-01-15")] == ["2019-01-15.db"]
+    assert shards.shard_paths("2019-02-01") == []
+
+
+@pytest.mark.parametrize("route", ["/api/statistics", "/api/statistics/by-borough",
+                                   "/api/statistics/by-zone?date=2019-01-15",
+                                   "/api/statistics/fare-distribution?borough=Manhattan"])
+def test_sharded_endpoint_matches_single_db(client, sharded, monkeypatch, route):
+    sharded_body = client.get(route).get_json()
+    monkeypatch.delenv("TAXI_STORAGE")
+    assert sharded_body == client.get(route).get_json()
+
+
+def test_sharded_percentiles_scan_the_shards(client, sharded, use_artifacts):
+    use_artifacts("sketches")   # built from taxi_mock.db, not the shards
+    assert client.get("/api/statistics/percentiles?group_by=hour").get_json()["source"] == "scan"
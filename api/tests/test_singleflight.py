@@ -0,0 +1,106 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from flask import Flask, jsonify, request
+
+from utils import singleflight
+from utils.singleflight import SingleFlight, coalesce
+
+N = 8
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def requests(stats, route):
+    return stats().get(route, {}).get("requests", 0)
+
+
+def test_concurrent_calls_share_one_execution():
+    flights, release, calls = SingleFlight(), threading.Event(), []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    with ThreadPoolExecutor(N) as pool:
+        futures = [pool.submit(flights.do, "route", "key", slow) for _ in range(N)]
+        wait_for(lambda: requests(flights.stats, "route") == N)
+        release.set()
+        assert [f.result() for f in futures] == ["result"] * N
+    assert len(calls) == 1
+    assert flights.stats()["route"] == {"requests": N, "executions": 1, "coalesced": N - 1}
+    assert flights.do("route", "key", lambda: "fresh") == "fresh"   # nothing is cached
+
+
+def test_waiters_get_the_leaders_error():
+    flights, release = SingleFlight(), threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise RuntimeError("boom")
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(flights.do, "route", "key", failing)
+        wait_for(lambda: requests(flights.stats, "route") == 1)
+        waiter = pool.submit(flights.do, "route", "key", lambda: "never")
+        wait_for(lambda: requests(flights.stats, "route") == 2)
+        release.set()
+        for f in (leader, waiter):
+            with pytest.raises(RuntimeError):
+                f.result()
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(singleflight, "_flights", SingleFlight())
+    app = Flask(__name__)
+    release, runs = threading.Event(), []
+
+    @app.route("/stats")
+    @coalesce
+    def stats():
+        runs.append(1)
+        release.wait(5)
+        return jsonify({"runs": len(runs), "q": request.args.getlist("q")})
+
+    app.release, app.runs = release, runs
+    return app
+
+
+def get(app, url, **headers):
+    with app.test_client() as client:
+        resp = client.get(url, headers=headers)
+        return resp.status_code, resp.get_json(force=True)
+
+
+def test_identical_requests_coalesce_and_different_ones_do_not(app):
+    with ThreadPoolExecutor(N) as pool:
+        same = [pool.submit(get, app, "/stats?borough=Queens&borough=Bronx&date=2019-01-15") for _ in range(3)]
+        same.append(pool.submit(get, app, "/stats?date=2019-01-15&borough=Queens&borough=Bronx"))   # same filters
+        other = pool.submit(get, app, "/stats?date=2019-01-16")
+        columnar = pool.submit(get, app, "/stats?date=2019-01-15&borough=Queens&borough=Bronx&format=columnar")
+        wait_for(lambda: requests(singleflight.coalescing_stats, "stats") == 6)
+        app.release.set()
+        results = [f.result() for f in same + [other, columnar]]
+    assert all(status == 200 for status, _ in results)
+    assert len(app.runs) == 3
+    assert singleflight.coalescing_stats()["stats"] == {"requests": 6, "executions": 3, "coalesced": 3}
+
+
+def test_repeated_arg_order_is_part_of_the_key(app):
+    with ThreadPoolExecutor(2) as pool:
+        ascending = pool.submit(get, app, "/stats?q=0.5&q=0.9")
+        descending = pool.submit(get, app, "/stats?q=0.9&q=0.5")
+        wait_for(lambda: requests(singleflight.coalescing_stats, "stats") == 2)
+        app.release.set()
+        assert ascending.result()[1]["q"] == ["0.5", "0.9"]
+        assert descending.result()[1]["q"] == ["0.9", "0.5"]
+    assert singleflight.coalescing_stats()["stats"]["executions"] == 2
@@ -0,0 +1,28 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from utils.snapshot import Snapshot, write_snapshot
+
+
+def test_columns_match_trips_table(trips_db, artifact_dirs):
+    snap = Snapshot(artifact_dirs["snapshot"])
+    conn = sqlite3.connect(trips_db)
+    ids, pickup, pu, fare = map(np.array, zip(*conn.execute(
+        "SELECT id, tpep_pickup_datetime, PULocationID, total_amount FROM trips ORDER BY id")))
+    conn.close()
+    assert snap.rows == len(ids) and snap.row_base == ids[0]
+    assert (snap["pickup_ts"] == pickup.astype("datetime64[s]")).all()
+    assert (snap["PULocationID"] == pu).all()
+    assert np.allclose(snap["total_amount"], fare.astype(float), atol=1e-4)
+    pos = snap.positions(ids[[0, -1]])
+    assert pos.tolist() == [0, len(ids) - 1]
+
+
+def test_rejects_non_contiguous_ids(trips, make_db, tmp_path):
+    conn = sqlite3.connect(make_db("gaps.db", trips[:10]))
+    conn.execute("DELETE FROM trips WHERE id = 5")
+    with pytest.raises(ValueError):
+        write_snapshot(conn, str(tmp_path / "snapshot"))
+    conn.close()
@@ -0,0 +1,69 @@
+import gzip
+import os
+
+import pytest
+from flask import Flask
+
+from utils.compression import init_compression
+from utils.static_assets import CACHE_DEFAULT, CACHE_VERSIONED, AssetCache, init_frontend
+
+FRONTEND_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "frontend")
+INDEX = ('<html><head><meta name="api-base" content="http://localhost:5002">'
+         '<link href="styles.css"><script src="app.js"></script><script src="https://cdn.example/x.js"></script>'
+         '</head></html>')
+
+
+@pytest.fixture
+def site(tmp_path):
+    (tmp_path / "index.html").write_text(INDEX)
+    (tmp_path / "app.js").write_text("console.log('dashboard');\n" * 200)
+    (tmp_path / "styles.css").write_text("body{}")
+    (tmp_path / ".hidden").write_text("x")
+    return tmp_path
+
+
+def test_index_links_versioned_assets(site):
+    cache = AssetCache(str(site), api_base="")
+    html = cache.get(None).data.decode()
+    assert f'src="app.js?v={cache.get("app.js").version}"' in html
+    assert f'href="styles.css?v={cache.get("styles.css").version}"' in html
+    assert 'src="https://cdn.example/x.js"' in html
+    assert 'content=""' in html
+    assert cache.get(".hidden") is None
+
+
+def test_gzip_etag_and_cache_headers(site):
+    js = AssetCache(str(site)).get("app.js")
+    status, headers, body = js.respond("gzip, br", version=js.version)
+    assert status == 200 and headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(body) == js.data
+    assert headers["Cache-Control"] == CACHE_VERSIONED
+    plain = js.respond("", version="stale")
+    assert plain[2] == js.data and plain[1]["Cache-Control"] == CACHE_DEFAULT
+    assert plain[1]["ETag"] != headers["ETag"]
+    assert js.respond("gzip", if_none_match=f'W/{headers["ETag"]}')[0] == 304
+    assert js.respond("", if_none_match=headers["ETag"])[0] == 200   # the gzip tag doesn't match the plain body
+
+
+def test_small_files_are_not_compressed(site):
+    css = AssetCache(str(site)).get("styles.css")
+    status, headers, body = css.respond("gzip")
+    assert css.gzip is None and "Content-Encoding" not in headers and body == css.data
+
+
+def test_single_port_routes(site):
+    app = init_compression(Flask(__name__))
+    index = init_frontend(app, str(site))
+    app.add_url_rule("/", "home", index)
+    client = app.test_client()
+    resp = client.get("/app.js", headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(resp.data).startswith(b"console.log")   # compressed once, not again by the middleware
+    assert b'content=""' in client.get("/").data
+    assert client.get("/missing.js").status_code == 404
+
+
+def test_real_frontend_loads():
+    cache = AssetCache(FRONTEND_DIR)
+    assert {"index.html", "app.js", "styles.css"} <= cache.assets.keys()
+    assert f'app.js?v={cache.get("app.js").version}' in cache.get("index.html").data.decode()
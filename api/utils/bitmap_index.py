@@ -0,0 +1,228 @@
+import json
+import os
+
+import numpy as np
+
+from utils.source_stamp import built_from_current_db, source_stamp
+
+# Compressed bitmap indexes over trip row positions (trip id - row_base),
+# written by build_db.py next to the columnar snapshot.
+#
+# Roaring-style layout: each bitmap is split into chunks of 2^16 rows and
+# every non-empty chunk is one container, either a sorted uint16 array of
+# the set positions (cardinality < ARRAY_MAX) or a 1024-word uint64 bitset.
+# All containers of an index dimension live in a few flat .npy files:
+#   <dim>_values  value of each bitmap (sorted)
+#   <dim>_start   bitmap i owns containers start[i]:start[i + 1]
+#   <dim>_chunk / <dim>_card / <dim>_offset  per container; offset points
+#                 into <dim>_arrays (array containers) or <dim>_words rows
+# so the whole index is np.load(mmap_mode='r')-able. Queries OR the bitmaps
+# of one dimension into a dense bitset and AND dimensions together.
+BITMAP_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'data', 'bitmaps'))
+MANIFEST = 'manifest.json'
+
+CHUNK_BITS = 16
+CHUNK_WORDS = (1 << CHUNK_BITS) // 64
+ARRAY_MAX = 4096
+
+# dimension -> (SQL expression, bucket width, top bucket). Fare and distance
+# buckets are floor(value / width) clipped to [0, top]; the top bucket holds
+# everything above the dashboard slider range.
+DIMENSIONS = {
+    "date":     ("CAST(strftime('%s', tpep_pickup_datetime) AS INTEGER) / 86400", None, None),
+    "hour":     ("CAST(strftime('%H', tpep_pickup_datetime) AS INTEGER)", None, None),
+    "zone":     ("PULocationID", None, None),
+    "fare":     ("total_amount", 1.0, 250),
+    "distance": ("trip_distance", 0.1, 500),
+}
+
+
+def value_bucket(dim, values):
+    _, width, top = DIMENSIONS[dim]
+    v = np.asarray(values, dtype=np.float64)
+    return np.clip(np.floor(np.nan_to_num(v, nan=0.0) / width), 0, top).astype(np.int64)
+
+
+def _build_dimension(pos, values, n_chunks):
+    # containers sorted by (value, chunk); positions are already ascending per value
+    order = np.argsort(values, kind="stable")
+    pos, values = pos[order], values[order]
+    keys = values * n_chunks + (pos >> CHUNK_BITS)
+    first = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    card = np.diff(np.r_[first, len(keys)])
+    chunk = (keys[first] % n_chunks).astype(np.uint32)
+    container_value = values[first]
+    low = (pos & 0xFFFF).astype(np.uint16)
+
+    is_array = card < ARRAY_MAX
+    owner = np.repeat(np.arange(len(first)), card)   # container of each element
+    elem_array = is_array[owner]
+    arrays = low[elem_array]
+    array_offsets = np.cumsum(np.r_[0, card[is_array]])[:-1]
+    bitmap_rank = np.cumsum(~is_array) - 1
+    bits = np.zeros(int((~is_array).sum()) << CHUNK_BITS, dtype=bool)
+    bits[(bitmap_rank[owner[~elem_array]] << CHUNK_BITS) + low[~elem_array]] = True
+    words = np.packbits(bits, bitorder="little").view(np.uint64).reshape(-1, CHUNK_WORDS)
+    offset = np.where(is_array, 0, bitmap_rank).astype(np.int64)
+    offset[is_array] = array_offsets
+
+    bitmap_values, starts = np.unique(container_value, return_index=True)
+    return {"values": bitmap_values.astype(np.int64), "start": np.r_[starts, len(first)].astype(np.int64),
+            "chunk": chunk, "card": card.astype(np.uint32), "offset": offset,
+            "arrays": arrays, "words": words}
+
+
+def write_bitmap_index(conn, out_dir=BITMAP_DIR):
+    """Build one bitmap per date, hour, pickup zone, fare bucket and distance bucket."""
+    lo, hi, n = conn.execute("SELECT MIN(id), MAX(id), COUNT(*) FROM trips").fetchone()
+    if n and hi - lo + 1 != n:
+        raise ValueError("trips ids are not contiguous; rebuild the database before indexing")
+    lo = lo or 1
+    n_chunks = max((n + (1 << CHUNK_BITS) - 1) >> CHUNK_BITS, 1)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {"rows": n, "row_base": lo, "max_id": hi or 0, "chunks": n_chunks, "dimensions": {},
+                "source": source_stamp(conn)}
+    for dim, (expr, width, top) in DIMENSIONS.items():
+        cur = conn.execute(f"SELECT {expr} FROM trips ORDER BY id")
+        raw = np.fromiter((r[0] for r in cur), dtype=np.float64, count=n)
+        values = raw.astype(np.int64) if width is None else value_bucket(dim, raw)
+        arrays = _build_dimension(np.arange(n, dtype=np.int64), values, n_chunks)
+        for name, arr in arrays.items():
+            np.save(os.path.join(out_dir, f"{dim}_{name}.npy"), arr)
+        manifest["dimensions"][dim] = {"bitmaps": len(arrays["values"]), "containers": len(arrays["chunk"]),
+                                       "bitset_containers": len(arrays["words"]), "width": width, "top": top}
+    with open(os.path.join(out_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+class BitmapIndex:
+    def __init__(self, path):
+        with open(os.path.join(path, MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.rows = manifest["rows"]
+        self.row_base = manifest["row_base"]
+        self.max_id = manifest["max_id"]
+        self.chunks = manifest["chunks"]
+        load = lambda name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        self.dims = {dim: {part: load(f"{dim}_{part}")
+                           for part in ("values", "start", "chunk", "card", "offset", "arrays", "words")}
+                     for dim in manifest["dimensions"]}
+
+    def empty(self):
+        return np.zeros((self.chunks, CHUNK_WORDS), dtype=np.uint64)
+
+    def full(self):
+        """Bitset of every indexed row."""
+        mask = np.zeros(self.chunks * CHUNK_WORDS * 64, dtype=bool)
+        mask[:self.rows] = True
+        return np.packbits(mask, bitorder="little").view(np.uint64).reshape(self.chunks, CHUNK_WORDS)
+
+    def _containers(self, dim, values):
+        d = self.dims[dim]
+        idx = np.searchsorted(d["values"], values)
+        idx = idx[(idx < len(d["values"])) & (d["values"][np.minimum(idx, len(d["values"]) - 1)] == values)]
+        if not len(idx):
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(d["start"][i], d["start"][i + 1]) for i in idx])
+
+    def _array_positions(self, d, containers):
+        """Row positions held by the given array containers, container by container."""
+        card = d["card"][containers].astype(np.int64)
+        owner = np.repeat(np.arange(len(containers)), card)
+        within = np.arange(card.sum()) - np.repeat(np.cumsum(card) - card, card)
+        low = d["arrays"][d["offset"][containers][owner] + within].astype(np.int64)
+        return (d["chunk"][containers][owner].astype(np.int64) << CHUNK_BITS) | low
+
+    def _or_bitsets(self, out, d, containers):
+        # containers of different bitmaps may share a chunk: OR them per chunk first
+        chunk = d["chunk"][containers].astype(np.int64)
+        order = np.argsort(chunk, kind="stable")
+        chunk, rows = chunk[order], d["words"][d["offset"][containers[order]]]
+        first = np.flatnonzero(np.r_[True, chunk[1:] != chunk[:-1]])
+        out[chunk[first]] |= np.bitwise_or.reduceat(rows, first, axis=0)
+
+    def select(self, dim, values):
+        """Dense bitset (chunks x 1024 uint64) of the rows whose `dim` is any of `values`."""
+        d = self.dims[dim]
+        c = self._containers(dim, np.asarray(sorted(set(values)), dtype=np.int64))
+        is_array = d["card"][c] < ARRAY_MAX
+        mask = np.zeros(self.chunks << CHUNK_BITS, dtype=bool)
+        mask[self._array_positions(d, c[is_array])] = True
+        out = np.packbits(mask, bitorder="little").view(np.uint64).reshape(self.chunks, CHUNK_WORDS)
+        if (~is_array).any():
+            self._or_bitsets(out, d, c[~is_array])
+        return out
+
+    def select_range(self, dim, lo, hi, column):
+        """Rows with lo <= value <= hi (either bound may be None).
+
+        Buckets strictly inside the range are taken whole; the rows of the
+        one or two boundary buckets are checked against `column` (the
+        snapshot's float64 array of the exact values, indexed by row position).
+        """
+        d = self.dims[dim]
+        b_lo = int(value_bucket(dim, lo)) if lo is not None else None
+        b_hi = int(value_bucket(dim, hi)) if hi is not None else None
+        values = np.asarray(d["values"])
+        inner = np.ones(len(values), dtype=bool)
+        if b_lo is not None:
+            inner &= values > b_lo
+        if b_hi is not None:
+            inner &= values < b_hi
+        out = self.select(dim, values[inner])
+        for b in {b for b in (b_lo, b_hi) if b is not None}:
+            pos = self.positions(self.select(dim, [b]))
+            v = column[pos]
+            keep = np.ones(len(pos), dtype=bool)
+            if lo is not None:
+                keep &= v >= lo
+            if hi is not None:
+                keep &= v <= hi
+            self._set(out, pos[keep])
+        return out
+
+    def _set(self, out, pos):
+        mask = np.zeros(self.chunks << CHUNK_BITS, dtype=bool)
+        mask[pos] = True
+        out |= np.packbits(mask, bitorder="little").view(np.uint64).reshape(self.chunks, CHUNK_WORDS)
+
+    def _unpack(self, bits):
+        return np.unpackbits(bits.view(np.uint8), bitorder="little").view(bool)
+
+    def positions(self, bits):
+        return np.flatnonzero(self._unpack(bits))
+
+    def count(self, bits):
+        return int(np.bitwise_count(bits).sum())
+
+    def count_by(self, dim, bits):
+        """{value: rows of `bits` whose `dim` equals value} for every value of the dimension."""
+        d = self.dims[dim]
+        n = len(d["chunk"])
+        counts = np.zeros(n, dtype=np.int64)
+        card = np.asarray(d["card"])
+        bitsets = np.flatnonzero(card >= ARRAY_MAX)
+        if len(bitsets):
+            counts[bitsets] = np.bitwise_count(bits[d["chunk"][bitsets].astype(np.int64)] &
+                                               d["words"][d["offset"][bitsets]]).sum(axis=1)
+        arrays = np.flatnonzero(card < ARRAY_MAX)
+        if len(arrays):
+            hit = self._unpack(bits)[self._array_positions(d, arrays)]
+            starts = np.cumsum(card[arrays].astype(np.int64)) - card[arrays]
+            counts[arrays] = np.add.reduceat(hit.astype(np.int64), starts)
+        per_value = np.add.reduceat(counts, d["start"][:-1]) if n else counts
+        return dict(zip(d["values"].tolist(), per_value.tolist()))
+
+
+_bitmaps = {"loaded": False, "value": None}
+
+
+def get_bitmap_index():
+    """The mapped bitmap index, or None when build_db.py has not written one
+    from the current taxi_mock.db."""
+    if not _bitmaps["loaded"]:
+        path = BITMAP_DIR
+        _bitmaps["value"] = BitmapIndex(path) if built_from_current_db(path, MANIFEST) else None
+        _bitmaps["loaded"] = True
+    return _bitmaps["value"]
@@ -0,0 +1,38 @@
+import numpy as np
+
+# Running per-cell sums for the in-memory deltas of the precomputed
+# aggregates (OD matrix, quantile sketches). A cell is an integer key such as
+# epoch hour x zone pair. The first time a key is seen it gets the next slot
+# and keeps it, so memory grows with the distinct cells touched since
+# startup rather than with the number of ingested trips, and slots are only
+# ever appended. Not thread-safe: the owning aggregate adds and reads under
+# its own lock.
+
+
+class CellSums:
+    def __init__(self, n_values):
+        self._slots = {}   # key -> slot
+        self._keys = np.empty(0, np.int64)
+        self._values = np.zeros((0, n_values))
+
+    def __len__(self):
+        return len(self._slots)
+
+    def add(self, keys, values):
+        """Add `values` (n x n_values) into the cells `keys` (n); returns each row's slot."""
+        uniq, inverse = np.unique(np.asarray(keys, dtype=np.int64), return_inverse=True)
+        slots = np.array([self._slots.setdefault(int(k), len(self._slots)) for k in uniq], dtype=np.int64)
+        n = len(self._slots)
+        if n > len(self._keys):   # grow by doubling
+            size = max(n, 2 * len(self._keys), 64)
+            keys_, values_ = np.empty(size, np.int64), np.zeros((size, self._values.shape[1]))
+            keys_[:len(self._keys)], values_[:len(self._values)] = self._keys, self._values
+            self._keys, self._values = keys_, values_
+        self._keys[slots] = uniq
+        np.add.at(self._values, slots[inverse], values)
+        return slots[inverse]
+
+    def snapshot(self):
+        """(keys, values) of every cell in slot order, copied."""
+        n = len(self._slots)
+        return self._keys[:n].copy(), self._values[:n].copy()
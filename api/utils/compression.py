@@ -0,0 +1,34 @@
+import gzip
+
+from flask import request
+
+# gzip middleware: responses at least MIN_SIZE bytes are compressed when the
+# client sends Accept-Encoding: gzip. Smaller bodies aren't worth the CPU.
+MIN_SIZE = 1024
+LEVEL = 6
+
+# already-compressed payloads gain nothing from gzip
+_SKIP_MIMETYPES = ('image/', 'video/', 'audio/', 'application/zip', 'application/gzip')
+
+
+def init_compression(app, min_size=MIN_SIZE, level=LEVEL):
+    @app.after_request
+    def compress(response):
+        if (response.status_code != 200
+                or 'Content-Encoding' in response.headers
+                or response.mimetype.startswith(_SKIP_MIMETYPES)
+                or 'gzip' not in request.headers.get('Accept-Encoding', '').lower()):
+            return response
+        response.direct_passthrough = False   # send_file: buffer the file so it can be compressed
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        response.set_data(gzip.compress(data, compresslevel=level))
+        response.headers['Content-Encoding'] = 'gzip'
+        etag, _ = response.get_etag()
+        if etag:   # the body changed, so a strong validator would be wrong
+            response.set_etag(etag, weak=True)
+        response.vary.add('Accept-Encoding')
+        return response
+
+    return app
@@ -1,15 +1,24 @@
 import sqlite3
 import os
 
-def get_db_connection():
-    # Use the mock DB created from sample_trips.parquet
-    db_path = os.path.join(
-        os.path.dirname(__file__),
-        '..', 'data', 'taxi_mock.db'
-    )
+# Use the mock DB created from sample_trips.parquet
+DB_PATH = os.path.join(
+    os.path.dirname(__file__),
+    '..', 'data', 'taxi_mock.db'
+)
+
+# Optional callback passed every SQL statement the API runs (see
+# check_query_plans.py); None in normal operation.
+_statement_trace = {"fn": None}
 
-    conn = sqlite3.connect(db_path)
+def set_statement_trace(fn):
+    _statement_trace["fn"] = fn
+
+def get_db_connection():
+    conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
+    if _statement_trace["fn"] is not None:
+        conn.set_trace_callback(_statement_trace["fn"])
     return conn
 
 def dict_from_row(row):
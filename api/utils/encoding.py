@@ -0,0 +1,44 @@
+import io
+
+from flask import Response, jsonify, request
+import pyarrow as pa
+
+# Alternative encodings for the row-heavy endpoints. Clients opt in with
+# ?format=columnar|arrow or an Accept header; everything else gets the
+# original per-row JSON.
+COLUMNAR_JSON = 'application/vnd.columnar+json'
+ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+
+_FORMATS = {'columnar': COLUMNAR_JSON, 'arrow': ARROW_STREAM, 'json': 'application/json'}
+
+
+def negotiated_format():
+    """'columnar', 'arrow' or 'json' for the current request."""
+    fmt = request.args.get('format')
+    if fmt in _FORMATS:
+        return fmt
+    best = request.accept_mimetypes.best_match(
+        ['application/json', COLUMNAR_JSON, ARROW_STREAM], default='application/json')
+    return {v: k for k, v in _FORMATS.items()}[best]
+
+
+def tabular_response(columns, data, legacy):
+    """Encode rows (lists in `columns` order) in the negotiated format.
+
+    `legacy` builds the original JSON body and is only called for plain JSON
+    requests.
+    """
+    fmt = negotiated_format()
+    if fmt == 'columnar':
+        resp = jsonify({"columns": columns, "data": data})
+        resp.mimetype = COLUMNAR_JSON
+    elif fmt == 'arrow':
+        table = pa.table({c: [row[i] for row in data] for i, c in enumerate(columns)})
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        resp = Response(sink.getvalue(), mimetype=ARROW_STREAM)
+    else:
+        return legacy()
+    resp.vary.add('Accept')
+    return resp
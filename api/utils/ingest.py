@@ -0,0 +1,147 @@
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from utils.db_connect import DB_PATH
+from utils.trip_rules import INSERT_SQL
+
+# Write-behind for POST /api/ingest/trips: request threads only validate and
+# enqueue; one writer thread owns the only write connection and commits
+# everything queued in a single transaction, at least every FLUSH_INTERVAL
+# seconds or as soon as BATCH_SIZE trips are waiting. taxi_mock.db is in WAL
+# mode, so the API's readers keep reading the last committed state meanwhile.
+MAX_PENDING = 200_000    # queued trips before submit() starts refusing (backpressure)
+BATCH_SIZE = 20_000
+FLUSH_INTERVAL = 1.0     # seconds
+
+# errors one bad row raises (constraint, type, integer range); a batch that
+# fails with one of these is retried row by row. Anything else (locked or
+# full database) fails the whole batch.
+ROW_ERRORS = (sqlite3.IntegrityError, sqlite3.InterfaceError, sqlite3.ProgrammingError,
+              sqlite3.DataError, OverflowError)
+
+
+class TripWriter:
+    def __init__(self, db_path=DB_PATH, max_pending=MAX_PENDING, batch_size=BATCH_SIZE,
+                 interval=FLUSH_INTERVAL):
+        self.db_path = db_path
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.interval = interval
+        self.listeners = []     # called with each committed batch of INSERT_SQL tuples
+        self.stats = {"accepted": 0, "written": 0, "batches": 0, "failed": 0,
+                      "last_flush": None, "last_error": None}
+        self._queue = deque()
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = None
+
+    def add_listener(self, fn):
+        self.listeners.append(fn)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="trip-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def submit(self, trips):
+        """Queue validated trips; False (nothing queued) when the queue is full."""
+        with self._cond:
+            if self._pending + len(trips) > self.max_pending:
+                return False
+            self._queue.append(trips)
+            self._pending += len(trips)
+            self.stats["accepted"] += len(trips)
+            if self._pending >= self.batch_size:
+                self._cond.notify()
+        return True
+
+    def close(self):
+        """Flush whatever is queued and stop the writer thread."""
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous  = NORMAL")
+        conn.execute("PRAGMA busy_timeout = 5000")
+        try:
+            while True:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._stop or self._pending >= self.batch_size,
+                                        timeout=self.interval)
+                    batches, stop = list(self._queue), self._stop
+                    self._queue.clear()
+                    self._pending = 0
+                if batches:
+                    self._write(conn, [t for b in batches for t in b])
+                if stop:
+                    break
+        finally:
+            conn.close()
+
+    def _write(self, conn, trips):
+        errors = []
+        try:
+            try:
+                with conn:   # one transaction per flush
+                    conn.executemany(INSERT_SQL, trips)
+                written = trips
+            except ROW_ERRORS:
+                written, errors = self._write_rows(conn, trips)
+        except sqlite3.Error as e:
+            self._failed(len(trips), e)
+            print(f"[ingest] dropped {len(trips):,} trips: {e}")
+            return
+        if errors:
+            self._failed(len(errors), errors[-1])
+            print(f"[ingest] dropped {len(errors):,} of {len(trips):,} trips: {errors[-1]}")
+        if not written:
+            return
+        self.stats["written"] += len(written)
+        self.stats["batches"] += 1
+        self.stats["last_flush"] = time.time()
+        for fn in self.listeners:
+            try:
+                fn(written)
+            except Exception as e:   # a broken aggregate must not stop ingestion
+                self.stats["last_error"] = f"{getattr(fn, '__qualname__', fn)}: {e}"
+                print(f"[ingest] listener failed: {self.stats['last_error']}")
+
+    def _write_rows(self, conn, trips):
+        """Insert one row at a time in one transaction, skipping the rows that fail; (written, errors)."""
+        written, errors = [], []
+        with conn:
+            for trip in trips:
+                try:
+                    conn.execute(INSERT_SQL, trip)
+                except ROW_ERRORS as e:
+                    errors.append(e)
+                else:
+                    written.append(trip)
+        return written, errors
+
+    def _failed(self, n, error):
+        self.stats["failed"] += n
+        self.stats["last_error"] = str(error)
+
+
+_writer = {"value": None}
+
+
+def get_trip_writer():
+    """The process-wide writer, started on first use."""
+    if _writer["value"] is None:
+        _writer["value"] = TripWriter().start()
+    return _writer["value"]
@@ -0,0 +1,170 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from utils.cell_sums import CellSums
+from utils.trip_rules import MAX_LOCATION_ID, trip_columns
+from utils.source_stamp import built_from_current_db, source_stamp
+
+# Precomputed origin-destination tensor written by build_db.py.
+# Logically it is (pickup hour) x PULocationID x DOLocationID holding trip
+# counts and fare/distance/duration sums. Most of its cells are empty, so it
+# is stored sparse, sorted by hour: offsets[i]:offsets[i + 1] are the entries
+# of hour first_hour + i, and pair = PULocationID * zones + DOLocationID.
+# zones covers every id clean_trip accepts (not just the zones table), so
+# trips with off-table zone ids are counted here as they are in SQL.
+# A time filter is a set of slices; bincount over the sliced pairs gives the
+# dense zones x zones matrix every route/flow endpoint reduces from.
+# Trips ingested while the API runs are summed into an in-memory delta, one
+# entry per (epoch hour, pair) cell, that totals() adds on top. The delta
+# lives in the process whose writer committed the trips, so this assumes a
+# single API process; other workers see the new trips only through SQL
+# until the tensor is rebuilt.
+OD_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'data', 'od'))
+MANIFEST = 'manifest.json'
+ZONES = MAX_LOCATION_ID + 1
+
+MEASURES = {
+    "count":    "1",
+    "fare":     "total_amount",
+    "distance": "trip_distance",
+    "duration": "trip_duration_minutes",
+}
+
+
+def _reduce(keys, weights):
+    keys, inverse = np.unique(keys, return_inverse=True)
+    return keys, [np.bincount(inverse, weights=w) for w in weights]
+
+
+def write_od_matrix(conn, out_dir=OD_DIR, chunk=500_000):
+    """Aggregate the trips table into the sparse hour x PU x DO tensor."""
+    zones = ZONES
+    cur = conn.execute(f"""
+        SELECT CAST(strftime('%s', tpep_pickup_datetime) AS INTEGER) / 3600, PULocationID, DOLocationID,
+               {', '.join(f'COALESCE({expr}, 0)' for expr in MEASURES.values())}
+        FROM trips
+    """)
+    parts, dropped = [], 0
+    while True:
+        rows = cur.fetchmany(chunk)
+        if not rows:
+            break
+        block = np.array(rows, dtype=np.float64)
+        hour, pu, do = (block[:, i].astype(np.int64) for i in range(3))
+        ok = (pu >= 0) & (pu < zones) & (do >= 0) & (do < zones)
+        dropped += int((~ok).sum())
+        keys = (hour * zones + pu) * zones + do
+        parts.append(_reduce(keys[ok], [block[ok, 3 + i] for i in range(len(MEASURES))]))
+
+    if parts:
+        keys, sums = _reduce(np.concatenate([k for k, _ in parts]),
+                             [np.concatenate([s[i] for _, s in parts]) for i in range(len(MEASURES))])
+    else:
+        keys, sums = np.empty(0, np.int64), [np.empty(0)] * len(MEASURES)
+    hours = keys // (zones * zones)
+    first = int(hours[0]) if len(hours) else 0
+    n_hours = int(hours[-1]) - first + 1 if len(hours) else 0
+    arrays = {"offsets": np.searchsorted(hours, first + np.arange(n_hours + 1)).astype(np.int64),
+              "pair": (keys % (zones * zones)).astype(np.uint32)}
+    for name, s in zip(MEASURES, sums):
+        arrays[name] = s.astype(np.uint32) if name == "count" else s
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name, arr in arrays.items():
+        np.save(os.path.join(out_dir, f"{name}.npy"), arr)
+    manifest = {"zones": zones, "first_hour": first, "hours": n_hours, "entries": len(keys),
+                "measures": list(MEASURES), "dropped": dropped, "source": source_stamp(conn)}
+    with open(os.path.join(out_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+class ODMatrix:
+    def __init__(self, path):
+        with open(os.path.join(path, MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.zones = manifest["zones"]
+        self.first_hour = manifest["first_hour"]
+        self.hours = manifest["hours"]
+        load = lambda name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        self.offsets = load("offsets")
+        self.pair = load("pair")
+        self.measures = {name: load(name) for name in manifest["measures"]}
+        self._lock = threading.Lock()
+        self._delta = CellSums(len(self.measures))   # key = epoch hour * zones^2 + pair
+
+    def add_trips(self, trips):
+        """Fold a batch of freshly inserted INSERT_SQL tuples into the delta."""
+        cols = trip_columns(trips)
+        pu, do = cols["PULocationID"], cols["DOLocationID"]
+        ok = (pu >= 0) & (pu < self.zones) & (do >= 0) & (do < self.zones)
+        values = np.column_stack([np.ones(int(ok.sum())) if MEASURES[name] == "1"
+                                  else np.nan_to_num(cols[MEASURES[name]][ok]) for name in self.measures])
+        keys = (cols["pickup_hour"][ok] * self.zones + pu[ok]) * self.zones + do[ok]
+        with self._lock:
+            self._delta.add(keys, values)
+
+    def _slices(self, date=None, hour=None):
+        """Entry ranges for a pickup date (YYYY-MM-DD or datetime64) and/or hour of day (0-23)."""
+        if hour is not None and not 0 <= hour < 24:
+            return []
+        lo, hi = 0, self.hours
+        if date is not None:
+            start = int(np.datetime64(date, 'D').astype('datetime64[h]').astype(np.int64)) - self.first_hour
+            lo, hi = max(start, 0), min(start + 24, self.hours)
+        if hour is None:
+            return [(self.offsets[lo], self.offsets[hi])] if lo < hi else []
+        first = lo + (hour - (self.first_hour + lo)) % 24
+        return [(self.offsets[h], self.offsets[h + 1]) for h in range(first, hi, 24)]
+
+    def totals(self, date=None, hour=None, pu_zones=None, do_zones=None):
+        """Dense zones x zones sums of every measure over the selected hours and zones."""
+        slices = self._slices(date, hour)
+        take = lambda arr: (np.concatenate([arr[a:b] for a, b in slices]) if slices
+                            else np.empty(0, arr.dtype))
+        pair = take(self.pair)
+        size = self.zones * self.zones
+        out = {name: np.bincount(pair, weights=take(arr), minlength=size).reshape(self.zones, self.zones)
+               for name, arr in self.measures.items()}
+        with self._lock:
+            keys, sums = self._delta.snapshot()
+        if len(keys):
+            hours, pair = keys // size, keys % size
+            sel = np.ones(len(hours), dtype=bool)
+            if date is not None:
+                start = int(np.datetime64(date, 'D').astype('datetime64[h]').astype(np.int64))
+                sel &= (hours >= start) & (hours < start + 24)
+            if hour is not None:
+                sel &= hours % 24 == hour
+            for i, m in enumerate(out.values()):
+                m += np.bincount(pair[sel], weights=sums[sel, i], minlength=size).reshape(self.zones, self.zones)
+        keep = np.ones((self.zones, self.zones), dtype=bool)
+        if pu_zones is not None:
+            keep &= self.zone_mask(pu_zones)[:, None]
+        if do_zones is not None:
+            keep &= self.zone_mask(do_zones)[None, :]
+        for m in out.values():
+            m[~keep] = 0
+        return out
+
+    def zone_mask(self, zone_ids):
+        mask = np.zeros(self.zones, dtype=bool)
+        ids = np.asarray([z for z in zone_ids if 0 <= z < self.zones], dtype=np.int64)
+        mask[ids] = True
+        return mask
+
+
+_od = {"loaded": False, "value": None}
+
+
+def get_od_matrix():
+    """The mapped OD tensor, or None when build_db.py has not written one
+    from the current taxi_mock.db."""
+    if not _od["loaded"]:
+        path = OD_DIR
+        _od["value"] = ODMatrix(path) if built_from_current_db(path, MANIFEST) else None
+        _od["loaded"] = True
+    return _od["value"]
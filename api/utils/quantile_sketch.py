@@ -0,0 +1,205 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from utils.cell_sums import CellSums
+from utils.trip_rules import MAX_LOCATION_ID, trip_columns
+from utils.source_stamp import built_from_current_db, source_stamp
+
+# Mergeable quantile sketches for the percentiles endpoint, written by
+# build_db.py next to the columnar snapshot.
+#
+# Every sketch uses the same fixed log-spaced buckets (DDSketch-style): a
+# value v > MIN_VALUE falls in bucket ceil(log_gamma(v / MIN_VALUE)), so a
+# sketch is just a count per bucket and merging sketches is adding counts.
+# Quantiles read back from a bucket are within RELATIVE_ERROR of the true
+# value. One sketch is stored per (pickup hour, pickup zone) cell and metric;
+# any date/hour/borough/zone selection is a union of cells. Trips ingested
+# while the API runs are counted into in-memory cells and buckets after the
+# built ones. Like the OD delta, they live in the process whose writer
+# committed the trips, so this assumes a single API process.
+SKETCH_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'data', 'sketches'))
+MANIFEST = 'manifest.json'
+
+RELATIVE_ERROR = 0.01
+GAMMA = (1 + RELATIVE_ERROR) / (1 - RELATIVE_ERROR)
+MIN_VALUE = 0.01        # values at or below this share bucket 0
+MAX_VALUE = 100_000.0   # values above this share the last bucket
+N_BUCKETS = int(np.ceil(np.log(MAX_VALUE / MIN_VALUE) / np.log(GAMMA))) + 1
+
+# metric -> column of the trips table
+METRICS = {
+    "fare":     "total_amount",
+    "duration": "trip_duration_minutes",
+    "distance": "trip_distance",
+    "speed":    "speed_mph",
+}
+
+ZONE_SLOTS = MAX_LOCATION_ID + 1   # cell key = epoch_hour * ZONE_SLOTS + PULocationID
+
+
+def bucket_index(values):
+    v = np.asarray(values, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        idx = np.ceil(np.log(np.maximum(v, MIN_VALUE) / MIN_VALUE) / np.log(GAMMA))
+    return np.clip(idx, 0, N_BUCKETS - 1).astype(np.uint16)
+
+
+def bucket_value(idx):
+    """Representative value of each bucket (within RELATIVE_ERROR of everything in it)."""
+    idx = np.asarray(idx)
+    return np.where(idx == 0, MIN_VALUE, MIN_VALUE * 2 * GAMMA ** idx / (GAMMA + 1))
+
+
+def quantiles(counts, qs):
+    """Quantiles of a dense (..., N_BUCKETS) count array; None where a sketch is empty."""
+    counts = np.atleast_2d(counts)
+    cum = np.cumsum(counts, axis=1)
+    out = []
+    for row in cum:
+        n = row[-1]
+        if not n:
+            out.append([None] * len(qs))
+            continue
+        ranks = [q * (n - 1) for q in qs]
+        out.append([float(bucket_value(np.searchsorted(row, r, side='right'))) for r in ranks])
+    return out
+
+
+def _reduce(keys, counts):
+    keys, inverse = np.unique(keys, return_inverse=True)
+    return keys, np.bincount(inverse, weights=counts).astype(np.uint32)
+
+
+def write_sketches(conn, out_dir=SKETCH_DIR, chunk=500_000):
+    """Build one sketch per (pickup hour, pickup zone) cell and metric from the trips table."""
+    names = list(METRICS)
+    cur = conn.execute(f"""
+        SELECT CAST(strftime('%s', tpep_pickup_datetime) AS INTEGER) / 3600, PULocationID,
+               {', '.join(METRICS.values())}
+        FROM trips
+    """)
+    cell_parts = []
+    metric_parts = {name: [] for name in names}
+    while True:
+        rows = cur.fetchmany(chunk)
+        if not rows:
+            break
+        block = np.array(rows, dtype=np.float64)   # None -> nan
+        cells = block[:, 0].astype(np.int64) * ZONE_SLOTS + block[:, 1].astype(np.int64)
+        cell_parts.append(_reduce(cells, np.ones(len(cells))))
+        for i, name in enumerate(names):
+            values = block[:, 2 + i]
+            ok = ~np.isnan(values)
+            keys = cells[ok] * N_BUCKETS + bucket_index(values[ok])
+            metric_parts[name].append(_reduce(keys, np.ones(len(keys))))
+
+    def merge(parts):
+        if not parts:
+            return np.empty(0, np.int64), np.empty(0, np.uint32)
+        return _reduce(np.concatenate([k for k, _ in parts]), np.concatenate([c for _, c in parts]))
+
+    cells, cell_counts = merge(cell_parts)
+    arrays = {"cell_hour": (cells // ZONE_SLOTS).astype(np.int32),
+              "cell_zone": (cells % ZONE_SLOTS).astype(np.uint16),
+              "cell_trips": cell_counts}
+    for name in names:
+        keys, counts = merge(metric_parts[name])
+        # keys are sorted by cell, so each metric's entries stay grouped by cell
+        arrays[f"{name}_cell"] = np.searchsorted(cells, keys // N_BUCKETS).astype(np.int32)
+        arrays[f"{name}_bucket"] = (keys % N_BUCKETS).astype(np.uint16)
+        arrays[f"{name}_count"] = counts
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name, arr in arrays.items():
+        np.save(os.path.join(out_dir, f"{name}.npy"), arr)
+    manifest = {"cells": len(cells), "relative_error": RELATIVE_ERROR, "min_value": MIN_VALUE,
+                "buckets": N_BUCKETS, "metrics": names,
+                "entries": {name: len(arrays[f"{name}_count"]) for name in names},
+                "source": source_stamp(conn)}
+    with open(os.path.join(out_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+class SketchIndex:
+    def __init__(self, path):
+        with open(os.path.join(path, MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest["buckets"] != N_BUCKETS or manifest["relative_error"] != RELATIVE_ERROR:
+            raise ValueError(f"{path} was built with different sketch parameters; rebuild it")
+        self.metrics = manifest["metrics"]
+        load = lambda name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        self.cell_hour = load("cell_hour")
+        self.cell_zone = load("cell_zone")
+        self.cell_trips = load("cell_trips")
+        self.entries = {m: (load(f"{m}_cell"), load(f"{m}_bucket"), load(f"{m}_count"))
+                        for m in self.metrics}
+        self._lock = threading.Lock()
+        self._delta_cells = CellSums(1)   # key = cell key, value = trips
+        self._delta = {m: CellSums(1) for m in self.metrics}   # key = delta cell slot * N_BUCKETS + bucket
+
+    def add_trips(self, trips):
+        """Count a batch of freshly inserted INSERT_SQL tuples into the delta cells."""
+        cols = trip_columns(trips)
+        zone = cols["PULocationID"]
+        ok = (zone >= 0) & (zone < ZONE_SLOTS)
+        values = {m: cols[METRICS[m]][ok] for m in self.metrics}
+        with self._lock:
+            slots = self._delta_cells.add(cols["pickup_hour"][ok] * ZONE_SLOTS + zone[ok],
+                                          np.ones((int(ok.sum()), 1)))
+            for m, v in values.items():
+                has = ~np.isnan(v)
+                self._delta[m].add(slots[has] * N_BUCKETS + bucket_index(v[has]), np.ones((int(has.sum()), 1)))
+
+    def cells(self):
+        """(epoch hour, pickup zone) of every cell: the built ones, then the ones ingested trips added."""
+        with self._lock:
+            keys, _ = self._delta_cells.snapshot()
+        return (np.concatenate([self.cell_hour, keys // ZONE_SLOTS]),
+                np.concatenate([self.cell_zone, keys % ZONE_SLOTS]))
+
+    def cell_mask(self, cells, date=None, hour=None, zones=None):
+        """Cells matching a pickup date (YYYY-MM-DD or datetime64), hour of day and/or set of pickup zones."""
+        cell_hour, cell_zone = cells
+        mask = np.ones(len(cell_hour), dtype=bool)
+        if date is not None:
+            first = np.datetime64(date, 'D').astype('datetime64[h]').astype(np.int64)
+            mask &= (cell_hour >= first) & (cell_hour < first + 24)
+        if hour is not None:
+            mask &= cell_hour % 24 == hour
+        if zones is not None:
+            mask &= np.isin(cell_zone, list(zones))
+        return mask
+
+    def merge(self, metric, cell_group, n_groups):
+        """Dense (n_groups, N_BUCKETS) counts; cell_group maps each of cells() to a group, -1 to skip it."""
+        cell, bucket, count = self.entries[metric]
+        group = cell_group[cell]
+        keep = group >= 0
+        flat = np.bincount(group[keep].astype(np.int64) * N_BUCKETS + bucket[keep],
+                           weights=count[keep], minlength=n_groups * N_BUCKETS)
+        with self._lock:
+            keys, counts = self._delta[metric].snapshot()
+        cell = len(self.cell_hour) + keys // N_BUCKETS
+        keep = cell < len(cell_group)   # cells added after the caller's cells() call are not in cell_group
+        group = cell_group[cell[keep]]
+        keys, counts, keep = keys[keep], counts[keep, 0], group >= 0
+        flat += np.bincount(group[keep] * N_BUCKETS + keys[keep] % N_BUCKETS, weights=counts[keep],
+                            minlength=n_groups * N_BUCKETS)
+        return flat.reshape(n_groups, N_BUCKETS)
+
+
+_sketches = {"loaded": False, "value": None}
+
+
+def get_sketches():
+    """The mapped sketch index, or None when build_db.py has not written one
+    from the current taxi_mock.db."""
+    if not _sketches["loaded"]:
+        path = SKETCH_DIR
+        _sketches["value"] = SketchIndex(path) if built_from_current_db(path, MANIFEST) else None
+        _sketches["loaded"] = True
+    return _sketches["value"]
@@ -0,0 +1,105 @@
+import json
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import db_connect
+from utils.db_connect import get_db_connection, dict_from_row
+
+# Partitioned storage written by `build_db.py --partition day|week`.
+# Set TAXI_STORAGE=sharded before starting the API to query the shards
+# instead of taxi_mock.db.
+SHARD_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'shards')
+MANIFEST_PATH = os.path.join(SHARD_DIR, 'manifest.json')
+
+# sqlite3 releases the GIL while a statement runs, so threads are enough
+# to put every core to work on a fan-out.
+_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 4)
+_manifest = {"mtime": None, "shards": []}
+_layouts = {}   # db path -> (mtime, compact?)
+
+
+def sharding_enabled():
+    return os.environ.get('TAXI_STORAGE') == 'sharded' and os.path.exists(MANIFEST_PATH)
+
+
+def _load_manifest():
+    mtime = os.path.getmtime(MANIFEST_PATH)
+    if _manifest["mtime"] != mtime:
+        with open(MANIFEST_PATH, encoding='utf-8') as f:
+            _manifest["shards"] = json.load(f)["shards"]
+        _manifest["mtime"] = mtime
+    return _manifest["shards"]
+
+
+def shard_paths(date=None):
+    """Shard files to query; a `date` (YYYY-MM-DD) prunes to the shard covering it."""
+    return [os.path.join(SHARD_DIR, s["file"]) for s in _load_manifest()
+            if date is None or s["start"] <= date <= s["end"]]
+
+
+def compact_storage():
+    """True when the trips view exposes the raw epoch columns of a `build_db.py --compact` build.
+
+    Routes then compute durations, hours and date ranges on pickup_ts/dropoff_ts
+    instead of re-parsing the view's decoded timestamp text. Compact builds
+    from before those columns were added read as plain.
+    """
+    path = shard_paths()[0] if sharding_enabled() and _load_manifest() else db_connect.DB_PATH
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    cached = _layouts.get(path)
+    if cached is None or cached[0] != mtime:
+        compact = False
+        if mtime is not None:
+            # a connection of its own, outside the statement trace of get_db_connection
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                compact = conn.execute("SELECT 1 FROM pragma_table_info('trips') "
+                                       "WHERE name='pickup_ts'").fetchone() is not None
+            finally:
+                conn.close()
+        cached = _layouts[path] = (mtime, compact)
+    return cached[1]
+
+
+def _query_shard(path, sql, params):
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        return [dict_from_row(r) for r in conn.execute(sql, params).fetchall()]
+    finally:
+        conn.close()
+
+
+def merge_partials(partials, keys=()):
+    """Merge per-shard result rows by summing every non-key column.
+
+    Only use with summable aggregates (COUNT, SUM); averages must be
+    selected as SUM/COUNT pairs and divided after merging.
+    """
+    merged = {}
+    for rows in partials:
+        for row in rows:
+            k = tuple(row[c] for c in keys)
+            acc = merged.get(k)
+            if acc is None:
+                merged[k] = dict(row)
+                continue
+            for col, v in row.items():
+                if col in keys or v is None:
+                    continue
+                acc[col] = v if acc[col] is None else acc[col] + v
+    return list(merged.values())
+
+
+def query_partials(sql, params=(), keys=(), date=None):
+    """Run a partial-aggregate query on taxi_mock.db, or on every relevant shard
+    concurrently, and return the merged rows as dicts."""
+    if not sharding_enabled():
+        conn = get_db_connection()
+        try:
+            return [dict_from_row(r) for r in conn.execute(sql, params).fetchall()]
+        finally:
+            conn.close()
+    futures = [_pool.submit(_query_shard, p, sql, params) for p in shard_paths(date)]
+    return merge_partials([f.result() for f in futures], keys)
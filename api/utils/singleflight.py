@@ -0,0 +1,91 @@
+import threading
+from functools import wraps
+
+from flask import Response, make_response, request
+
+from utils.encoding import negotiated_format
+
+# Single-flight request coalescing for the aggregate endpoints. Concurrent
+# requests to the same route with the same canonical filters (query args
+# sorted, repeated values sorted, plus the negotiated response format) share
+# one computation: the first one runs the view, the others wait for it and
+# each get their own copy of its response. Nothing is cached; as soon as the
+# running computation finishes, the next request starts a fresh one. So a
+# burst of identical dashboard loads costs one scan instead of one per user.
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}      # key -> _Call in flight
+        self.counters = {}    # route -> {"requests", "executions", "coalesced"}
+
+    def do(self, route, key, fn):
+        """fn()'s result, shared with every concurrent do() for the same key."""
+        with self._lock:
+            counts = self.counters.setdefault(route, {"requests": 0, "executions": 0, "coalesced": 0})
+            counts["requests"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                counts["executions"] += 1
+            else:
+                counts["coalesced"] += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except Exception as e:   # every waiter fails the way the leader did
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {route: dict(c) for route, c in sorted(self.counters.items())}
+
+
+_flights = SingleFlight()
+
+
+def request_key(view_args):
+    """Canonical identity of the current request: endpoint, path args, query args, format.
+
+    Arg names are sorted but each arg's values keep their request order:
+    repeated args such as percentiles' `q` shape the response in that order.
+    """
+    args = tuple(sorted((k, tuple(v)) for k, v in request.args.lists()))
+    return request.endpoint, tuple(sorted(view_args.items())), args, negotiated_format()
+
+
+def coalesce(view):
+    """Route decorator: identical concurrent requests run the view once."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        def run():
+            resp = make_response(view(*args, **kwargs))
+            return resp.get_data(), resp.status_code, list(resp.headers.items())
+        body, status, headers = _flights.do(request.endpoint, request_key(kwargs), run)
+        return Response(body, status=status, headers=headers)
+    return wrapper
+
+
+def coalescing_stats():
+    return _flights.stats()
@@ -0,0 +1,101 @@
+import json
+import os
+
+import numpy as np
+
+from utils.source_stamp import built_from_current_db, source_stamp
+
+# Columnar, memory-mapped copy of the trips table written by build_db.py.
+# One .npy file per column plus manifest.json; np.load(mmap_mode='r') maps
+# the files without parsing, so every API worker shares the OS page cache
+# instead of holding its own copy of the rows.
+SNAPSHOT_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'data', 'snapshot'))
+MANIFEST = 'manifest.json'
+
+# column -> (SQL expression over the trips table, dtype)
+COLUMNS = {
+    "pickup_ts":             ("CAST(strftime('%s', tpep_pickup_datetime) AS INTEGER)", "datetime64[s]"),
+    "dropoff_ts":            ("CAST(strftime('%s', tpep_dropoff_datetime) AS INTEGER)", "datetime64[s]"),
+    "PULocationID":          ("PULocationID", "uint16"),
+    "DOLocationID":          ("DOLocationID", "uint16"),
+    "VendorID":              ("COALESCE(VendorID, 0)", "int8"),
+    "RatecodeID":            ("COALESCE(RatecodeID, 0)", "int8"),
+    "payment_type":          ("COALESCE(payment_type, 0)", "int8"),
+    "passenger_count":       ("COALESCE(passenger_count, 0)", "int8"),
+    # float64 where the bitmap range filters compare boundary rows, so they agree with SQL's doubles
+    "trip_distance":         ("trip_distance", "float64"),
+    "fare_amount":           ("fare_amount", "float32"),
+    "tip_amount":            ("tip_amount", "float32"),
+    "total_amount":          ("total_amount", "float64"),
+    "trip_duration_minutes": ("trip_duration_minutes", "float32"),
+    "speed_mph":             ("speed_mph", "float32"),
+}
+
+
+def write_snapshot(conn, out_dir=SNAPSHOT_DIR, chunk=500_000):
+    """Stream the trips table (rowid order) into per-column .npy files.
+
+    Row i of every column is trip id row_base + i; ids must be contiguous,
+    which holds for a freshly built database.
+    """
+    lo, hi, n = conn.execute("SELECT MIN(id), MAX(id), COUNT(*) FROM trips").fetchone()
+    if n and hi - lo + 1 != n:
+        raise ValueError("trips ids are not contiguous; rebuild the database before snapshotting")
+    os.makedirs(out_dir, exist_ok=True)
+
+    names = list(COLUMNS)
+    arrays = {name: np.lib.format.open_memmap(os.path.join(out_dir, f"{name}.npy"), mode="w+",
+                                              dtype=COLUMNS[name][1], shape=(n,))
+              for name in names}
+    cur = conn.execute(f"SELECT {', '.join(expr for expr, _ in COLUMNS.values())} FROM trips ORDER BY id")
+    pos = 0
+    while True:
+        rows = cur.fetchmany(chunk)
+        if not rows:
+            break
+        block = np.array(rows, dtype=np.float64)   # None -> nan
+        for i, name in enumerate(names):
+            col = block[:, i]
+            if COLUMNS[name][1].startswith("datetime64"):
+                col = col.astype(np.int64)
+            arrays[name][pos:pos + len(rows)] = col
+        pos += len(rows)
+    for arr in arrays.values():
+        arr.flush()
+
+    manifest = {"rows": n, "row_base": lo or 1,
+                "columns": {name: {"file": f"{name}.npy", "dtype": COLUMNS[name][1]} for name in names},
+                "source": source_stamp(conn)}
+    with open(os.path.join(out_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+class Snapshot:
+    def __init__(self, path):
+        with open(os.path.join(path, MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.rows = manifest["rows"]
+        self.row_base = manifest["row_base"]
+        self.columns = {name: np.load(os.path.join(path, meta["file"]), mmap_mode="r")
+                        for name, meta in manifest["columns"].items()}
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def positions(self, trip_ids):
+        """Map trip ids to row positions in the column arrays."""
+        return np.asarray(trip_ids, dtype=np.int64) - self.row_base
+
+
+_snapshot = {"loaded": False, "value": None}
+
+
+def get_snapshot():
+    """The mapped snapshot, or None when build_db.py has not written one
+    from the current taxi_mock.db."""
+    if not _snapshot["loaded"]:
+        path = SNAPSHOT_DIR
+        _snapshot["value"] = Snapshot(path) if built_from_current_db(path, MANIFEST) else None
+        _snapshot["loaded"] = True
+    return _snapshot["value"]
@@ -0,0 +1,42 @@
+import json
+import os
+import sqlite3
+
+from utils import db_connect
+
+# Every precomputed artifact records in its manifest the trips data it was
+# built from: row count, last id and the database file's mtime. The loaders
+# compare that with taxi_mock.db and ignore an artifact built from other
+# data -- an older build, a rebuild or a database written since -- so the
+# API falls back to SQL instead of serving stale counts. Trips ingested by
+# the running process are fine: the artifacts are checked once, at load.
+
+
+def source_stamp(conn):
+    """{"trips", "max_id", "mtime"} of the database `conn` is reading."""
+    path = next(r[2] for r in conn.execute("PRAGMA database_list") if r[1] == "main")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")   # so closing this connection doesn't touch the file later
+    trips, max_id = conn.execute("SELECT COUNT(*), MAX(id) FROM trips").fetchone()
+    return {"trips": trips, "max_id": max_id or 0, "mtime": os.path.getmtime(path) if path else None}
+
+
+def built_from_current_db(artifact_dir, manifest_name="manifest.json"):
+    """True when the artifact in artifact_dir was built from db_connect.DB_PATH as it is now."""
+    manifest_path = os.path.join(artifact_dir, manifest_name)
+    if not os.path.exists(manifest_path):
+        return False
+    with open(manifest_path, encoding="utf-8") as f:
+        built = json.load(f).get("source")
+    current = None
+    if os.path.exists(db_connect.DB_PATH):
+        conn = sqlite3.connect(f"file:{db_connect.DB_PATH}?mode=ro", uri=True)
+        try:
+            trips, max_id = conn.execute("SELECT COUNT(*), MAX(id) FROM trips").fetchone()
+            current = {"trips": trips, "max_id": max_id or 0, "mtime": os.path.getmtime(db_connect.DB_PATH)}
+        finally:
+            conn.close()
+    if built != current:
+        print(f"[artifacts] ignoring {artifact_dir}: built from other trips data than {db_connect.DB_PATH} "
+              f"(rebuild with build_db.py --artifacts-only)")
+        return False
+    return True
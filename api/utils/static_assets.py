@@ -0,0 +1,118 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+# Frontend files served from memory, by serve.py and, in single-port mode
+# (SERVE_FRONTEND=1), by the API process itself. Every file is read and
+# gzip-compressed once at startup, so a request costs a dict lookup and a
+# write. index.html is rewritten so its local scripts and stylesheets are
+# requested as name?v=<content hash>: those URLs are cached for a year,
+# while index.html and unversioned requests are revalidated with the ETag.
+LEVEL = 9
+MIN_SIZE = 1024   # smaller files are sent as-is, as in utils/compression.py
+
+CACHE_HTML = "no-cache"
+CACHE_VERSIONED = "public, max-age=31536000, immutable"
+CACHE_DEFAULT = "no-cache"
+
+TEXT_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+# <meta name="api-base" content="..."> tells app.js where the API lives
+API_BASE_META = re.compile(r'(<meta\s+name="api-base"\s+content=")[^"]*(")')
+LOCAL_REF = re.compile(r'((?:src|href)=")([^":?#]+)(")')
+
+
+class Asset:
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if content_type.startswith(TEXT_TYPES):
+            content_type += "; charset=utf-8"
+        self.content_type = content_type
+        self.version = hashlib.sha256(data).hexdigest()[:12]
+        compressed = gzip.compress(data, compresslevel=LEVEL, mtime=0)
+        self.gzip = compressed if len(data) >= MIN_SIZE and len(compressed) < len(data) else None
+
+    def respond(self, accept_encoding="", if_none_match="", version=None):
+        """(status, headers, body) for a GET of this asset."""
+        use_gzip = self.gzip is not None and "gzip" in accept_encoding.lower()
+        etag = f'"{self.version}-gz"' if use_gzip else f'"{self.version}"'
+        if self.name.endswith(".html"):
+            cache = CACHE_HTML
+        else:
+            cache = CACHE_VERSIONED if version == self.version else CACHE_DEFAULT
+        headers = {"ETag": etag, "Cache-Control": cache}
+        if self.gzip is not None:
+            headers["Vary"] = "Accept-Encoding"
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        if etag in tags or "*" in tags:
+            return 304, headers, b""
+        body = self.gzip if use_gzip else self.data
+        headers["Content-Type"] = self.content_type
+        headers["Content-Length"] = str(len(body))
+        if use_gzip:
+            headers["Content-Encoding"] = "gzip"
+        return 200, headers, body
+
+
+class AssetCache:
+    def __init__(self, directory, api_base=None):
+        """Load every file under directory; api_base, if given, replaces index.html's api-base meta."""
+        files = {}
+        for root, dirs, names in os.walk(directory):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in names:
+                if name.startswith("."):
+                    continue
+                path = os.path.join(root, name)
+                with open(path, "rb") as f:
+                    files[os.path.relpath(path, directory).replace(os.sep, "/")] = f.read()
+        self.assets = {name: Asset(name, data) for name, data in files.items() if not name.endswith(".html")}
+        for name, data in files.items():
+            if name.endswith(".html"):
+                self.assets[name] = Asset(name, self._rewrite_html(data.decode("utf-8"), api_base).encode("utf-8"))
+
+    def _rewrite_html(self, html, api_base):
+        if api_base is not None:
+            html = API_BASE_META.sub(lambda m: f"{m[1]}{api_base}{m[2]}", html)
+
+        def version(m):
+            asset = self.assets.get(m[2])
+            return f"{m[1]}{m[2]}?v={asset.version}{m[3]}" if asset is not None else m[0]
+        return LOCAL_REF.sub(version, html)
+
+    def get(self, name):
+        return self.assets.get(name or "index.html")
+
+    @property
+    def sizes(self):
+        """(raw bytes, bytes sent to gzip clients) over all assets."""
+        return (sum(len(a.data) for a in self.assets.values()),
+                sum(len(a.gzip if a.gzip is not None else a.data) for a in self.assets.values()))
+
+
+def init_frontend(app, directory):
+    """Serve the frontend from the Flask app, one route per file.
+
+    "/" is left to the caller: the returned view serves index.html.
+    """
+    from flask import Response, abort, request
+
+    cache = AssetCache(directory, api_base="")   # same origin as the API
+
+    def respond(name="index.html"):
+        asset = cache.get(name)
+        if asset is None:
+            abort(404)
+        status, headers, body = asset.respond(request.headers.get("Accept-Encoding", ""),
+                                              request.headers.get("If-None-Match", ""),
+                                              request.args.get("v"))
+        return Response(body, status=status, headers=headers)
+
+    for name in cache.assets:
+        if name != "index.html":
+            app.add_url_rule(f"/{name}", f"frontend_{name}", lambda name=name: respond(name))
+    return respond
@@ -0,0 +1,127 @@
+from datetime import datetime
+
+import numpy as np
+
+# Trip validation shared by build_db.py (offline load) and the ingest API
+# (live events): a raw TLC record either becomes one INSERT_SQL tuple or is
+# rejected with the reason below.
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+MAX_DISTANCE = 200     # miles
+MAX_DURATION = 300     # minutes
+MAX_SPEED = 150        # mph, physically impossible above
+MAX_LOCATION_ID = 511  # zone ids must fit the 9-bit zone slot of the sketch cells
+STORE_AND_FWD_FLAGS = (None, "", "Y", "N")
+
+INSERT_COLUMNS = (
+    "VendorID", "tpep_pickup_datetime", "tpep_dropoff_datetime", "passenger_count",
+    "trip_distance", "RatecodeID", "store_and_fwd_flag", "PULocationID", "DOLocationID",
+    "payment_type", "fare_amount", "extra", "mta_tax", "tip_amount", "tolls_amount",
+    "improvement_surcharge", "total_amount", "congestion_surcharge",
+    "trip_duration_minutes", "speed_mph",
+)
+INSERT_SQL = f"INSERT INTO trips ({', '.join(INSERT_COLUMNS)}) VALUES ({','.join('?' * len(INSERT_COLUMNS))})"
+
+# ── helpers ──────────────────────────────────────────────────────────────
+def duration_minutes(pickup, dropoff):
+    try:
+        diff = datetime.strptime(dropoff, TIMESTAMP_FORMAT) - datetime.strptime(pickup, TIMESTAMP_FORMAT)
+        return diff.total_seconds() / 60.0
+    except Exception:
+        return None
+
+def speed_mph(dist, pickup, dropoff):
+    dur = duration_minutes(pickup, dropoff)
+    if dur and dur > 0 and float(dist) > 0:
+        return float(dist) / (dur / 60.0)
+    return None
+
+def safe_float(v):
+    try:
+        f = float(v)
+        return f if f == f else None   # NaN check
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+def safe_int(v):
+    try:
+        return int(float(v))
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+# ── quality filter ────────────────────────────────────────────────────────
+def clean_trip(row, zone_ids=None):
+    """Validate one raw trip (dict keyed by TLC column names).
+
+    Location ids must be in `zone_ids` when given (the zones table), and
+    within 1..MAX_LOCATION_ID otherwise. Returns (INSERT_SQL tuple, None)
+    for a valid trip, (None, reason) otherwise.
+    """
+    pu   = row.get("tpep_pickup_datetime") or ""
+    do   = row.get("tpep_dropoff_datetime") or ""
+    dist = safe_float(row.get("trip_distance", 0))
+    fare = safe_float(row.get("fare_amount", 0))
+    tot  = safe_float(row.get("total_amount", 0))
+    pu_loc = safe_int(row.get("PULocationID"))
+    do_loc = safe_int(row.get("DOLocationID"))
+    flag = row.get("store_and_fwd_flag")
+
+    # Quality filter: valid location, distance, fare, realistic duration
+    if not pu or not do:
+        return None, "missing pickup/dropoff time"
+    if not dist or dist <= 0 or dist > MAX_DISTANCE:
+        return None, "distance out of range"
+    if fare is None or fare <= 0 or tot is None or tot <= 0:
+        return None, "fare out of range"
+    if not pu_loc or not do_loc:
+        return None, "missing location"
+    if zone_ids is not None and (pu_loc not in zone_ids or do_loc not in zone_ids):
+        return None, "unknown location"
+    if not (0 < pu_loc <= MAX_LOCATION_ID and 0 < do_loc <= MAX_LOCATION_ID):
+        return None, "unknown location"
+    if flag not in STORE_AND_FWD_FLAGS:
+        return None, "invalid store_and_fwd_flag"
+
+    dur = duration_minutes(pu, do)
+    if dur is None or dur <= 0 or dur > MAX_DURATION:
+        return None, "duration out of range"
+
+    spd = speed_mph(dist, pu, do)
+    if spd is not None and spd > MAX_SPEED:
+        return None, "speed out of range"
+
+    return (
+        safe_int(row.get("VendorID")),
+        pu, do,
+        safe_int(row.get("passenger_count")),
+        dist,
+        safe_int(row.get("RatecodeID")),
+        flag,
+        pu_loc, do_loc,
+        safe_int(row.get("payment_type")),
+        fare,
+        safe_float(row.get("extra")),
+        safe_float(row.get("mta_tax")),
+        safe_float(row.get("tip_amount")),
+        safe_float(row.get("tolls_amount")),
+        safe_float(row.get("improvement_surcharge")),
+        tot,
+        safe_float(row.get("congestion_surcharge")),
+        round(dur, 2),
+        round(spd, 2) if spd is not None else None,
+    ), None
+
+
+def trip_columns(trips):
+    """{column: numpy array} for a batch of INSERT_SQL tuples, plus pickup_hour in epoch hours.
+
+    Used to fold freshly ingested trips into the in-memory aggregates.
+    """
+    cols = dict(zip(INSERT_COLUMNS, zip(*trips)))
+    out = {c: np.array(cols[c], dtype=np.float64)   # None -> nan
+           for c in ("trip_distance", "total_amount", "trip_duration_minutes", "speed_mph")}
+    out["PULocationID"] = np.array(cols["PULocationID"], dtype=np.int64)
+    out["DOLocationID"] = np.array(cols["DOLocationID"], dtype=np.int64)
+    pickup = np.array([datetime.strptime(p, TIMESTAMP_FORMAT) for p in cols["tpep_pickup_datetime"]],
+                      dtype="datetime64[s]")
+    out["pickup_hour"] = pickup.astype("datetime64[h]").astype(np.int64)
+    return out
@@ -1,7 +1,9 @@
 # Load cleaned CSVs into SQLite. Run: cd database && python insert_data.py
 # Pipeline must be run first (trips_cleaned.csv, taxi_zones.csv in database/cleaned/)
 # If data/taxi_zones.geojson exists we fill zone_geometry.
+# --compact uses schema_compact.sql: integer-encoded trips behind a `trips` view.
 
+import argparse
 import csv
 import json
 import sqlite3
@@ -12,6 +14,7 @@ PROJECT_ROOT = DB_DIR.parent
 DATA_DIR = PROJECT_ROOT / "data"
 CLEANED_DIR = DB_DIR / "cleaned"
 SCHEMA_PATH = DB_DIR / "schema.sql"
+COMPACT_SCHEMA_PATH = DB_DIR / "schema_compact.sql"
 DB_PATH = DB_DIR / "mobility.db"
 
 
@@ -24,8 +27,8 @@ TRIP_COLUMNS = (
 )
 
 
-def run_schema(conn):
-    with open(SCHEMA_PATH) as f:
+def run_schema(conn, path=SCHEMA_PATH):
+    with open(path) as f:
         conn.executescript(f.read())
 
 
@@ -99,6 +102,12 @@ def load_trips(conn):
                     return int(float(v))
                 except (ValueError, TypeError):
                     return None
+            if key in ("tpep_pickup_datetime", "tpep_dropoff_datetime"):
+                # epoch seconds (--epoch-timestamps) as ints for the integer columns; text stays text
+                try:
+                    return int(v)
+                except (ValueError, TypeError):
+                    return v
             try:
                 return float(v)
             except (ValueError, TypeError):
@@ -121,15 +130,20 @@ def load_trips(conn):
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Load database/cleaned/*.csv into mobility.db")
+    parser.add_argument("--compact", action="store_true",
+                        help="store trips as integers (epoch seconds, cents) behind a `trips` view")
+    args = parser.parse_args()
+
     CLEANED_DIR.mkdir(parents=True, exist_ok=True)
     conn = sqlite3.connect(DB_PATH)
     try:
-        run_schema(conn)
+        run_schema(conn, COMPACT_SCHEMA_PATH if args.compact else SCHEMA_PATH)
         load_zones(conn)
         load_zone_geometry(conn)
         load_trips(conn)
         conn.commit()
-        print(f"Database ready: {DB_PATH}")
+        print(f"Database ready: {DB_PATH} ({DB_PATH.stat().st_size / 1e6:.1f} MB)")
     finally:
         conn.close()
 
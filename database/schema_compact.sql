@@ -0,0 +1,164 @@
+-- NYC taxi trip schema (SQLite), compact storage variant
+-- Same tables and trip columns as schema.sql, but trips are stored in
+-- trips_compact as integers: epoch seconds for timestamps, cents for money,
+-- hundredths for distance/duration/speed/ratios, 0/1 for store_and_fwd_flag,
+-- and no per-row created_at. The trips view decodes them back under the
+-- schema.sql column names and an INSTEAD OF trigger encodes inserts, so
+-- queries and insert_data.py work unchanged.
+-- Use: python insert_data.py --compact
+
+CREATE TABLE IF NOT EXISTS taxi_zones (
+    location_id INTEGER PRIMARY KEY,
+    borough TEXT NOT NULL,
+    zone_name TEXT NOT NULL,
+    service_zone TEXT,
+    created_at TEXT DEFAULT (datetime('now'))
+);
+
+CREATE INDEX idx_taxi_zones_borough ON taxi_zones(borough);
+CREATE INDEX idx_taxi_zones_service_zone ON taxi_zones(service_zone);
+
+-- rate codes from TLC data dictionary
+CREATE TABLE IF NOT EXISTS rate_codes (
+    rate_code_id INTEGER PRIMARY KEY,
+    description TEXT NOT NULL
+);
+
+INSERT OR IGNORE INTO rate_codes (rate_code_id, description) VALUES
+(1, 'Standard rate'),
+(2, 'JFK'),
+(3, 'Newark'),
+(4, 'Nassau or Westchester'),
+(5, 'Negotiated fare'),
+(6, 'Group ride');
+
+CREATE TABLE IF NOT EXISTS payment_types (
+    payment_type_id INTEGER PRIMARY KEY,
+    description TEXT NOT NULL
+);
+
+INSERT OR IGNORE INTO payment_types (payment_type_id, description) VALUES
+(1, 'Credit card'),
+(2, 'Cash'),
+(3, 'No charge'),
+(4, 'Dispute'),
+(5, 'Unknown'),
+(6, 'Voided trip');
+
+-- integer-encoded trip storage
+CREATE TABLE IF NOT EXISTS trips_compact (
+    trip_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    vendor_id INTEGER,
+    pickup_ts INTEGER NOT NULL,            -- epoch seconds
+    dropoff_ts INTEGER NOT NULL,           -- epoch seconds
+    passenger_count INTEGER,
+    distance_centi INTEGER NOT NULL,       -- 1/100 mile
+    rate_code_id INTEGER,
+    store_and_fwd INTEGER,                 -- 1 = 'Y', 0 = 'N'
+    pu_location_id INTEGER NOT NULL,
+    do_location_id INTEGER NOT NULL,
+    payment_type_id INTEGER,
+    fare_cents INTEGER NOT NULL,
+    extra_cents INTEGER,
+    mta_tax_cents INTEGER,
+    tip_cents INTEGER,
+    tolls_cents INTEGER,
+    improvement_cents INTEGER,
+    total_cents INTEGER NOT NULL,
+    congestion_cents INTEGER,
+    duration_centi INTEGER,                -- 1/100 minute
+    speed_centi INTEGER,                   -- 1/100 mph
+    fare_per_mile_cents INTEGER,
+    tip_percentage_centi INTEGER,          -- 1/100 percent
+    is_peak_hour INTEGER,
+    FOREIGN KEY (pu_location_id) REFERENCES taxi_zones(location_id),
+    FOREIGN KEY (do_location_id) REFERENCES taxi_zones(location_id),
+    FOREIGN KEY (rate_code_id) REFERENCES rate_codes(rate_code_id),
+    FOREIGN KEY (payment_type_id) REFERENCES payment_types(payment_type_id)
+);
+
+-- schema.sql's trips columns, decoded, plus the stored epoch seconds for time filters
+CREATE VIEW IF NOT EXISTS trips AS
+SELECT trip_id,
+       vendor_id,
+       datetime(pickup_ts, 'unixepoch') AS tpep_pickup_datetime,
+       datetime(dropoff_ts, 'unixepoch') AS tpep_dropoff_datetime,
+       passenger_count,
+       distance_centi / 100.0 AS trip_distance,
+       rate_code_id,
+       CASE store_and_fwd WHEN 1 THEN 'Y' WHEN 0 THEN 'N' END AS store_and_fwd_flag,
+       pu_location_id,
+       do_location_id,
+       payment_type_id,
+       fare_cents / 100.0 AS fare_amount,
+       extra_cents / 100.0 AS extra,
+       mta_tax_cents / 100.0 AS mta_tax,
+       tip_cents / 100.0 AS tip_amount,
+       tolls_cents / 100.0 AS tolls_amount,
+       improvement_cents / 100.0 AS improvement_surcharge,
+       total_cents / 100.0 AS total_amount,
+       congestion_cents / 100.0 AS congestion_surcharge,
+       duration_centi / 100.0 AS trip_duration_minutes,
+       speed_centi / 100.0 AS speed_mph,
+       fare_per_mile_cents / 100.0 AS fare_per_mile,
+       tip_percentage_centi / 100.0 AS tip_percentage,
+       is_peak_hour,
+       pickup_ts,
+       dropoff_ts
+FROM trips_compact;
+
+-- timestamps may arrive as text or, from the pipeline's --epoch-timestamps, as epoch numbers
+CREATE TRIGGER IF NOT EXISTS trips_insert INSTEAD OF INSERT ON trips
+BEGIN
+    INSERT INTO trips_compact (
+        vendor_id, pickup_ts, dropoff_ts, passenger_count, distance_centi, rate_code_id,
+        store_and_fwd, pu_location_id, do_location_id, payment_type_id,
+        fare_cents, extra_cents, mta_tax_cents, tip_cents, tolls_cents, improvement_cents,
+        total_cents, congestion_cents, duration_centi, speed_centi,
+        fare_per_mile_cents, tip_percentage_centi, is_peak_hour
+    ) VALUES (
+        NEW.vendor_id,
+        CASE WHEN typeof(NEW.tpep_pickup_datetime) IN ('integer', 'real') THEN CAST(NEW.tpep_pickup_datetime AS INTEGER)
+             ELSE CAST(strftime('%s', NEW.tpep_pickup_datetime) AS INTEGER) END,
+        CASE WHEN typeof(NEW.tpep_dropoff_datetime) IN ('integer', 'real') THEN CAST(NEW.tpep_dropoff_datetime AS INTEGER)
+             ELSE CAST(strftime('%s', NEW.tpep_dropoff_datetime) AS INTEGER) END,
+        NEW.passenger_count,
+        CAST(round(NEW.trip_distance * 100) AS INTEGER),
+        NEW.rate_code_id,
+        CASE NEW.store_and_fwd_flag WHEN 'Y' THEN 1 WHEN 'N' THEN 0 END,
+        NEW.pu_location_id,
+        NEW.do_location_id,
+        NEW.payment_type_id,
+        CAST(round(NEW.fare_amount * 100) AS INTEGER),
+        CAST(round(NEW.extra * 100) AS INTEGER),
+        CAST(round(NEW.mta_tax * 100) AS INTEGER),
+        CAST(round(NEW.tip_amount * 100) AS INTEGER),
+        CAST(round(NEW.tolls_amount * 100) AS INTEGER),
+        CAST(round(NEW.improvement_surcharge * 100) AS INTEGER),
+        CAST(round(NEW.total_amount * 100) AS INTEGER),
+        CAST(round(NEW.congestion_surcharge * 100) AS INTEGER),
+        CAST(round(NEW.trip_duration_minutes * 100) AS INTEGER),
+        CAST(round(NEW.speed_mph * 100) AS INTEGER),
+        CAST(round(NEW.fare_per_mile * 100) AS INTEGER),
+        CAST(round(NEW.tip_percentage * 100) AS INTEGER),
+        NEW.is_peak_hour
+    );
+END;
+
+-- time ranges compare epochs (pickup_ts >= CAST(strftime('%s', '2019-01-15') AS INTEGER) ...),
+-- so the timestamp indexes stay 4-byte integers; the amount indexes use the view's expressions
+CREATE INDEX idx_trips_pickup_datetime ON trips_compact(pickup_ts);
+CREATE INDEX idx_trips_dropoff_datetime ON trips_compact(dropoff_ts);
+CREATE INDEX idx_trips_pu_location ON trips_compact(pu_location_id);
+CREATE INDEX idx_trips_do_location ON trips_compact(do_location_id);
+CREATE INDEX idx_trips_total_amount ON trips_compact(total_cents / 100.0);
+CREATE INDEX idx_trips_trip_distance ON trips_compact(distance_centi / 100.0);
+CREATE INDEX idx_trips_duration ON trips_compact(duration_centi / 100.0);
+CREATE INDEX idx_trips_peak_hour ON trips_compact(is_peak_hour);
+
+-- optional: zone shapes (geojson text)
+CREATE TABLE IF NOT EXISTS zone_geometry (
+    location_id INTEGER PRIMARY KEY,
+    geojson_text TEXT,
+    FOREIGN KEY (location_id) REFERENCES taxi_zones(location_id)
+);
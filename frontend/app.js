@@ -1,4 +1,6 @@
-const API = "http://localhost:5002/api";
+const API_BASE =
+  document.querySelector('meta[name="api-base"]')?.content ?? "http://localhost:5002";
+const API = API_BASE + "/api";
 
 /* ── State ──────────────────────────────────────────────────────────── */
 let filters = {
@@ -515,7 +517,7 @@ function renderPeakHours(rows) {
 }
 
 /* ── Leaflet Map ─────────────────────────────────────────────────────── */
-const ZONE_GEOJSON_URL = "http://localhost:5002/api/zones/geojson";
+const ZONE_GEOJSON_URL = API + "/zones/geojson";
 
 const LEGEND_STEPS = [
   { min: 100000, color: "#67000d", label: "> 100K" },
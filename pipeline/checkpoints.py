@@ -0,0 +1,105 @@
+# Content-addressed stage checkpoints for run_pipeline.
+# Each stage output is stored as <stage>-<key>.parquet (+ .json metadata), where
+# key hashes the upstream key, the input file contents, the stage params, the
+# source code of the functions and modules the stage runs and the module
+# constants it reads. Editing any of them changes its key (and every later
+# key), so stale checkpoints are never reused; unchanged upstream stages are
+# loaded instead of recomputed. A stage may also save extra numpy arrays with
+# its checkpoint (<stage>-<key>.<name>.npy). Only the latest checkpoint of
+# each stage is kept: saving one deletes the stage's entries under other keys,
+# so changed inputs or code don't pile up full Parquet copies.
+
+import hashlib
+import inspect
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+CHECKPOINT_DIR = Path(__file__).resolve().parent / ".checkpoints"
+DIGEST_CACHE = "input_digests.json"
+
+
+def code_digest(deps):
+    # functions, classes and modules by source; constants (lists, dicts) by repr
+    h = hashlib.sha256()
+    for dep in deps:
+        text = inspect.getsource(dep) if callable(dep) or inspect.ismodule(dep) else repr(dep)
+        h.update(text.encode("utf-8"))
+    return h.hexdigest()
+
+
+def stage_key(parent_key, stage, params, deps):
+    payload = json.dumps([parent_key, stage, params, code_digest(deps)], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class CheckpointStore:
+    def __init__(self, root=CHECKPOINT_DIR):
+        self.root = Path(root)
+
+    def _path(self, stage, key, suffix):
+        return self.root / f"{stage}-{key}{suffix}"
+
+    def file_digest(self, path):
+        # sha256 of the file contents, cached by (size, mtime) so re-runs don't rehash GBs
+        path = Path(path)
+        stat = path.stat()
+        cache_path = self.root / DIGEST_CACHE
+        cache = json.loads(cache_path.read_text(encoding="utf-8")) if cache_path.exists() else {}
+        entry = cache.get(str(path))
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            return entry["sha256"]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        cache[str(path)] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": h.hexdigest()}
+        self.root.mkdir(parents=True, exist_ok=True)
+        cache_path.write_text(json.dumps(cache, indent=2), encoding="utf-8")
+        return h.hexdigest()
+
+    def exists(self, stage, key):
+        return self._path(stage, key, ".parquet").exists() and self._path(stage, key, ".json").exists()
+
+    def load(self, stage, key):
+        df = pd.read_parquet(self._path(stage, key, ".parquet"))
+        meta = json.loads(self._path(stage, key, ".json").read_text(encoding="utf-8"))
+        return df, meta
+
+    def load_array(self, stage, key, name):
+        path = self._path(stage, key, f".{name}.npy")
+        return np.load(path) if path.exists() else None
+
+    def save(self, stage, key, df, meta=None, arrays=None):
+        self.root.mkdir(parents=True, exist_ok=True)
+        df.to_parquet(self._path(stage, key, ".parquet"), index=False)
+        for name, arr in (arrays or {}).items():
+            np.save(self._path(stage, key, f".{name}.npy"), arr)
+        # metadata last: a checkpoint only counts once both files exist
+        self._path(stage, key, ".json").write_text(json.dumps(meta or {}, indent=2), encoding="utf-8")
+        for path in self.root.glob(f"{stage}-*"):
+            if not path.name.startswith(f"{stage}-{key}."):
+                path.unlink()
+
+    def entries(self):
+        out = []
+        for meta_path in sorted(self.root.glob("*-*.json")):
+            stage, key = meta_path.stem.rsplit("-", 1)
+            data = meta_path.with_suffix(".parquet")
+            if not data.exists():
+                continue
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            out.append({"stage": stage, "key": key, "rows": meta.get("rows"),
+                        "size_mb": data.stat().st_size / 1e6, "mtime": data.stat().st_mtime})
+        return out
+
+    def clear(self, stage=None):
+        removed = 0
+        for path in [p for suffix in ("parquet", "json", "npy") for p in self.root.glob(f"{stage or '*'}-*.{suffix}")]:
+            if path.name == DIGEST_CACHE:
+                continue
+            path.unlink()
+            removed += path.suffix == ".parquet"
+        return removed
@@ -1,14 +1,58 @@
 # NYC taxi data pipeline: load, clean, derive features, output to database/cleaned
 
+import argparse
 import sys
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
+import pyarrow.dataset as ds
+
+import dedup
+from checkpoints import CheckpointStore, stage_key
+from dedup import FINGERPRINT_DIR, FingerprintSet, FingerprintStore, trip_fingerprints
+from profiling import DEEP_MODES, StageProfiler, peak_memory_mb
 
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 DATA_DIR = PROJECT_ROOT / "data"
 OUTPUT_DIR = PROJECT_ROOT / "database" / "cleaned"
 CLEANING_LOG_PATH = Path(__file__).resolve().parent / "cleaning_log.md"
+PROFILE_PATH = OUTPUT_DIR / "pipeline_profile.json"
+
+TIMESTAMP_COLS = ["tpep_pickup_datetime", "tpep_dropoff_datetime"]
+TIMESTAMP_TEXT_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# TLC column names after standardize_columns -> pipeline names
+COLUMN_RENAMES = {
+    "vendorid": "vendor_id",
+    "ratecodeid": "rate_code_id",
+    "pulocationid": "pu_location_id",
+    "dolocationid": "do_location_id",
+    "payment_type": "payment_type_id",
+}
+
+OUTPUT_COLUMNS = [
+    "vendor_id", "tpep_pickup_datetime", "tpep_dropoff_datetime", "passenger_count",
+    "trip_distance", "rate_code_id", "store_and_fwd_flag", "pu_location_id", "do_location_id",
+    "payment_type_id", "fare_amount", "extra", "mta_tax", "tip_amount", "tolls_amount",
+    "improvement_surcharge", "total_amount", "congestion_surcharge",
+    "trip_duration_minutes", "speed_mph", "fare_per_mile", "tip_percentage", "is_peak_hour",
+]
+
+# pipeline name -> standardized TLC name, for picking source columns before renaming
+RAW_NAMES = {new: old for old, new in COLUMN_RENAMES.items()}
+
+# simple bounds rules clean_trips would apply anyway, pushed down into the parquet scan: (column, op, value)
+READ_BOUNDS = [("trip_distance", ">", 0), ("total_amount", ">=", 0), ("fare_amount", ">=", 0),
+               ("pu_location_id", "not null", None), ("do_location_id", "not null", None)]
+READ_OPS = {">": lambda f, v: f > v, ">=": lambda f, v: f >= v, "not null": lambda f, v: f.is_valid()}
+
+# compact dtypes applied right after loading
+LOCATION_COLS = ["pu_location_id", "do_location_id"]                     # 1..265 -> uint16
+CODE_COLS = ["vendor_id", "rate_code_id", "payment_type_id", "passenger_count"]  # small codes -> int8
+AMOUNT_COLS = ["trip_distance", "fare_amount", "extra", "mta_tax", "tip_amount", "tolls_amount",
+               "improvement_surcharge", "total_amount", "congestion_surcharge"]  # -> float32, or int if whole
+FLAG_COLS = ["store_and_fwd_flag"]                                       # Y/N -> category
 
 
 # custom merge sort
@@ -71,22 +115,108 @@ def custom_iqr_outlier_mask(values, lower_coef=1.5, upper_coef=1.5):
     return result
 
 
-def load_trip_data():
-    # parquet first (TLC spec), fallback to csv
+def trip_input_files():
+    # every file load_trip_data may read, plus the zone lookup; hashed into the checkpoint keys
+    files = sorted(DATA_DIR.glob("yellow_tripdata_*.parquet"))[:1] + sorted(DATA_DIR.glob("yellow_tripdata_*.csv"))[:1]
+    return files + [DATA_DIR / "taxi_zone_lookup.csv"]
+
+
+def projected_columns():
+    # standardized names of the raw columns load_trip_data reads: everything OUTPUT_COLUMNS is made from
+    return sorted({RAW_NAMES.get(c, c) for c in OUTPUT_COLUMNS})
+
+
+def _source_columns(names):
+    # raw file columns that feed OUTPUT_COLUMNS (matched the way standardize_columns renames them)
+    wanted = set(projected_columns())
+    return [n for n in names if n.strip().lower().replace(" ", "_") in wanted]
+
+
+def _raw_name(names, col):
+    for n in names:
+        if n.strip().lower().replace(" ", "_") == RAW_NAMES.get(col, col):
+            return n
+    return None
+
+
+def _read_filter(names):
+    # READ_BOUNDS as one expression evaluated inside the parquet scan
+    expr = None
+    for col, op, value in READ_BOUNDS:
+        name = _raw_name(names, col)
+        if name is not None:
+            cond = READ_OPS[op](ds.field(name), value)
+            expr = cond if expr is None else expr & cond
+    return expr
+
+
+def _sample_positions(total, n, method, rng, pickup=None):
+    # sorted row positions: uniform over the file, or proportional per pickup day
+    n = min(n, total)
+    if method == "stratified" and pickup is not None:
+        days = pd.to_datetime(pd.Series(pickup), errors="coerce").dt.floor("D").to_numpy()
+        picked = []
+        for day in pd.unique(days):
+            members = np.flatnonzero(days == day) if day == day else np.flatnonzero(pd.isna(days))
+            quota = int(round(n * len(members) / total))
+            if quota:
+                picked.append(rng.choice(members, size=min(quota, len(members)), replace=False))
+        positions = np.concatenate(picked) if picked else np.empty(0, dtype=np.int64)
+        if len(positions) > n:   # per-day rounding can overshoot by a few rows
+            positions = rng.choice(positions, size=n, replace=False)
+    else:
+        positions = rng.choice(total, size=n, replace=False)
+    return np.sort(positions)
+
+
+def load_trip_data(sample_rows=None, sample_method="random", seed=0, pushdown=True):
+    # parquet first (TLC spec), fallback to csv; only the columns the pipeline outputs are read.
+    # Returns (df, rows dropped by the pushed-down read filter).
+    rng = np.random.default_rng(seed)
     parquet_files = sorted(DATA_DIR.glob("yellow_tripdata_*.parquet"))
     if parquet_files:
         try:
-            df = pd.read_parquet(parquet_files[0])
-            print(f"Loaded parquet: {parquet_files[0].name}")
-            return df
+            dataset = ds.dataset(parquet_files[0], format="parquet")
+            columns = _source_columns(dataset.schema.names)
+            expr = _read_filter(dataset.schema.names) if pushdown else None
+            total = dataset.count_rows()   # from parquet metadata
+            if sample_rows:
+                pickup = None
+                if sample_method == "stratified":
+                    pickup = dataset.to_table(columns=[_raw_name(dataset.schema.names, "tpep_pickup_datetime")]).column(0).to_pandas()
+                positions = _sample_positions(total, sample_rows, sample_method, rng, pickup)
+                table = dataset.take(positions, columns=columns)
+                read = table.num_rows
+                if expr is not None:
+                    table = table.filter(expr)
+                print(f"Sampled {read} rows ({sample_method}) of {total}.")
+            else:
+                read = total
+                table = dataset.to_table(columns=columns, filter=expr)
+            df = table.to_pandas()
+            print(f"Loaded parquet: {parquet_files[0].name} ({len(columns)} columns)")
+            return df, read - len(df)
         except Exception as e:
             print(f"Parquet read failed ({e}), trying CSV...")
     csv_files = sorted(DATA_DIR.glob("yellow_tripdata_*.csv"))
     if not csv_files:
         raise FileNotFoundError(f"No yellow_tripdata_*.parquet or *.csv in {DATA_DIR}")
-    df = pd.read_csv(csv_files[0])
-    print(f"Loaded CSV: {csv_files[0].name}")
-    return df
+    names = pd.read_csv(csv_files[0], nrows=0).columns
+    columns = _source_columns(names)
+    skip = None
+    if sample_rows:
+        with open(csv_files[0], "rb") as f:
+            total = sum(block.count(b"\n") for block in iter(lambda: f.read(1 << 20), b"")) - 1
+        pickup = None
+        if sample_method == "stratified":
+            pickup = pd.read_csv(csv_files[0], usecols=[_raw_name(names, "tpep_pickup_datetime")]).iloc[:, 0]
+        # file line i + 1 holds data row i
+        keep = set((_sample_positions(total, sample_rows, sample_method, rng, pickup) + 1).tolist())
+        skip = lambda i: i != 0 and i not in keep
+        print(f"Sampled {len(keep)} rows ({sample_method}) of {total}.")
+    df = pd.read_csv(csv_files[0], usecols=columns, skiprows=skip)
+    print(f"Loaded CSV: {csv_files[0].name} ({len(columns)} columns)")
+    return df, 0
 
 
 def load_zone_lookup():
@@ -97,106 +227,143 @@ def load_zone_lookup():
 
 
 def standardize_columns(df):
-    df = df.copy()
-    df.columns = [c.strip().lower().replace(" ", "_") for c in df.columns]
+    # rename only; no copy of the data under pandas copy-on-write
+    return df.rename(columns=lambda c: c.strip().lower().replace(" ", "_"))
+
+
+def downcast_columns(df):
+    # ids/codes stay float32 while they still hold NaN; clean_trips narrows them after filtering
+    for col in AMOUNT_COLS:
+        if col in df.columns:
+            values = pd.to_numeric(df[col], errors="coerce")
+            # whole-number columns (tolls_amount in the Jan file) stay integers, so the CSV still writes 0, not 0.0
+            df[col] = (pd.to_numeric(values, downcast="integer") if pd.api.types.is_integer_dtype(values)
+                       else values.astype("float32"))
+    for col in LOCATION_COLS + CODE_COLS:
+        if col in df.columns:
+            values = pd.to_numeric(df[col], errors="coerce")
+            small = "uint16" if col in LOCATION_COLS else "int8"
+            df[col] = values.astype("float32" if values.isna().any() else small)
+    for col in FLAG_COLS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
     return df
 
 
-def clean_trips(raw_df, zone_lookup_df):
-    df = raw_df.copy()
-    df = standardize_columns(df)
-    zone_lookup_df = standardize_columns(zone_lookup_df)
+def clean_trips(raw_df, zone_lookup_df, excluded_at_read=0, fingerprints=None, profiler=None):
+    # every rule marks rows in one boolean mask; the frame is filtered once at the end.
+    # excluded_at_read: rows load_trip_data already dropped with its pushed-down filter
+    # fingerprints: FingerprintSet shared across chunks/files (a fresh one dedups within this frame)
+    # profiler: StageProfiler that times each rule as a sub-step of the current stage
+    fingerprints = fingerprints if fingerprints is not None else FingerprintSet()
+    profiler = profiler or StageProfiler()
+    with profiler.stage("standardize", rows_in=len(raw_df)) as step:
+        df = standardize_columns(raw_df)
+        zone_lookup_df = standardize_columns(zone_lookup_df)
 
-    valid_location_ids = set(zone_lookup_df["locationid"].astype(int))
+        valid_location_ids = set(zone_lookup_df["locationid"].astype(int))
 
-    # rename cols that come in with different names from TLC
-    col_map = {
-        "vendorid": "vendor_id",
-        "ratecodeid": "rate_code_id",
-        "pulocationid": "pu_location_id",
-        "dolocationid": "do_location_id",
-        "payment_type": "payment_type_id",
-    }
-    for old, new in col_map.items():
-        if old in df.columns and new not in df.columns:
-            df = df.rename(columns={old: new})
+        # rename cols that come in with different names from TLC
+        df = df.rename(columns={old: new for old, new in COLUMN_RENAMES.items()
+                                if old in df.columns and new not in df.columns})
+        df = downcast_columns(df)
+        step.rows_out = len(df)
 
     initial_count = len(df)
     log = {"steps": [], "excluded_count": 0, "excluded_reasons": {}}
+    keep = np.ones(initial_count, dtype=bool)
+    if excluded_at_read:
+        log["steps"].append(f"Drop at read (distance/fare/amount bounds, null locations): {excluded_at_read} rows")
+        log["excluded_count"] += excluded_at_read
+        log["excluded_reasons"]["read_filter"] = excluded_at_read
+
+    def exclude(drop, reason, step, record=None):
+        # count only rows still kept, so each reason matches the old sequential filters
+        dropped = int((keep & drop).sum())
+        keep[drop] = False
+        log["steps"].append(f"{step}: {dropped} rows")
+        log["excluded_count"] += dropped
+        log["excluded_reasons"][reason] = dropped
+        if record is not None:
+            record.rows_out = record.rows_in - dropped
+
+    remaining = lambda: int(keep.sum())
 
     required = ["tpep_pickup_datetime", "tpep_dropoff_datetime", "trip_distance", "total_amount", "pu_location_id", "do_location_id"]
     present = [c for c in required if c in df.columns]
-    before = len(df)
-    df = df.dropna(subset=present)
-    dropped = before - len(df)
-    log["steps"].append(f"Drop missing in {present}: {dropped} rows")
-    log["excluded_count"] += dropped
-    log["excluded_reasons"]["missing_required"] = dropped
-    print("  - drop missing done")
+    with profiler.stage("dropna", rows_in=remaining()) as step:
+        exclude(df[present].isna().any(axis=1).to_numpy(), "missing_required", f"Drop missing in {present}", step)
+    print(f"  - drop missing done ({step.wall_s:.2f}s)")
+
+    # the only timestamp parse in the pipeline; unparseable values become NaT and fail the bounds check
+    with profiler.stage("normalize_timestamps", rows_in=len(df)) as step:
+        df = normalize_timestamps(df)
+        step.rows_out = len(df)
 
     key_cols = [c for c in ["tpep_pickup_datetime", "tpep_dropoff_datetime", "pu_location_id", "do_location_id", "total_amount"] if c in df.columns]
     if key_cols:
-        before = len(df)
-        df = df.drop_duplicates(subset=key_cols)
-        dup = before - len(df)
-        log["steps"].append(f"Drop duplicates on {key_cols}: {dup} rows")
-        log["excluded_count"] += dup
-        log["excluded_reasons"]["duplicates"] = dup
-        print("  - drop duplicates done")
+        with profiler.stage("dedup", rows_in=remaining()) as step:
+            dup = np.zeros(initial_count, dtype=bool)
+            # amounts keyed as float whatever their column dtype, so fingerprints match across files
+            keys = df.loc[keep, key_cols].astype({c: "float32" for c in key_cols if c in AMOUNT_COLS})
+            dup[keep] = fingerprints.mark_duplicates(trip_fingerprints(keys, key_cols))
+            exclude(dup, "duplicates", f"Drop duplicates on {key_cols}", step)
+        print(f"  - drop duplicates done ({step.wall_s:.2f}s)")
 
     if "pu_location_id" in df.columns and "do_location_id" in df.columns:
-        before = len(df)
-        df = df[
-            df["pu_location_id"].astype(int).isin(valid_location_ids)
-            & df["do_location_id"].astype(int).isin(valid_location_ids)
-        ]
-        inv = before - len(df)
-        log["steps"].append(f"Drop invalid PULocationID/DOLocationID: {inv} rows")
-        log["excluded_count"] += inv
-        log["excluded_reasons"]["invalid_locations"] = inv
-        print("  - invalid locations done")
-
-    before = len(df)
-    if "trip_distance" in df.columns:
-        df = df[df["trip_distance"] > 0]
-    if "total_amount" in df.columns:
-        df = df[df["total_amount"] >= 0]
-    if "fare_amount" in df.columns:
-        df = df[df["fare_amount"] >= 0]
-    if "tpep_pickup_datetime" in df.columns and "tpep_dropoff_datetime" in df.columns:
-        df["_pickup_ts"] = pd.to_datetime(df["tpep_pickup_datetime"], errors="coerce")
-        df["_dropoff_ts"] = pd.to_datetime(df["tpep_dropoff_datetime"], errors="coerce")
-        df = df.dropna(subset=["_pickup_ts", "_dropoff_ts"])
-        df = df[df["_dropoff_ts"] > df["_pickup_ts"]]
-        df = df.drop(columns=["_pickup_ts", "_dropoff_ts"])
-    bound = before - len(df)
-    log["steps"].append(f"Drop invalid bounds (distance/fare/time): {bound} rows")
-    log["excluded_count"] += bound
-    log["excluded_reasons"]["invalid_bounds"] = bound
-    print("  - bounds check done")
+        with profiler.stage("location_filter", rows_in=remaining()) as step:
+            valid = df["pu_location_id"].isin(valid_location_ids) & df["do_location_id"].isin(valid_location_ids)
+            exclude(~valid.to_numpy(), "invalid_locations", "Drop invalid PULocationID/DOLocationID", step)
+        print(f"  - invalid locations done ({step.wall_s:.2f}s)")
+
+    with profiler.stage("bounds", rows_in=remaining()) as step:
+        bad = np.zeros(initial_count, dtype=bool)
+        if "trip_distance" in df.columns:
+            bad |= ~(df["trip_distance"] > 0).to_numpy()
+        if "total_amount" in df.columns:
+            bad |= ~(df["total_amount"] >= 0).to_numpy()
+        if "fare_amount" in df.columns:
+            bad |= ~(df["fare_amount"] >= 0).to_numpy()
+        if "tpep_pickup_datetime" in df.columns and "tpep_dropoff_datetime" in df.columns:
+            bad |= ~(df["tpep_dropoff_datetime"] > df["tpep_pickup_datetime"]).to_numpy()   # NaT compares False
+        exclude(bad, "invalid_bounds", "Drop invalid bounds (distance/fare/time)", step)
+    print(f"  - bounds check done ({step.wall_s:.2f}s)")
 
     for col, name in [("trip_distance", "trip_distance"), ("total_amount", "total_amount")]:
         if col not in df.columns:
             continue
         print(f"  - IQR outliers ({name})...", flush=True)
-        mask = custom_iqr_outlier_mask(df[col].tolist())
-        before = len(df)
-        df = df[[not m for m in mask]]
-        out = before - len(df)
-        log["steps"].append(f"Custom IQR outliers ({name}): {out} rows")
-        log["excluded_count"] += out
-        log["excluded_reasons"][f"outlier_{name}"] = out
+        with profiler.stage(f"iqr_{name}", rows_in=remaining()) as step:
+            outliers = np.zeros(initial_count, dtype=bool)
+            outliers[keep] = custom_iqr_outlier_mask(df.loc[keep, col].tolist())
+            exclude(outliers, f"outlier_{name}", f"Custom IQR outliers ({name})", step)
+
+    with profiler.stage("apply_mask", rows_in=initial_count) as step:
+        df = df[keep]
+        for col in LOCATION_COLS:
+            if col in df.columns and df[col].dtype == "float32":
+                df[col] = df[col].astype("uint16")
+        step.rows_out = len(df)
 
     log["final_count"] = len(df)
-    log["initial_count"] = initial_count
+    log["initial_count"] = initial_count + excluded_at_read
     return df, log
 
 
 def normalize_timestamps(df):
-    for col in ["tpep_pickup_datetime", "tpep_dropoff_datetime"]:
-        if col not in df.columns:
-            continue
-        df[col] = pd.to_datetime(df[col], errors="coerce").dt.strftime("%Y-%m-%d %H:%M:%S")
+    # parse to datetime64 (no-op when already parsed); text/epoch formatting happens in format_timestamps
+    for col in TIMESTAMP_COLS:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+    return df
+
+
+def format_timestamps(df, timestamp_format="text"):
+    # output boundary: "text" is left to to_csv(date_format=...), "epoch" writes integer seconds
+    if timestamp_format == "epoch":
+        for col in TIMESTAMP_COLS:
+            if col in df.columns:
+                df[col] = df[col].dt.as_unit("s").astype("int64")
     return df
 
 
@@ -211,34 +378,39 @@ def normalize_numerics(df):
     return df
 
 
+def _as_float64(s):
+    # float32 amounts/distances carry 2 decimals; widen back to the exact float64 value for ratios
+    return s.astype("float64").round(2)
+
+
 def add_derived_features(df):
     # 5 derived: duration, speed, fare/mile, tip%, peak hour (7-9, 16-19)
-    df = df.copy()
-    pickup = pd.to_datetime(df["tpep_pickup_datetime"], errors="coerce")
-    dropoff = pd.to_datetime(df["tpep_dropoff_datetime"], errors="coerce")
+    distance = _as_float64(df["trip_distance"])
+    pickup = df["tpep_pickup_datetime"]
+    dropoff = df["tpep_dropoff_datetime"]
     duration = (dropoff - pickup).dt.total_seconds() / 60.0
-    df["trip_duration_minutes"] = duration.round(2)
+    df["trip_duration_minutes"] = duration.round(2).astype("float32")
 
     hours = duration / 60.0
     hours = hours.replace(0, float("nan"))
-    df["speed_mph"] = (df["trip_distance"] / hours).round(2)
-    df["speed_mph"] = df["speed_mph"].fillna(0).clip(upper=100)
+    df["speed_mph"] = (distance / hours).round(2)
+    df["speed_mph"] = df["speed_mph"].fillna(0).clip(upper=100).astype("float32")
 
-    dist = df["trip_distance"].replace(0, float("nan"))
-    df["fare_per_mile"] = (df["fare_amount"] / dist).round(2)
-    df["fare_per_mile"] = df["fare_per_mile"].fillna(0)
+    dist = distance.replace(0, float("nan"))
+    df["fare_per_mile"] = (_as_float64(df["fare_amount"]) / dist).round(2)
+    df["fare_per_mile"] = df["fare_per_mile"].fillna(0).astype("float32")
 
-    total = df["total_amount"].replace(0, float("nan"))
-    df["tip_percentage"] = (100.0 * df["tip_amount"] / total).round(2)
-    df["tip_percentage"] = df["tip_percentage"].fillna(0)
+    total = _as_float64(df["total_amount"]).replace(0, float("nan"))
+    df["tip_percentage"] = (100.0 * _as_float64(df["tip_amount"]) / total).round(2)
+    df["tip_percentage"] = df["tip_percentage"].fillna(0).astype("float32")
 
     hour = pickup.dt.hour
-    df["is_peak_hour"] = ((hour >= 7) & (hour <= 9) | (hour >= 16) & (hour <= 19)).astype(int)
+    df["is_peak_hour"] = ((hour >= 7) & (hour <= 9) | (hour >= 16) & (hour <= 19)).astype("int8")
 
     return df
 
 
-def write_cleaning_log(log, path=CLEANING_LOG_PATH):
+def write_cleaning_log(log, path=CLEANING_LOG_PATH, profiler=None):
     lines = [
         "# Data Cleaning Log",
         "",
@@ -246,6 +418,10 @@ def write_cleaning_log(log, path=CLEANING_LOG_PATH):
         f"- Initial row count: {log.get('initial_count', 'N/A')}",
         f"- Final row count: {log.get('final_count', 'N/A')}",
         f"- Total excluded: {log.get('excluded_count', 'N/A')}",
+    ]
+    if log.get("peak_memory_mb") is not None:
+        lines.append(f"- Peak memory (RSS): {log['peak_memory_mb']:.1f} MB")
+    lines += [
         "",
         "## Steps",
     ]
@@ -254,55 +430,181 @@ def write_cleaning_log(log, path=CLEANING_LOG_PATH):
     lines.extend(["", "## Excluded by reason", ""])
     for reason, count in log.get("excluded_reasons", {}).items():
         lines.append(f"- {reason}: {count}")
+    if profiler is not None and profiler.records:
+        lines.extend(["", "## Stage profile", ""])
+        lines.extend(profiler.markdown())
     path.parent.mkdir(parents=True, exist_ok=True)
     path.write_text("\n".join(lines), encoding="utf-8")
 
 
-def run_pipeline(sample_rows=None):
+def select_output_columns(df):
+    return df[[c for c in OUTPUT_COLUMNS if c in df.columns]]
+
+
+def run_pipeline(sample_rows=None, timestamp_format="text", use_checkpoints=True, store=None,
+                 sample_method="random", seed=0, dedup_store=None, profile_path=PROFILE_PATH, deep_profile=None):
+    # profile_path: JSON stage report (wall/CPU time, peak RSS growth, rows in/out per stage and sub-step)
+    # deep_profile: "cprofile" or "tracemalloc" for function-level time or Python heap peaks as well
     DATA_DIR.mkdir(parents=True, exist_ok=True)
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    store = store or CheckpointStore()
+    profiler = StageProfiler(deep_profile)
 
-    print("Loading trip data...")
-    trips = load_trip_data()
-    print("Loading zone lookup...")
-    zones = load_zone_lookup()
+    # dedup_store: directory of per-file fingerprint sets, to drop trips already seen in other monthly files
+    fingerprint_store = FingerprintStore(dedup_store) if dedup_store else None
+    source = None
+    if fingerprint_store is not None:
+        source = store.file_digest(next(p for p in trip_input_files() if p.exists()))[:16]
 
-    if sample_rows:
-        trips = trips.head(sample_rows)
-        print(f"Using sample of {sample_rows} rows.")
-
-    print("Cleaning...")
-    trips_clean, cleaning_log = clean_trips(trips, zones)
-    print("Normalizing timestamps and numerics...")
-    trips_clean = normalize_timestamps(trips_clean)
-    trips_clean = normalize_numerics(trips_clean)
-    print("Adding derived features...")
-    trips_clean = add_derived_features(trips_clean)
-
-    out_cols = [
-        "vendor_id", "tpep_pickup_datetime", "tpep_dropoff_datetime", "passenger_count",
-        "trip_distance", "rate_code_id", "store_and_fwd_flag", "pu_location_id", "do_location_id",
-        "payment_type_id", "fare_amount", "extra", "mta_tax", "tip_amount", "tolls_amount",
-        "improvement_surcharge", "total_amount", "congestion_surcharge",
-        "trip_duration_minutes", "speed_mph", "fare_per_mile", "tip_percentage", "is_peak_hour",
+    print("Loading zone lookup...")
+    with profiler.stage("zone_lookup") as step:
+        zones = load_zone_lookup()
+        step.rows_out = len(zones)
+
+    # stages take and return (trips frame, cleaning log)
+    def load(_, log):
+        print("Loading trip data...")
+        trips, excluded = load_trip_data(sample_rows, sample_method, seed)
+        return trips, {"excluded_at_read": excluded}
+
+    # a sample must not stand in for the whole file
+    save_fingerprints = fingerprint_store is not None and not sample_rows
+    stage_arrays = {}   # stage name -> arrays saved with its checkpoint
+
+    def store_fingerprints(seen):
+        fingerprint_store.save(source, seen)
+        print(f"Saved {len(seen)} fingerprints to {fingerprint_store.root}")
+
+    def clean(trips, log):
+        print("Cleaning...")
+        known = fingerprint_store.known(exclude=source) if fingerprint_store else None
+        fingerprints = FingerprintSet(known)
+        trips, log = clean_trips(trips, zones, log.get("excluded_at_read", 0), fingerprints, profiler)
+        if save_fingerprints:
+            store_fingerprints(fingerprints.seen)
+            stage_arrays["clean"] = {"fingerprints": fingerprints.seen}
+        return trips, log
+
+    def normalize(trips, log):
+        print("Normalizing timestamps and numerics...")
+        trips = normalize_timestamps(trips)   # already parsed by clean_trips
+        return normalize_numerics(trips), log
+
+    def derive(trips, log):
+        print("Adding derived features...")
+        return add_derived_features(trips), log
+
+    def write(trips, log):
+        return format_timestamps(select_output_columns(trips), timestamp_format), log
+
+    # (name, stage fn, params, code and module constants hashed into the key)
+    stages = [
+        ("load", load, {"sample_rows": sample_rows, "sample_method": sample_method, "seed": seed,
+                        "columns": projected_columns(), "read_filter": READ_BOUNDS},
+         [load, load_trip_data, projected_columns, _source_columns, _raw_name, _read_filter, _sample_positions]),
+        ("clean", clean,
+         {"dedup_against": [s for s in fingerprint_store.sources() if s != source] if fingerprint_store else None},
+         [clean, clean_trips, standardize_columns, downcast_columns, normalize_timestamps,
+          custom_iqr_outlier_mask, _merge_sort, _get_quartiles, dedup,
+          COLUMN_RENAMES, LOCATION_COLS, CODE_COLS, AMOUNT_COLS, FLAG_COLS, TIMESTAMP_COLS]),
+        ("normalize", normalize, {}, [normalize, normalize_timestamps, normalize_numerics, TIMESTAMP_COLS]),
+        ("derive", derive, {}, [derive, add_derived_features, _as_float64]),
+        ("write", write, {"timestamp_format": timestamp_format},
+         [write, select_output_columns, format_timestamps, OUTPUT_COLUMNS, TIMESTAMP_COLS]),
     ]
-    out_cols = [c for c in out_cols if c in trips_clean.columns]
-    trips_clean = trips_clean[out_cols]
+    clean_at = [name for name, *_ in stages].index("clean")
+
+    start, trips_clean, cleaning_log = 0, None, {}
+    if use_checkpoints:
+        key = ",".join(store.file_digest(p) for p in trip_input_files() if p.exists())
+        keys = []
+        for name, _, params, funcs in stages:
+            key = stage_key(key, name, params, funcs)
+            keys.append(key)
+        for i in range(len(stages) - 1, -1, -1):
+            if store.exists(stages[i][0], keys[i]):
+                with profiler.stage(f"checkpoint_load_{stages[i][0]}") as step:
+                    trips_clean, meta = store.load(stages[i][0], keys[i])
+                    step.rows_out = len(trips_clean)
+                cleaning_log = meta.get("log", {})
+                start = i + 1
+                print(f"Resuming after '{stages[i][0]}' checkpoint {keys[i]} ({len(trips_clean)} rows)")
+                break
+        if save_fingerprints and start > clean_at:   # clean was restored, not run: store its fingerprints
+            seen = store.load_array("clean", keys[clean_at], "fingerprints")
+            if seen is not None:
+                store_fingerprints(seen)
+            else:
+                print("No fingerprints stored with the clean checkpoint; rerun with --no-checkpoints to record them")
+
+    for i in range(start, len(stages)):
+        name, fn, params, _ = stages[i]
+        with profiler.stage(name, rows_in=None if trips_clean is None else len(trips_clean)) as step:
+            trips_clean, cleaning_log = fn(trips_clean, cleaning_log)
+            step.rows_out = len(trips_clean)
+            if use_checkpoints:
+                with profiler.stage("checkpoint_save", rows_in=len(trips_clean)):
+                    meta = {"rows": len(trips_clean), "params": params, "log": cleaning_log}
+                    store.save(name, keys[i], trips_clean, meta, stage_arrays.get(name))
 
     out_csv = OUTPUT_DIR / "trips_cleaned.csv"
-    trips_clean.to_csv(out_csv, index=False)
-    print(f"Wrote {trips_clean.shape[0]} rows to {out_csv}")
+    with profiler.stage("csv_write", rows_in=len(trips_clean)) as step:
+        trips_clean.to_csv(out_csv, index=False, date_format=TIMESTAMP_TEXT_FORMAT)
+        step.rows_out = len(trips_clean)
+    print(f"Wrote {trips_clean.shape[0]} rows to {out_csv} ({step.wall_s:.1f}s)")
 
     zones_out = standardize_columns(zones).rename(columns={"locationid": "location_id", "zone": "zone_name"})
     zones_out = zones_out[["location_id", "borough", "zone_name", "service_zone"]]
     zones_out.to_csv(OUTPUT_DIR / "taxi_zones.csv", index=False)
     print(f"Wrote taxi_zones to {OUTPUT_DIR / 'taxi_zones.csv'}")
 
-    write_cleaning_log(cleaning_log)
+    profiler.close()
+    cleaning_log["peak_memory_mb"] = peak_memory_mb()
+    if cleaning_log["peak_memory_mb"] is not None:
+        print(f"Peak memory (RSS): {cleaning_log['peak_memory_mb']:.1f} MB")
+    write_cleaning_log(cleaning_log, CLEANING_LOG_PATH, profiler=profiler)
     print(f"Wrote cleaning log to {CLEANING_LOG_PATH}")
+    if profile_path:
+        profiler.write_json(Path(profile_path))
+        print(f"Wrote stage profile to {profile_path}")
     return trips_clean, zones_out, cleaning_log
 
 
 if __name__ == "__main__":
-    sample = int(sys.argv[1]) if len(sys.argv) > 1 else None
-    run_pipeline(sample_rows=sample)
+    parser = argparse.ArgumentParser(description="Clean NYC taxi trips and write database/cleaned/*.csv")
+    parser.add_argument("sample_rows", nargs="?", type=int, help="only process a sample of this many rows")
+    parser.add_argument("--sample-method", choices=("random", "stratified"), default="random",
+                        help="uniform random rows, or rows proportional to each pickup day")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for sampling")
+    parser.add_argument("--epoch-timestamps", action="store_true",
+                        help="write pickup/dropoff as integer epoch seconds instead of text")
+    parser.add_argument("--dedup-store", metavar="DIR", nargs="?", const=str(FINGERPRINT_DIR),
+                        help="also drop trips already seen in other files processed with the same store "
+                             "(default dir: %(const)s)")
+    parser.add_argument("--profile-json", metavar="PATH", default=str(PROFILE_PATH),
+                        help="where to write the per-stage time/memory/row report (default: %(default)s)")
+    parser.add_argument("--deep-profile", choices=DEEP_MODES,
+                        help="also record per-function times (cprofile, saved next to the JSON as .prof) "
+                             "or per-stage Python heap peaks (tracemalloc); both slow the run down")
+    parser.add_argument("--no-checkpoints", action="store_true",
+                        help="run every stage from scratch and don't write stage checkpoints")
+    parser.add_argument("--list-checkpoints", action="store_true", help="list stored stage checkpoints and exit")
+    parser.add_argument("--clear-checkpoints", nargs="?", const="all", metavar="STAGE",
+                        help="delete stored checkpoints (all, or only one stage) and exit")
+    args = parser.parse_args()
+
+    if args.list_checkpoints or args.clear_checkpoints:
+        store = CheckpointStore()
+        if args.clear_checkpoints:
+            stage = None if args.clear_checkpoints == "all" else args.clear_checkpoints
+            print(f"Removed {store.clear(stage)} checkpoints from {store.root}")
+        else:
+            for e in store.entries():
+                print(f"{e['stage']:<10} {e['key']}  {e['rows']:>10} rows  {e['size_mb']:8.1f} MB")
+        sys.exit(0)
+
+    run_pipeline(sample_rows=args.sample_rows,
+                 timestamp_format="epoch" if args.epoch_timestamps else "text",
+                 use_checkpoints=not args.no_checkpoints,
+                 sample_method=args.sample_method, seed=args.seed, dedup_store=args.dedup_store,
+                 profile_path=args.profile_json, deep_profile=args.deep_profile)
@@ -0,0 +1,73 @@
+# Fingerprint-based duplicate detection.
+# The dedup key columns are normalized to int64 (epoch seconds, cents, ids) and
+# hashed row-wise into one uint64 per trip. Seen trips are kept as a sorted
+# uint64 array (8 bytes per trip), so duplicates can be found across chunks of
+# one run and, through FingerprintStore, across monthly files.
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+FINGERPRINT_DIR = Path(__file__).resolve().parent / ".fingerprints"
+
+
+def _key_values(col):
+    # int64 view of one key column that is stable across dtypes (datetime unit, float32/64, ids)
+    if pd.api.types.is_datetime64_any_dtype(col):
+        return col.to_numpy("datetime64[s]").view("int64")
+    if pd.api.types.is_float_dtype(col):
+        return np.round(np.nan_to_num(col.to_numpy("float64"), nan=-1.0) * 100).astype("int64")
+    if pd.api.types.is_integer_dtype(col):
+        return col.to_numpy("int64")
+    return pd.util.hash_array(col.astype(str).to_numpy()).view("int64")
+
+
+def trip_fingerprints(df, key_cols):
+    keys = pd.DataFrame({c: _key_values(df[c]) for c in key_cols}, copy=False)
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy("uint64")
+
+
+def _contains(sorted_fps, fps):
+    if not len(sorted_fps):
+        return np.zeros(len(fps), dtype=bool)
+    idx = np.searchsorted(sorted_fps, fps)
+    idx[idx == len(sorted_fps)] = 0
+    return sorted_fps[idx] == fps
+
+
+class FingerprintSet:
+    """Fingerprints seen in this run, checked together with `known` ones from earlier files."""
+
+    def __init__(self, known=None):
+        self.known = np.asarray(known if known is not None else [], dtype="uint64")
+        self.seen = np.empty(0, dtype="uint64")
+
+    def __len__(self):
+        return len(self.seen)
+
+    def mark_duplicates(self, fps):
+        """True for each fingerprint already seen (earlier in the batch, earlier batches, or `known`)."""
+        dup = pd.Series(fps).duplicated().to_numpy() | _contains(self.known, fps) | _contains(self.seen, fps)
+        fresh = np.unique(fps[~dup])
+        self.seen = np.union1d(self.seen, fresh) if len(self.seen) else fresh
+        return dup
+
+
+class FingerprintStore:
+    """One sorted .npy of fingerprints per source file; re-running a file replaces its own set."""
+
+    def __init__(self, root=FINGERPRINT_DIR):
+        self.root = Path(root)
+
+    def sources(self):
+        return sorted(p.stem for p in self.root.glob("*.npy"))
+
+    def known(self, exclude=None):
+        parts = [np.load(self.root / f"{s}.npy") for s in self.sources() if s != exclude]
+        return np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype="uint64")
+
+    def save(self, source, seen):
+        """Store a file's sorted fingerprints (FingerprintSet.seen)."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        np.save(self.root / f"{source}.npy", seen)
@@ -0,0 +1,154 @@
+# Per-stage cost accounting for run_pipeline.
+# StageProfiler.stage(name) wraps a stage or a sub-step of one and records wall
+# time, CPU time, growth of the process's peak RSS and rows in/out. Stages nest
+# ("clean/dedup"), so the report shows both the stage totals and where inside a
+# stage the time went. Two optional deep modes add detail at a higher cost:
+# "tracemalloc" records the peak Python heap of every stage, "cprofile" profiles
+# each top-level stage and keeps its most expensive functions.
+
+import cProfile
+import io
+import json
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows: no getrusage, peak memory is not reported
+    resource = None
+
+DEEP_MODES = ("cprofile", "tracemalloc")
+TOP_FUNCTIONS = 15   # functions kept per stage in cprofile mode
+
+
+def peak_memory_mb():
+    # peak resident set size of this process so far
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+class StageRecord:
+    def __init__(self, name, depth, rows_in):
+        self.name = name
+        self.depth = depth
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.wall_s = self.cpu_s = self.peak_rss_delta_mb = None
+        self.py_peak_mb = None      # tracemalloc mode
+        self.top_functions = None   # cprofile mode
+        self._py_peak = 0
+
+    def as_dict(self):
+        out = {"stage": self.name, "depth": self.depth, "wall_s": self.wall_s, "cpu_s": self.cpu_s,
+               "peak_rss_delta_mb": self.peak_rss_delta_mb, "rows_in": self.rows_in, "rows_out": self.rows_out}
+        if self.py_peak_mb is not None:
+            out["py_peak_mb"] = self.py_peak_mb
+        if self.top_functions is not None:
+            out["top_functions"] = self.top_functions
+        return out
+
+
+class StageProfiler:
+    def __init__(self, deep=None):
+        if deep not in (None,) + DEEP_MODES:
+            raise ValueError(f"deep profiling mode must be one of {DEEP_MODES}")
+        self.deep = deep
+        self.records = []      # in start order, so children follow their parent
+        self._stack = []
+        self._profiles = []    # cProfile.Profile per top-level stage
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        """Time the enclosed block; set .rows_out on the yielded record before it ends."""
+        parent = self._stack[-1] if self._stack else None
+        rec = StageRecord(f"{parent.name}/{name}" if parent else name, len(self._stack), rows_in)
+        self.records.append(rec)
+        self._stack.append(rec)
+
+        profile = None
+        if self.deep == "cprofile" and parent is None:
+            profile = cProfile.Profile()
+        if self.deep == "tracemalloc":
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            current, peak = tracemalloc.get_traced_memory()
+            if parent is not None:   # the parent's peak so far, before this stage resets it
+                parent._py_peak = max(parent._py_peak, peak)
+            tracemalloc.reset_peak()
+            py_start = current
+
+        rss_start = peak_memory_mb()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield rec
+        finally:
+            if profile is not None:
+                profile.disable()
+                self._profiles.append(profile)
+                rec.top_functions = _top_functions(profile)
+            rec.wall_s = round(time.perf_counter() - wall_start, 3)
+            rec.cpu_s = round(time.process_time() - cpu_start, 3)
+            rss_end = peak_memory_mb()
+            if rss_start is not None:
+                rec.peak_rss_delta_mb = round(rss_end - rss_start, 1)
+            if self.deep == "tracemalloc":
+                rec._py_peak = max(rec._py_peak, tracemalloc.get_traced_memory()[1])
+                rec.py_peak_mb = round((rec._py_peak - py_start) / 1024 ** 2, 1)
+                if parent is not None:
+                    parent._py_peak = max(parent._py_peak, rec._py_peak)
+            self._stack.pop()
+
+    def close(self):
+        if self.deep == "tracemalloc" and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def report(self):
+        return {"deep": self.deep, "peak_memory_mb": peak_memory_mb(),
+                "stages": [r.as_dict() for r in self.records]}
+
+    def write_json(self, path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.report(), indent=2), encoding="utf-8")
+        if self._profiles:   # all stages merged, for snakeviz / pstats
+            stats = pstats.Stats(self._profiles[0])
+            for profile in self._profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(path.with_suffix(".prof"))
+
+    def markdown(self):
+        """Rows of the "Stage profile" table in cleaning_log.md."""
+        deep_col = self.deep == "tracemalloc"
+        header = "| Stage | Wall (s) | CPU (s) | Peak RSS Δ (MB) | Rows in | Rows out |"
+        rule = "|---|---:|---:|---:|---:|---:|"
+        if deep_col:
+            header += " Python peak (MB) |"
+            rule += "---:|"
+        lines = [header, rule]
+        fmt = lambda v, spec="": "" if v is None else format(v, spec)
+        for r in self.records:
+            name = "&nbsp;&nbsp;" * r.depth + r.name.rsplit("/", 1)[-1]
+            line = (f"| {name} | {fmt(r.wall_s, '.3f')} | {fmt(r.cpu_s, '.3f')} | "
+                    f"{fmt(r.peak_rss_delta_mb, '.1f')} | {fmt(r.rows_in, ',')} | {fmt(r.rows_out, ',')} |")
+            if deep_col:
+                line += f" {fmt(r.py_peak_mb, '.1f')} |"
+            lines.append(line)
+        return lines
+
+
+def _top_functions(profile, n=TOP_FUNCTIONS):
+    stats = pstats.Stats(profile, stream=io.StringIO())
+    stats.sort_stats("cumulative")
+    out = []
+    for func in stats.fcn_list[:n]:
+        calls, _, tottime, cumtime, _ = stats.stats[func]
+        filename, line, fn = func
+        out.append({"function": f"{filename}:{line}({fn})", "calls": calls,
+                    "tottime_s": round(tottime, 3), "cumtime_s": round(cumtime, 3)})
+    return out
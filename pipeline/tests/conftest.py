@@ -0,0 +1,84 @@
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+PIPELINE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PIPELINE_DIR))
+
+import data_processing as dp
+from checkpoints import CheckpointStore
+
+ZONE_LOOKUP = PIPELINE_DIR.parent / "api" / "data" / "taxi_zone_lookup.csv"
+N_ROWS = 400
+
+
+def make_raw_trips(n=N_ROWS, seed=0):
+    """A raw TLC frame (file column names) with a few rows every cleaning rule drops."""
+    rng = np.random.default_rng(seed)
+    pickup = pd.Timestamp("2019-01-15") + pd.to_timedelta(rng.integers(0, 86400, n), unit="s")
+    dropoff = pickup + pd.to_timedelta(rng.integers(120, 3600, n), unit="s")
+    dist = rng.lognormal(0.7, 0.5, n).round(2)
+    fare = (2.5 + 2.5 * dist).round(2)
+    df = pd.DataFrame({
+        "VendorID": rng.integers(1, 3, n),
+        "tpep_pickup_datetime": pickup.strftime("%Y-%m-%d %H:%M:%S"),
+        "tpep_dropoff_datetime": dropoff.strftime("%Y-%m-%d %H:%M:%S"),
+        "passenger_count": rng.integers(1, 5, n).astype(float),
+        "trip_distance": dist,
+        "RatecodeID": 1,
+        "store_and_fwd_flag": "N",
+        "PULocationID": rng.integers(1, 264, n),
+        "DOLocationID": rng.integers(1, 264, n),
+        "payment_type": rng.integers(1, 3, n),
+        "fare_amount": fare,
+        "extra": 0.5,
+        "mta_tax": 0.5,
+        "tip_amount": 0.0,
+        "tolls_amount": 0,          # whole numbers: read back as an integer column
+        "improvement_surcharge": 0.3,
+        "total_amount": (fare + 1.3).round(2),
+        "congestion_surcharge": np.nan,
+    })
+    df.loc[1] = df.loc[0]                                   # exact duplicate
+    df.loc[2, "PULocationID"] = 999                         # not in the zone lookup
+    df.loc[3, "fare_amount"] = -4.0                         # negative fare
+    df.loc[4, "tpep_dropoff_datetime"] = df.loc[4, "tpep_pickup_datetime"]   # zero duration
+    df.loc[5, "tpep_pickup_datetime"] = "not a time"
+    return df
+
+
+@pytest.fixture
+def raw_trips():
+    return make_raw_trips()
+
+
+@pytest.fixture
+def zones():
+    return pd.read_csv(ZONE_LOOKUP)
+
+
+@pytest.fixture
+def pipeline_dirs(tmp_path, monkeypatch):
+    """data/ with one raw CSV and the zone lookup, plus output and checkpoint dirs, for run_pipeline."""
+    data = tmp_path / "data"
+    data.mkdir()
+    make_raw_trips().to_csv(data / "yellow_tripdata_2019-01.csv", index=False)
+    shutil.copy(ZONE_LOOKUP, data / "taxi_zone_lookup.csv")
+    monkeypatch.setattr(dp, "DATA_DIR", data)
+    monkeypatch.setattr(dp, "OUTPUT_DIR", tmp_path / "cleaned")
+    monkeypatch.setattr(dp, "CLEANING_LOG_PATH", tmp_path / "cleaning_log.md")
+    return {"data": data, "output": tmp_path / "cleaned", "store": CheckpointStore(tmp_path / "checkpoints")}
+
+
+@pytest.fixture
+def run(pipeline_dirs):
+    """run_pipeline on pipeline_dirs; returns (cleaned frame, log)."""
+    def run(**kw):
+        kw.setdefault("store", pipeline_dirs["store"])
+        trips, _, log = dp.run_pipeline(profile_path=None, **kw)
+        return trips, log
+    return run
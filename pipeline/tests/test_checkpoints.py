@@ -0,0 +1,72 @@
+import numpy as np
+
+import data_processing as dp
+from dedup import FingerprintStore
+
+
+def test_rerun_resumes_after_write(run, capsys):
+    first, _ = run()
+    capsys.readouterr()
+    again, _ = run()
+    assert "Resuming after 'write'" in capsys.readouterr().out
+    assert again.equals(first.reset_index(drop=True))
+
+
+def test_output_columns_change_invalidates_write(run, monkeypatch, capsys):
+    run()
+    capsys.readouterr()
+    monkeypatch.setattr(dp, "OUTPUT_COLUMNS", [c for c in dp.OUTPUT_COLUMNS if c != "is_peak_hour"])
+    trips, _ = run()
+    assert "Resuming after 'write'" not in capsys.readouterr().out
+    assert "is_peak_hour" not in trips.columns
+
+
+def test_constant_change_invalidates_clean(run, monkeypatch, capsys):
+    run()
+    capsys.readouterr()
+    monkeypatch.setattr(dp, "AMOUNT_COLS", [c for c in dp.AMOUNT_COLS if c != "extra"])
+    run()
+    assert "Resuming after 'load'" in capsys.readouterr().out
+
+
+def test_projection_and_pushdown_are_load_params(run, monkeypatch, capsys):
+    run()
+    monkeypatch.setattr(dp, "OUTPUT_COLUMNS", [c for c in dp.OUTPUT_COLUMNS if c != "tolls_amount"])
+    capsys.readouterr()
+    trips, _ = run()
+    assert "Resuming" not in capsys.readouterr().out   # the load checkpoint was read with the old projection
+    assert "tolls_amount" not in trips.columns
+    monkeypatch.setattr(dp, "READ_BOUNDS", dp.READ_BOUNDS[:1])
+    run()
+    assert "Resuming" not in capsys.readouterr().out
+
+
+def test_restored_clean_still_saves_fingerprints(run, tmp_path):
+    store = FingerprintStore(tmp_path / "fingerprints")
+    run(dedup_store=store.root)
+    [source] = store.sources()
+    saved = np.load(store.root / f"{source}.npy")
+    (store.root / f"{source}.npy").unlink()
+    run(dedup_store=store.root)   # every stage restored from checkpoints
+    assert (np.load(store.root / f"{source}.npy") == saved).all()
+    assert len(saved)
+
+
+def test_clear_removes_arrays(run, pipeline_dirs, tmp_path):
+    run(dedup_store=tmp_path / "fingerprints")
+    store = pipeline_dirs["store"]
+    assert list(store.root.glob("clean-*.fingerprints.npy"))
+    store.clear("clean")
+    assert not list(store.root.glob("clean-*"))
+
+
+def test_only_the_latest_checkpoint_per_stage_is_kept(run, pipeline_dirs, monkeypatch):
+    run()
+    store = pipeline_dirs["store"]
+    before = {e["stage"]: e["key"] for e in store.entries()}
+    monkeypatch.setattr(dp, "OUTPUT_COLUMNS", [c for c in dp.OUTPUT_COLUMNS if c != "is_peak_hour"])
+    run()
+    after = [(e["stage"], e["key"]) for e in store.entries()]
+    assert sorted(stage for stage, _ in after) == sorted(before)   # one entry per stage
+    assert dict(after)["write"] != before["write"]
+    assert len(list(store.root.glob("write-*"))) == 2   # .parquet and .json
@@ -0,0 +1,34 @@
+import csv
+
+import data_processing as dp
+
+
+def test_each_rule_drops_its_rows(raw_trips, zones):
+    df, log = dp.clean_trips(raw_trips, zones)
+    reasons = log["excluded_reasons"]
+    assert reasons["missing_required"] == 0
+    assert reasons["duplicates"] == 1
+    assert reasons["invalid_locations"] == 1
+    assert reasons["invalid_bounds"] == 3    # negative fare, zero duration, unparseable pickup
+    assert log["initial_count"] == len(raw_trips)
+    assert log["final_count"] == len(df) == len(raw_trips) - log["excluded_count"]
+    assert not {1, 2, 3, 4, 5} & set(df.index)
+
+
+def test_downcast_dtypes(raw_trips, zones):
+    df, _ = dp.clean_trips(raw_trips, zones)
+    assert df["pu_location_id"].dtype == "uint16"
+    assert df["vendor_id"].dtype == "int8"
+    assert df["fare_amount"].dtype == "float32"
+    assert df["tolls_amount"].dtype.kind == "i"   # whole numbers stay integers
+    assert df["store_and_fwd_flag"].dtype == "category"
+    assert df["tpep_pickup_datetime"].dtype.kind == "M"
+
+
+def test_csv_keeps_source_number_format(run, pipeline_dirs):
+    run(use_checkpoints=False)
+    with open(pipeline_dirs["output"] / "trips_cleaned.csv", newline="") as f:
+        row = next(csv.DictReader(f))
+    assert row["tolls_amount"] == "0"
+    assert row["extra"] == "0.5"
+    assert row["tpep_pickup_datetime"].count(":") == 2 and len(row["tpep_pickup_datetime"]) == 19
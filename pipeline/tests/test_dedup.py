@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+import data_processing as dp
+from dedup import FingerprintSet, FingerprintStore, trip_fingerprints
+
+KEYS = ["pickup", "fare", "pu"]
+
+
+def key_frame():
+    return pd.DataFrame({
+        "pickup": pd.to_datetime(["2019-01-15 08:00:00", "2019-01-15 08:05:00", "2019-01-15 08:00:00"]),
+        "fare": [12.5, 7.0, 12.5],
+        "pu": [43, 161, 43],
+    })
+
+
+def test_fingerprints_stable_across_dtypes():
+    df = key_frame()
+    narrow = df.astype({"fare": "float32", "pu": "uint16", "pickup": "datetime64[ms]"})
+    assert (trip_fingerprints(df, KEYS) == trip_fingerprints(narrow, KEYS)).all()
+    fps = trip_fingerprints(df, KEYS)
+    assert fps[0] == fps[2] and fps[0] != fps[1]
+
+
+def test_set_marks_within_and_across_batches_and_known():
+    fps = trip_fingerprints(key_frame(), KEYS)
+    seen = FingerprintSet()
+    assert seen.mark_duplicates(fps).tolist() == [False, False, True]
+    assert seen.mark_duplicates(fps[:1]).tolist() == [True]
+    assert len(seen) == 2
+    assert FingerprintSet(known=fps[1:2]).mark_duplicates(fps).tolist() == [False, True, True]
+
+
+def test_store_known_excludes_the_rerun_source(tmp_path):
+    store = FingerprintStore(tmp_path)
+    store.save("jan", np.array([1, 5], dtype="uint64"))
+    store.save("feb", np.array([3, 5], dtype="uint64"))
+    assert store.sources() == ["feb", "jan"]
+    assert store.known().tolist() == [1, 3, 5]
+    assert store.known(exclude="jan").tolist() == [3, 5]
+
+
+def test_second_file_drops_trips_seen_in_the_first(run, pipeline_dirs, raw_trips, tmp_path):
+    fp_dir = tmp_path / "fingerprints"
+    first, _ = run(use_checkpoints=False, dedup_store=fp_dir)
+    rerun, _ = run(use_checkpoints=False, dedup_store=fp_dir)    # same file: its own set is replaced, not matched
+    assert len(rerun) == len(first)
+
+    # the next month's file repeats ten of January's trips
+    repeat = raw_trips.iloc[10:20]
+    fresh = raw_trips.iloc[20:].assign(tpep_pickup_datetime=lambda d: d["tpep_pickup_datetime"].str.replace("2019-01", "2019-02"),
+                                       tpep_dropoff_datetime=lambda d: d["tpep_dropoff_datetime"].str.replace("2019-01", "2019-02"))
+    pd.concat([repeat, fresh]).to_csv(pipeline_dirs["data"] / "yellow_tripdata_2019-01.csv", index=False)
+    second, log = run(use_checkpoints=False, dedup_store=fp_dir)
+    assert log["excluded_reasons"]["duplicates"] == 10
+    assert not (second["tpep_pickup_datetime"] < "2019-02-01").any()
+    assert len(FingerprintStore(fp_dir).sources()) == 2
@@ -0,0 +1,31 @@
+import pytest
+
+import data_processing as dp
+
+
+@pytest.fixture
+def parquet_input(pipeline_dirs, raw_trips):
+    data = pipeline_dirs["data"]
+    (data / "yellow_tripdata_2019-01.csv").unlink()
+    raw = raw_trips.drop(index=5).assign(airport_fee=0.0)   # a column the pipeline does not output
+    raw.to_parquet(data / "yellow_tripdata_2019-01.parquet", index=False)
+    return raw
+
+
+def test_reads_only_projected_columns(parquet_input):
+    df, excluded = dp.load_trip_data()
+    assert list(df.columns) == [c for c in parquet_input.columns if c != "airport_fee"]
+    assert excluded == 1   # the negative fare fails the pushed-down bounds
+    assert len(df) == len(parquet_input) - 1
+
+
+def test_pushdown_off_keeps_every_row(parquet_input):
+    df, excluded = dp.load_trip_data(pushdown=False)
+    assert (len(df), excluded) == (len(parquet_input), 0)
+
+
+def test_sample_reads_sampled_rows(parquet_input):
+    df, excluded = dp.load_trip_data(sample_rows=50, seed=1)
+    assert len(df) + excluded == 50
+    stratified, _ = dp.load_trip_data(sample_rows=50, sample_method="stratified", seed=1)
+    assert len(stratified) <= 50
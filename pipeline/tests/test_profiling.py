@@ -0,0 +1,57 @@
+import json
+import pstats
+
+import pytest
+
+from profiling import StageProfiler
+
+
+def test_nested_stages_and_rows():
+    profiler = StageProfiler()
+    with profiler.stage("clean", rows_in=10) as clean:
+        with profiler.stage("dedup", rows_in=10) as step:
+            step.rows_out = 9
+        clean.rows_out = 8
+    report = profiler.report()
+    assert [(s["stage"], s["depth"], s["rows_in"], s["rows_out"]) for s in report["stages"]] == [
+        ("clean", 0, 10, 8), ("clean/dedup", 1, 10, 9)]
+    assert all(s["wall_s"] is not None and s["cpu_s"] is not None for s in report["stages"])
+    assert profiler.markdown()[3].startswith("| &nbsp;&nbsp;dedup |")
+
+
+def test_tracemalloc_attributes_the_peak_to_the_stage():
+    profiler = StageProfiler("tracemalloc")
+    with profiler.stage("outer"):
+        with profiler.stage("alloc"):
+            block = bytearray(8 * 1024 ** 2)
+            del block
+        with profiler.stage("small"):
+            pass
+    profiler.close()
+    peaks = {s["stage"]: s["py_peak_mb"] for s in profiler.report()["stages"]}
+    assert peaks["outer/alloc"] >= 8 and peaks["outer"] >= 8
+    assert peaks["outer/small"] < 1
+
+
+def test_cprofile_writes_merged_stats(tmp_path):
+    profiler = StageProfiler("cprofile")
+    for name in ("a", "b"):
+        with profiler.stage(name):
+            sorted(range(10_000), key=lambda x: -x)
+    profiler.write_json(tmp_path / "profile.json")
+    report = json.loads((tmp_path / "profile.json").read_text())
+    assert all(s["top_functions"] for s in report["stages"])
+    assert pstats.Stats(str(tmp_path / "profile.prof")).total_calls > 0
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        StageProfiler("perf")
+
+
+def test_pipeline_reports_every_stage(pipeline_dirs, tmp_path):
+    from data_processing import run_pipeline
+    run_pipeline(use_checkpoints=False, store=pipeline_dirs["store"], profile_path=tmp_path / "profile.json")
+    stages = {s["stage"]: s for s in json.loads((tmp_path / "profile.json").read_text())["stages"]}
+    assert {"load", "clean", "clean/dedup", "normalize", "derive", "write"} <= stages.keys()
+    assert stages["clean"]["rows_in"] == 400 and stages["clean"]["rows_out"] < 400
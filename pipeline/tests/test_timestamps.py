@@ -0,0 +1,51 @@
+import importlib.util
+import sqlite3
+
+import pandas as pd
+
+import data_processing as dp
+from conftest import PIPELINE_DIR
+
+
+def load_insert_data():
+    spec = importlib.util.spec_from_file_location("insert_data", PIPELINE_DIR.parent / "database" / "insert_data.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_parsed_once_and_kept_native(raw_trips, zones):
+    df, _ = dp.clean_trips(raw_trips, zones)
+    assert df["tpep_pickup_datetime"].dtype.kind == "M"
+    assert dp.normalize_timestamps(df)["tpep_pickup_datetime"].equals(df["tpep_pickup_datetime"])
+
+
+def test_epoch_output_matches_text(run, pipeline_dirs):
+    text, _ = run(use_checkpoints=False)
+    text_csv = pd.read_csv(pipeline_dirs["output"] / "trips_cleaned.csv")
+    epoch, _ = run(use_checkpoints=False, timestamp_format="epoch")
+    epoch_csv = pd.read_csv(pipeline_dirs["output"] / "trips_cleaned.csv")
+    assert epoch_csv["tpep_pickup_datetime"].dtype == "int64"
+    parsed = pd.to_datetime(text_csv["tpep_pickup_datetime"]).astype("datetime64[s]").astype("int64")
+    assert (parsed == epoch_csv["tpep_pickup_datetime"]).all()
+    assert text_csv.drop(columns=dp.TIMESTAMP_COLS).equals(epoch_csv.drop(columns=dp.TIMESTAMP_COLS))
+
+
+def test_epoch_output_loads_compact_db_as_integers(run, pipeline_dirs, monkeypatch, tmp_path):
+    run(use_checkpoints=False, timestamp_format="epoch")
+    epoch_csv = pd.read_csv(pipeline_dirs["output"] / "trips_cleaned.csv")
+    insert_data = load_insert_data()
+    monkeypatch.setattr(insert_data, "CLEANED_DIR", pipeline_dirs["output"])
+    conn = sqlite3.connect(tmp_path / "mobility.db")
+    try:
+        insert_data.run_schema(conn, insert_data.COMPACT_SCHEMA_PATH)
+        insert_data.load_trips(conn)
+        assert conn.execute("SELECT DISTINCT typeof(pickup_ts), typeof(dropoff_ts) FROM trips_compact").fetchall() == [
+            ("integer", "integer")]
+        stored = [r[0] for r in conn.execute("SELECT pickup_ts FROM trips ORDER BY trip_id")]
+        assert stored == epoch_csv["tpep_pickup_datetime"].tolist()
+        plan = " ".join(r[3] for r in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT COUNT(*) FROM trips WHERE pickup_ts >= ? AND pickup_ts < ?", (0, 1)))
+        assert "idx_trips_pickup_datetime" in plan
+    finally:
+        conn.close()
@@ -1,34 +1,85 @@
 #!/usr/bin/env python3
 """
-Simple static file server for the frontend.
+Static file server for the frontend.
 Run from the repo root:
     python serve.py
 Then open: http://localhost:8080
+
+Each connection gets its own thread, so a slow client no longer blocks the
+others, and connections are kept alive (HTTP/1.1). The files are read and
+gzip-compressed once at startup and sent with ETag and Cache-Control headers
+(see api/utils/static_assets.py).
+
+To serve the dashboard and the API on one port instead, start the API with
+SERVE_FRONTEND=1 (cd api && SERVE_FRONTEND=1 python3 app.py) and open
+http://localhost:5002.
 """
+import argparse
 import http.server
-import socketserver
 import os
+import sys
 import threading
 import webbrowser
+from urllib.parse import parse_qs, unquote, urlsplit
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, "api"))
+from utils.static_assets import AssetCache
 
 PORT = 8080
-FRONTEND_DIR = os.path.join(os.path.dirname(__file__), "frontend")
+API_URL = "http://localhost:5002"
+FRONTEND_DIR = os.path.join(ROOT, "frontend")
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive: every response carries a Content-Length
+    assets = None                   # AssetCache, set before serving
 
-class Handler(http.server.SimpleHTTPRequestHandler):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, directory=FRONTEND_DIR, **kwargs)
+    def do_GET(self):
+        self._send(head=False)
+
+    def do_HEAD(self):
+        self._send(head=True)
+
+    def _send(self, head):
+        url = urlsplit(self.path)
+        asset = self.assets.get(unquote(url.path).lstrip("/"))
+        if asset is None:
+            self.send_error(404)
+            return
+        status, headers, body = asset.respond(self.headers.get("Accept-Encoding", ""),
+                                              self.headers.get("If-None-Match", ""),
+                                              parse_qs(url.query).get("v", [None])[0])
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if status == 200 and not head:
+            try:
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):   # client went away mid-response
+                self.close_connection = True
 
     def log_message(self, format, *args):
         # Suppress noisy access logs; only print errors
-        if int(args[1]) >= 400:
+        if len(args) > 1 and str(args[1]).isdigit() and int(args[1]) >= 400:
             super().log_message(format, *args)
 
 if __name__ == "__main__":
-    with socketserver.TCPServer(("", PORT), Handler) as httpd:
-        url = f"http://localhost:{PORT}"
-        print(f"\n  Frontend  →  {url}")
-        print(f"  API       →  http://localhost:5002  (start separately with: cd api && python3 app.py)\n")
-        threading.Timer(0.8, lambda: webbrowser.open(url)).start()
+    parser = argparse.ArgumentParser(description="Serve the dashboard frontend.")
+    parser.add_argument("--port", type=int, default=PORT, help="port to listen on (default: %(default)s)")
+    parser.add_argument("--api", default=API_URL, help="API origin the dashboard calls (default: %(default)s)")
+    parser.add_argument("--no-browser", action="store_true", help="don't open a browser tab")
+    args = parser.parse_args()
+
+    Handler.assets = AssetCache(FRONTEND_DIR, api_base=args.api)
+    raw, sent = Handler.assets.sizes
+    with http.server.ThreadingHTTPServer(("", args.port), Handler) as httpd:
+        url = f"http://localhost:{args.port}"
+        print(f"\n  Frontend  →  {url}  ({len(Handler.assets.assets)} files, "
+              f"{raw / 1024:.0f} KB, {sent / 1024:.0f} KB gzipped)")
+        print(f"  API       →  {args.api}  (start separately with: cd api && python3 app.py)\n")
+        if not args.no_browser:
+            threading.Timer(0.8, lambda: webbrowser.open(url)).start()
         try:
             httpd.serve_forever()
         except KeyboardInterrupt: